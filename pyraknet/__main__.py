@@ -8,28 +8,53 @@ import threading
 import traceback
 
 import pyraknet.server
+from pyraknet.instrumentation import Instrumentation, SamplingProfiler
 from pyraknet.messages import Address
 
 logging.basicConfig(format="%(levelname).1s:%(message)s", level=logging.DEBUG)
 
 class Server(pyraknet.server.Server):
 	def __init__(self, address: Address, max_connections: int, incoming_password: bytes):
-		super().__init__(address, max_connections, incoming_password, None)
+		self._loop = asyncio.get_event_loop()
+		self.instrumentation = Instrumentation()
+		self.profiler = SamplingProfiler()
+		self._profiling = False
+		super().__init__(address, max_connections, incoming_password, None, instrumentation=self.instrumentation)
 		print("Enter packet directory path to send packets in directory")
+		print("Enter stats to show packet and loop stats, profile to start or stop the sampling profiler")
 		command_line = threading.Thread(target=self.input_loop, daemon=True) # I'd like to do this with asyncio but I can't figure out how
 		command_line.start()
 
 	def input_loop(self) -> None:
 		while True:
 			try:
-				path = "./packets/"+input()
+				command = input()
+				if command == "stats":
+					# the stats are updated on the loop thread, read them there too
+					self._loop.call_soon_threadsafe(lambda: print(self.instrumentation.report()))
+					continue
+				if command == "profile":
+					self.toggle_profiler()
+					continue
+				path = "./packets/"+command
 				for file in os.listdir(path):
 					with open(path+"/"+file, "rb") as content:
 						print("sending", file)
-						self.send(content.read(), broadcast=True)
+						self.broadcast_threadsafe(None, content.read())
 			except OSError:
 				traceback.print_exc()
 
+	def toggle_profiler(self) -> None:
+		if not self._profiling:
+			self.profiler.samples.clear()
+			self.profiler.start()
+			print("Profiling, enter profile again to stop")
+		else:
+			self.profiler.stop()
+			for function, samples in self.profiler.top():
+				print("%6i %s" % (samples, function))
+		self._profiling = not self._profiling
+
 if __name__ == "__main__":
 	print("Enter server port")
 	port = int(input())
@@ -0,0 +1,27 @@
+"""
+Benchmarks for pyraknet.
+Each module can be run on its own with python -m pyraknet.benchmarks.<module> and has a run function that returns its results.
+Results are flat mappings from a metric name to a number, the unit is part of the name.
+To run the whole suite, store the results as JSON and compare them against a baseline, use python -m pyraknet.benchmarks, see __main__.
+"""
+import asyncio
+import timeit
+from typing import Any, Callable, Dict
+
+Results = Dict[str, float]
+
+def new_event_loop() -> asyncio.AbstractEventLoop:
+	"""Create a fresh event loop and make it the current one, so that benchmarks don't share state."""
+	loop = asyncio.new_event_loop()
+	asyncio.set_event_loop(loop)
+	return loop
+
+def time_per_call(function: Callable[[], Any], repeat: int=3) -> float:
+	"""Return the time in seconds a call of function takes, the best of repeat batches of calls that take at least 0.2 seconds each."""
+	timer = timeit.Timer(function)
+	number, _ = timer.autorange()
+	return min(timer.repeat(repeat, number)) / number
+
+def print_results(results: Results) -> None:
+	for name, value in results.items():
+		print("%-48s %14.3f" % (name, value))
@@ -0,0 +1,93 @@
+"""
+Runs benchmark modules with their default settings, prints the results, and optionally stores them as JSON or compares them against stored results.
+
+	python -m pyraknet.benchmarks --output baseline.json
+	(change something)
+	python -m pyraknet.benchmarks --compare baseline.json
+
+Metrics are better when higher if their name ends with per_s or speedup or is delivered, and when lower otherwise.
+When comparing, metrics that got worse by more than the threshold are reported as regressions and the exit status is 1.
+Timing results vary between runs by a few percent, compare runs on the same machine and with the same Python version.
+"""
+import argparse
+import importlib
+import json
+import platform
+import sys
+import time
+from typing import Dict, List
+
+from . import print_results, Results
+
+MODULES = "hotpaths", "server", "broadcast", "serialization", "packets", "snapshot", "memory", "loopback", "reliability", "congestion", "mtu", "stream", "flood", "fairness", "offload", "handoff", "tcp_framing", "tcp_compression"
+HIGHER_IS_BETTER = "per_s", "speedup", "delivered"
+
+def run(modules: List[str]) -> Dict[str, Results]:
+	results = {}
+	for name in modules:
+		print("running", name, file=sys.stderr)
+		module = importlib.import_module("." + name, __package__)
+		results[name] = module.run()
+	return results
+
+def higher_is_better(metric: str) -> bool:
+	return metric.endswith(HIGHER_IS_BETTER)
+
+def compare(results: Dict[str, Results], baseline: Dict[str, Results], threshold: float) -> List[str]:
+	"""Print the change of every metric that's in both results and baseline, and return the regressed ones."""
+	regressions = []
+	print("%-64s %14s %14s %9s" % ("metric", "baseline", "current", "change"))
+	for module, module_results in results.items():
+		for metric, value in module_results.items():
+			old = baseline.get(module, {}).get(metric)
+			if old is None:
+				continue
+			name = "%s.%s" % (module, metric)
+			if old == 0:
+				change = 0.0 if value == 0 else float("inf")
+			else:
+				change = (value - old) / abs(old) * 100
+			worse = -change if higher_is_better(metric) else change
+			marker = ""
+			if worse > threshold:
+				marker = " REGRESSION"
+				regressions.append(name)
+			elif worse < -threshold:
+				marker = " improved"
+			print("%-64s %14.3f %14.3f %+8.1f%%%s" % (name, old, value, change, marker))
+	return regressions
+
+def main() -> int:
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument("modules", nargs="*", default=MODULES, help="benchmark modules to run, all by default: %s" % ", ".join(MODULES))
+	parser.add_argument("--output", help="store the results in this JSON file")
+	parser.add_argument("--compare", metavar="BASELINE", help="compare the results against this JSON file, as stored by --output")
+	parser.add_argument("--threshold", type=float, default=10, help="percentage by which a metric has to get worse to count as a regression (default 10)")
+	args = parser.parse_args()
+
+	results = run(args.modules)
+	for module, module_results in results.items():
+		print_results({"%s.%s" % (module, metric): value for metric, value in module_results.items()})
+
+	if args.output is not None:
+		with open(args.output, "w") as file:
+			json.dump({
+				"time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+				"python": platform.python_version(),
+				"platform": platform.platform(),
+				"results": results,
+			}, file, indent="\t")
+
+	if args.compare is not None:
+		with open(args.compare) as file:
+			baseline = json.load(file)
+		print()
+		print("compared to the results from %s (Python %s, %s)" % (baseline["time"], baseline["python"], baseline["platform"]))
+		regressions = compare(results, baseline["results"], args.threshold)
+		if regressions:
+			print("%i regressions: %s" % (len(regressions), ", ".join(regressions)))
+			return 1
+	return 0
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Compares sending to a group of connections with broadcast groups (groups.BroadcastGroups) against Connection.broadcast with an exclude set of everyone outside the group.
+The connections don't send anything, so this measures the fan-out itself.
+"""
+import argparse
+import time
+from typing import List
+
+from event_dispatcher import EventDispatcher
+
+from ..groups import BroadcastGroups
+from ..messages import Address
+from ..transports.abc import Connection, Reliability
+from . import print_results, Results
+
+class _NullConnection(Connection):
+	__slots__ = "sent",
+
+	def __init__(self, dispatcher: EventDispatcher):
+		super().__init__(dispatcher)
+		self.sent = 0
+
+	def get_address(self) -> Address:
+		return "0.0.0.0", 0
+
+	def _send(self, data: bytes, reliability: Reliability) -> None:
+		self.sent += 1
+
+def run(groups: int=100, members: int=50, rounds: int=5) -> Results:
+	dispatcher = EventDispatcher()
+	broadcast_groups = BroadcastGroups(dispatcher)
+	conns: List[_NullConnection] = []
+	for group in range(groups):
+		broadcast_groups.create(group)
+		for _ in range(members):
+			conn = _NullConnection(dispatcher)
+			conns.append(conn)
+			broadcast_groups.join(group, conn)
+	data = b"\x53" + bytes(100)
+	results = {}
+
+	start = time.perf_counter()
+	for _ in range(rounds):
+		for group in range(groups):
+			broadcast_groups.broadcast(group, data)
+	elapsed = time.perf_counter() - start
+	results["groups.us_per_broadcast"] = elapsed / (rounds * groups) * 1000000
+	sent = sum(conn.sent for conn in conns)
+
+	# what game code has to do without groups: broadcast to everyone, excluding the connections outside the group
+	all_conns = set(conns)
+	excludes = [all_conns - broadcast_groups.members(group) for group in range(groups)]
+	start = time.perf_counter()
+	for _ in range(rounds):
+		for group in range(groups):
+			conns[0].broadcast(data, Reliability.ReliableOrdered, excludes[group])
+	elapsed = time.perf_counter() - start
+	results["exclude.us_per_broadcast"] = elapsed / (rounds * groups) * 1000000
+	assert sum(conn.sent for conn in conns) == 2 * sent
+	results["speedup"] = results["exclude.us_per_broadcast"] / results["groups.us_per_broadcast"]
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--groups", type=int, default=100)
+	parser.add_argument("--members", type=int, default=50, help="connections per group")
+	parser.add_argument("--rounds", type=int, default=5, help="broadcasts per group")
+	args = parser.parse_args()
+	print_results(run(args.groups, args.members, args.rounds))
@@ -0,0 +1,121 @@
+"""
+Compares the congestion controllers from transports.raknet.calcs on a simulated bottleneck link with latency and random loss.
+The simulation runs on a VirtualClock and doesn't involve sockets or the event loop, so it runs in a fraction of a second per scenario and is reproducible for a given seed.
+The sender always has data to send, like during a large world load. Lost packets aren't retransmitted, goodput counts the packets that arrived.
+"""
+import argparse
+import random
+from typing import Callable, Dict, List, Tuple
+
+from ..transports.raknet.calcs import CongestionControl, DelayCongestionControl, RenoCongestionControl
+from ..transports.raknet.clock import Clock, VirtualClock
+from . import print_results, Results
+
+CONTROLLERS: Dict[str, Callable[[Clock], CongestionControl]] = {
+	"reno": RenoCongestionControl,
+	"delay": DelayCongestionControl,
+}
+
+SCENARIOS = {
+	# name: (one way delay in s, loss rate)
+	"lan": (0.005, 0),
+	"wan": (0.05, 0),
+	"wifi": (0.02, 0.02),
+	"lossy_wan": (0.08, 0.05),
+}
+
+ACK_INTERVAL = 0.03  # matches RaknetConnection
+
+def simulate(controller_factory: Callable[[Clock], CongestionControl], delay: float, loss: float, bandwidth: float=1000, queue_limit: int=100, duration: float=20, seed: int=0) -> Tuple[float, float]:
+	"""Return the goodput in packets per second and the mean round trip time in seconds."""
+	rand = random.Random(seed)
+	clock = VirtualClock()
+	controller = controller_factory(clock)
+
+	next_number = 0
+	packets_sent = 0
+	next_send_time = 0.0
+	send_pending = False
+	link_free = 0.0
+	queued: List[float] = []  # departure times of the packets in the bottleneck queue
+	outstanding: Dict[int, float] = {}
+	received: List[int] = []
+	last_send_time = 0.0
+	ack_pending = False
+	delivered = 0
+	rtt_sum = 0.0
+	rtt_count = 0
+
+	def try_send() -> None:
+		nonlocal next_number, packets_sent, next_send_time, send_pending, link_free
+		now = clock.time()
+		send_pending = False
+		interval = controller.send_interval()
+		while packets_sent < controller.cwnd():
+			if interval > 0 and next_send_time > now:
+				if not send_pending:
+					send_pending = True
+					clock.call_later(next_send_time - now, try_send)
+				return
+			number = next_number
+			next_number += 1
+			packets_sent += 1
+			next_send_time = max(now, next_send_time) + interval
+			outstanding[number] = now
+			while queued and queued[0] <= now:
+				del queued[0]
+			if len(queued) >= queue_limit:
+				continue  # tail drop
+			link_free = max(now, link_free) + 1 / bandwidth
+			queued.append(link_free)
+			if rand.random() >= loss:
+				clock.call_later(link_free + delay - now, arrive, number, now)
+
+	def arrive(number: int, sent_time: float) -> None:
+		nonlocal last_send_time, ack_pending, delivered
+		received.append(number)
+		last_send_time = sent_time
+		delivered += 1
+		if not ack_pending:
+			ack_pending = True
+			clock.call_later(ACK_INTERVAL, flush_acks)
+
+	def flush_acks() -> None:
+		nonlocal received, ack_pending
+		ack_pending = False
+		clock.call_later(delay, ack, sorted(received), last_send_time)
+		received = []
+
+	def ack(acks: List[int], echoed_time: float) -> None:
+		nonlocal packets_sent, rtt_sum, rtt_count
+		rtt = clock.time() - echoed_time
+		rtt_sum += rtt
+		rtt_count += 1
+		controller.on_rtt(rtt)
+		ack_set = set(acks)
+		holes = sum(1 for number in range(acks[0], acks[-1]) if number not in ack_set and number in outstanding)
+		for number in acks:
+			outstanding.pop(number, None)
+		controller.on_ack(packets_sent, len(acks), holes)
+		packets_sent = 0
+		try_send()
+
+	try_send()
+	clock.advance(duration)
+	return delivered / duration, rtt_sum / max(rtt_count, 1)
+
+def run(duration: float=20, seed: int=0) -> Results:
+	results = {}
+	for scenario, (delay, loss) in SCENARIOS.items():
+		for name, controller in CONTROLLERS.items():
+			goodput, rtt = simulate(controller, delay, loss, duration=duration, seed=seed)
+			results["%s.%s.goodput_packets_per_s" % (scenario, name)] = goodput
+			results["%s.%s.mean_rtt_ms" % (scenario, name)] = rtt * 1000
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--duration", type=float, default=20, help="simulated seconds per scenario")
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+	print_results(run(args.duration, args.seed))
@@ -0,0 +1,118 @@
+"""
+Measures how long quiet clients wait while a heavy client's burst is being handled, with messages dispatched in arrival order and with an InboundScheduler.
+The heavy client sends datagrams packed with small messages, and the datagrams of the light clients (one message each) arrive in between. Every message costs the listener some CPU time.
+The event loop is modelled like asyncio's: every iteration reads one datagram and then runs the callbacks that were scheduled to run soon, like the scheduler's.
+Reports the latency of the light clients' messages from the start of the burst, the longest loop iteration (for as long as an iteration runs, timers like the ones sending acks are delayed) and the total time.
+"""
+import argparse
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+from event_dispatcher import EventDispatcher
+
+from ..transports.abc import ConnectionEvent, Reliability
+from ..transports.raknet.clock import VirtualClock
+from ..transports.raknet.connection import RaknetConnection
+from ..transports.raknet.scheduler import InboundScheduler
+from . import print_results, Results
+
+class _SoonHandle:
+	def cancel(self) -> None:
+		pass
+
+class _LoopModel(VirtualClock):
+	"""Callbacks without a delay run in the next iteration instead of right away, timers with a delay never run, since the model doesn't advance the time."""
+
+	def __init__(self) -> None:
+		super().__init__()
+		self._soon: List[Tuple[Callable[..., None], Tuple[Any, ...]]] = []
+
+	def call_later(self, delay: float, callback: Callable[..., None], *args: Any) -> Any:
+		if delay > 0:
+			return super().call_later(delay, callback, *args)
+		self._soon.append((callback, args))
+		return _SoonHandle()
+
+	def iteration(self) -> bool:
+		"""Run the callbacks that were scheduled before this iteration. Return whether there were any."""
+		soon, self._soon = self._soon, []
+		for callback, args in soon:
+			callback(*args)
+		return bool(soon)
+
+class _CapturingTransport:
+	def __init__(self) -> None:
+		self.sent: List[bytes] = []
+
+	def sendto(self, data: bytes, address: Any=None) -> None:
+		self.sent.append(data)
+
+def _datagrams(count: int, messages_per_datagram: int) -> List[bytes]:
+	"""Return count datagrams with messages_per_datagram small Reliable UserPackets each, as a client would send them."""
+	transport = _CapturingTransport()
+	sender = RaknetConnection(transport, EventDispatcher(), ("10.0.0.1", 1001), clock=VirtualClock())
+	sender._packets_sent = -count * messages_per_datagram
+	for _ in range(count):
+		sender.send_many([b"\x53" + bytes(20)] * messages_per_datagram, Reliability.Reliable)
+	assert len(transport.sent) == count, "the messages don't fit into one datagram"
+	return transport.sent
+
+def measure(scheduler: Optional[InboundScheduler], clock: _LoopModel, heavy_datagrams: int, messages_per_datagram: int, light_clients: int, work: int) -> Results:
+	dispatcher = EventDispatcher()
+	light_latencies: List[float] = []
+	received = [0]
+
+	def on_receive(data: bytes, conn: RaknetConnection) -> None:
+		sum(range(work))  # the game's handler
+		received[0] += 1
+		if conn is not heavy:
+			light_latencies.append(time.perf_counter() - start)
+	dispatcher.add_listener(ConnectionEvent.Receive, on_receive)
+	transport = _CapturingTransport()
+	conns = [RaknetConnection(transport, dispatcher, ("10.0.%i.%i" % (i // 256, i % 256), 1001), inbound_scheduler=scheduler, clock=clock) for i in range(light_clients + 1)]
+	heavy = conns[0]
+	heavy_in = _datagrams(heavy_datagrams, messages_per_datagram)
+	light_in = _datagrams(1, 1)[0]
+	# the socket buffer: the light clients' datagrams arrive evenly spread over the burst
+	socket = [(heavy, datagram) for datagram in heavy_in]
+	for i, conn in enumerate(conns[1:]):
+		socket.insert((i + 1) * len(socket) // (light_clients + 1), (conn, light_in))
+	max_iteration = 0.0
+	start = time.perf_counter()
+	for conn, datagram in socket:
+		iteration_start = time.perf_counter()
+		conn.handle_datagram(datagram)
+		clock.iteration()
+		max_iteration = max(max_iteration, time.perf_counter() - iteration_start)
+	while True:
+		iteration_start = time.perf_counter()
+		if not clock.iteration():
+			break
+		max_iteration = max(max_iteration, time.perf_counter() - iteration_start)
+	total = time.perf_counter() - start
+	assert len(light_latencies) == light_clients and received[0] == heavy_datagrams * messages_per_datagram + light_clients
+	light_latencies.sort()
+	return {
+		"light_latency_ms_p50": light_latencies[len(light_latencies) // 2] * 1000,
+		"light_latency_ms_max": light_latencies[-1] * 1000,
+		"max_iteration_ms": max_iteration * 1000,
+		"total_ms": total * 1000,
+	}
+
+def run(heavy_datagrams: int=200, messages_per_datagram: int=40, light_clients: int=50, work: int=2000) -> Results:
+	results = {}
+	clock = _LoopModel()
+	# no depth limit, so that none of the heavy client's datagrams are dropped and both runs do the same work
+	for name, scheduler in (("arrival_order", None), ("scheduled", InboundScheduler(max_depth=heavy_datagrams * messages_per_datagram, clock=clock))):
+		for metric, value in measure(scheduler, clock, heavy_datagrams, messages_per_datagram, light_clients, work).items():
+			results["%s.%s" % (name, metric)] = value
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--heavy-datagrams", type=int, default=200, help="datagrams in the heavy client's burst")
+	parser.add_argument("--messages-per-datagram", type=int, default=40, help="messages in each of the heavy client's datagrams")
+	parser.add_argument("--light-clients", type=int, default=50, help="clients sending one message each during the burst")
+	parser.add_argument("--work", type=int, default=2000, help="CPU work of the listener per message")
+	args = parser.parse_args()
+	print_results(run(args.heavy_datagrams, args.messages_per_datagram, args.light_clients, args.work))
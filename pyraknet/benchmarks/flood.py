@@ -0,0 +1,91 @@
+"""
+Measures how much one flooding client slows down the handling of everyone else's traffic, with and without inbound limits.
+Well-behaved clients send a steady rate of Reliable UserPackets, and in the flood runs one more client sends flood times as many. The legit throughput is the number of packets of the well-behaved clients handled per second of CPU time spent on all datagrams, which shows how much of the server's time the flooder takes.
+With limits, the flooder still gets the traffic the limits allow handled (twice a well-behaved client's rate), everything beyond that is rejected before it's parsed.
+Runs in virtual time, so the token buckets refill as they would in real time, independently of the machine's speed.
+"""
+import argparse
+import time
+from typing import Any, List, Optional
+
+from event_dispatcher import EventDispatcher
+
+from ..messages import Message
+from ..transports.abc import ConnectionEvent, Reliability
+from ..transports.raknet.clock import VirtualClock
+from ..transports.raknet.connection import RaknetConnection
+from ..transports.raknet.limits import InboundLimits
+from . import print_results, Results
+
+TICK = 0.01
+
+class _CapturingTransport:
+	def __init__(self) -> None:
+		self.sent: List[bytes] = []
+
+	def sendto(self, data: bytes, address: Any=None) -> None:
+		self.sent.append(data)
+
+class _NullTransport:
+	def sendto(self, data: bytes, address: Any=None) -> None:
+		pass
+
+def _datagrams(count: int, size: int) -> List[bytes]:
+	"""Return count datagrams with one Reliable UserPacket each, as a client would send them."""
+	transport = _CapturingTransport()
+	sender = RaknetConnection(transport, EventDispatcher(), ("10.0.0.1", 1001), clock=VirtualClock())
+	sender._packets_sent = -count  # don't wait for the congestion window
+	for i in range(count):
+		sender.send(bytes((Message.UserPacket.value, i % 256)) + bytes(size - 2), Reliability.Reliable)
+	return transport.sent
+
+def measure(clients: int, rate: int, seconds: float, flood: int, limits: Optional[InboundLimits], size: int) -> float:
+	"""Return the well-behaved clients' packets handled per CPU second."""
+	clock = VirtualClock()
+	dispatcher = EventDispatcher()
+	received = [0]
+
+	def on_receive(data: bytes, conn: RaknetConnection) -> None:
+		if conn is not flooder:
+			received[0] += 1
+	dispatcher.add_listener(ConnectionEvent.Receive, on_receive)
+	transport = _NullTransport()
+	conns = [RaknetConnection(transport, dispatcher, ("10.0.%i.%i" % (i // 256, i % 256), 1001), inbound_limits=limits, clock=clock) for i in range(clients + 1)]
+	flooder = conns[-1]
+	ticks = int(seconds / TICK)
+	per_tick = max(1, int(rate * TICK))
+	legit = _datagrams(per_tick * ticks, size)
+	flood_datagrams = _datagrams(per_tick * ticks * flood, size) if flood else []
+	cpu = 0.0
+	for tick in range(ticks):
+		start = time.perf_counter()
+		for conn in conns[:-1]:
+			for datagram in legit[tick*per_tick:(tick+1)*per_tick]:
+				conn.handle_datagram(datagram)
+		for datagram in flood_datagrams[tick*per_tick*flood:(tick+1)*per_tick*flood]:
+			flooder.handle_datagram(datagram)
+		cpu += time.perf_counter() - start
+		clock.advance(TICK)
+	assert received[0] == clients * per_tick * ticks
+	return received[0] / cpu
+
+def run(clients: int=20, rate: int=200, seconds: float=1, flood: int=50, size: int=100) -> Results:
+	# generous for the well-behaved clients, which send rate packets per second
+	limits = InboundLimits(datagrams_per_second=rate * 2, bytes_per_second=rate * 2 * (size + 20), messages_per_second={Message.UserPacket: rate * 2})
+	results = {
+		"no_flood.legit_per_s": measure(clients, rate, seconds, 0, None, size),
+		"flood.legit_per_s": measure(clients, rate, seconds, flood, None, size),
+		"flood_limited.legit_per_s": measure(clients, rate, seconds, flood, limits, size),
+	}
+	results["flood_limited.datagrams_limited"] = limits.datagrams_limited
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--clients", type=int, default=20, help="number of well-behaved clients")
+	parser.add_argument("--rate", type=int, default=200, help="packets per second of each well-behaved client")
+	parser.add_argument("--seconds", type=float, default=1, help="virtual duration")
+	parser.add_argument("--flood", type=int, default=50, help="how many times more packets the flooding client sends")
+	parser.add_argument("--size", type=int, default=100, help="packet size in bytes")
+	args = parser.parse_args()
+	print_results(run(args.clients, args.rate, args.seconds, args.flood, args.size))
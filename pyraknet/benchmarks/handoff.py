@@ -0,0 +1,100 @@
+"""
+Compares handing packets from worker threads to the event loop one at a time (call_soon_threadsafe(conn.send, ...) per packet) and in batches with a ThreadsafeSendQueue.
+Every worker thread sends bursts of packets to its own RaknetConnection, like game logic producing a tick's updates. The connections write to a transport that only collects the datagrams.
+Reports the time a worker spends per packet handed off, the total time until every packet has been sent, the number of callbacks the loop ran for it and the number of datagrams.
+"""
+import argparse
+import asyncio
+import threading
+import time
+from typing import Any, Callable, List
+
+from event_dispatcher import EventDispatcher
+
+from ..groups import BroadcastGroups
+from ..outbound import ThreadsafeSendQueue
+from ..transports.abc import ConnectionEvent, Reliability
+from ..transports.raknet.clock import VirtualClock
+from ..transports.raknet.connection import RaknetConnection
+from . import new_event_loop, print_results, Results
+
+class _CapturingTransport:
+	def __init__(self) -> None:
+		self.sent = 0
+
+	def sendto(self, data: bytes, address: Any=None) -> None:
+		self.sent += 1
+
+def measure(batched: bool, threads: int, bursts: int, burst_size: int) -> Results:
+	loop = new_event_loop()
+	dispatcher = EventDispatcher()
+	transport = _CapturingTransport()
+	total = threads * bursts * burst_size
+	conns = []
+	for i in range(threads):
+		# a virtual clock that isn't advanced, so that no resend timers run
+		conn = RaknetConnection(transport, dispatcher, ("10.0.0.%i" % i, 1001), clock=VirtualClock())
+		conn._packets_sent = -total  # as if everything had been acked, so that the congestion window doesn't hold packets back
+		conns.append(conn)
+	callbacks = [0]
+	queue = ThreadsafeSendQueue(dispatcher, BroadcastGroups(dispatcher), loop)
+
+	def hop(conn: RaknetConnection, data: bytes) -> None:
+		callbacks[0] += 1
+		conn.send(data, Reliability.ReliableOrdered)
+
+	if batched:
+		send: Callable[[RaknetConnection, bytes], None] = queue.send
+	else:
+		send = lambda conn, data: loop.call_soon_threadsafe(hop, conn, data)
+	handoff_time: List[float] = []
+	sent = [0]
+
+	def worker(conn: RaknetConnection) -> None:
+		elapsed = 0.0
+		for _ in range(bursts):
+			start = time.perf_counter()
+			for i in range(burst_size):
+				send(conn, b"\x53" + i.to_bytes(4, "little") + bytes(20))
+			elapsed += time.perf_counter() - start
+			time.sleep(0.0005)  # the rest of the tick
+		handoff_time.append(elapsed)
+
+	def count_sent(data: bytes, conn: RaknetConnection) -> None:
+		sent[0] += 1
+	dispatcher.add_listener(ConnectionEvent.Send, count_sent)
+
+	workers = [threading.Thread(target=worker, args=(conn,)) for conn in conns]
+	start = time.perf_counter()
+	for thread in workers:
+		thread.start()
+
+	async def wait() -> None:
+		while sent[0] < total:
+			await asyncio.sleep(0.0005)
+	loop.run_until_complete(wait())
+	elapsed = time.perf_counter() - start
+	for thread in workers:
+		thread.join()
+	loop.close()
+	return {
+		"handoff_ns_per_packet": sum(handoff_time) / total * 1e9,
+		"total_ms": elapsed * 1000,
+		"loop_callbacks": queue.batches if batched else callbacks[0],
+		"datagrams": transport.sent,
+	}
+
+def run(threads: int=4, bursts: int=50, burst_size: int=100) -> Results:
+	results = {}
+	for name, batched in (("per_packet", False), ("batched", True)):
+		for metric, value in measure(batched, threads, bursts, burst_size).items():
+			results["%s.%s" % (name, metric)] = value
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--threads", type=int, default=4, help="worker threads, each with its own connection")
+	parser.add_argument("--bursts", type=int, default=50, help="bursts per worker")
+	parser.add_argument("--burst-size", type=int, default=100, help="packets per burst")
+	args = parser.parse_args()
+	print_results(run(args.threads, args.bursts, args.burst_size))
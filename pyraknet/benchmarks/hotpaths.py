@@ -0,0 +1,92 @@
+"""
+Micro benchmarks of the reliability layer's hot paths: RangeList (acks), encoding and parsing datagrams, and splitting and reassembling large packets.
+Everything runs without sockets, with a VirtualClock, so only the CPU time of the code itself is measured. Times are the best of several runs.
+"""
+import argparse
+from typing import List
+
+from bitstream import ReadStream, WriteStream
+from event_dispatcher import EventDispatcher
+
+from ..transports.abc import ConnectionEvent, Reliability
+from ..transports.raknet._rangelist import RangeList
+from ..transports.raknet.clock import VirtualClock
+from ..transports.raknet.connection import RaknetConnection
+from . import print_results, Results, time_per_call
+
+class _CapturingTransport:
+	def __init__(self) -> None:
+		self.sent: List[bytes] = []
+
+	def sendto(self, data: bytes, address: object=None) -> None:
+		self.sent.append(data)
+
+def _connection(transport: object) -> RaknetConnection:
+	return RaknetConnection(transport, EventDispatcher(), ("10.0.0.1", 1001), clock=VirtualClock())
+
+def _encode(packets: List[bytes], reliability: Reliability) -> List[bytes]:
+	"""Return the datagrams a connection sends for the packets, regardless of the congestion window."""
+	transport = _CapturingTransport()
+	conn = _connection(transport)
+	for packet in packets:
+		conn._packets_sent = -len(packets) * 1000  # don't hold anything back for the congestion window
+		conn.send(packet, reliability)
+	return transport.sent
+
+def _parse(datagrams: List[bytes]) -> int:
+	conn = _connection(_CapturingTransport())
+	received = []
+	conn._dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: received.append(data))
+	for datagram in datagrams:
+		conn.handle_datagram(datagram)
+	return len(received)
+
+def run(count: int=1000, split_size: int=64000) -> Results:
+	results = {}
+	per_1000 = 1000 / count * 1000000
+
+	def insert_sequential() -> None:
+		acks = RangeList()
+		for number in range(count):
+			acks.insert(number)
+	results["rangelist.insert_sequential_us_per_1000"] = time_per_call(insert_sequential) * per_1000
+
+	def insert_with_holes() -> None:
+		# every other number first, then the holes, like acks for reordered packets
+		acks = RangeList()
+		for number in range(0, count, 2):
+			acks.insert(number)
+		for number in range(1, count, 2):
+			acks.insert(number)
+	results["rangelist.insert_holes_us_per_1000"] = time_per_call(insert_with_holes) * per_1000
+
+	fragmented = RangeList()
+	for number in range(0, 200, 2):
+		fragmented.insert(number)
+	stream = WriteStream()
+	fragmented.serialize(stream)
+	serialized = bytes(stream)
+	results["rangelist.serialize_100_ranges_us"] = time_per_call(lambda: fragmented.serialize(WriteStream())) * 1000000
+	results["rangelist.deserialize_100_ranges_us"] = time_per_call(lambda: RangeList.deserialize(ReadStream(serialized))) * 1000000
+
+	packets = [bytes([0x53, i % 256]) + bytes(100) for i in range(count)]
+	for reliability in (Reliability.Unreliable, Reliability.ReliableOrdered):
+		name = reliability.name.lower()
+		results["datagram.encode_%s_us_per_1000" % name] = time_per_call(lambda: _encode(packets, reliability)) * per_1000
+		datagrams = _encode(packets, reliability)
+		assert _parse(datagrams) == count
+		results["datagram.parse_%s_us_per_1000" % name] = time_per_call(lambda: _parse(datagrams)) * per_1000
+
+	large = [bytes([0x53]) + bytes(split_size - 1)]
+	results["split.encode_us_per_mb"] = time_per_call(lambda: _encode(large, Reliability.ReliableOrdered)) * 1000000 * 1000000 / split_size
+	split_datagrams = _encode(large, Reliability.ReliableOrdered)
+	assert _parse(split_datagrams) == 1
+	results["split.reassemble_us_per_mb"] = time_per_call(lambda: _parse(split_datagrams)) * 1000000 * 1000000 / split_size
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--count", type=int, default=1000, help="number of packets or acks")
+	parser.add_argument("--split-size", type=int, default=64000, help="size of the packet that's split, in bytes")
+	args = parser.parse_args()
+	print_results(run(args.count, args.split_size))
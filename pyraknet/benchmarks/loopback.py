@@ -0,0 +1,99 @@
+"""
+End to end benchmark over real UDP sockets on the loopback interface: a Server that echoes user packets, and a client RaknetConnection that keeps a window of messages in flight.
+Everything runs on one event loop, so the results are the combined cost of both ends: the reliability layer, acks, dispatching and the sockets.
+"""
+import argparse
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from bitstream import c_uint
+from event_dispatcher import EventDispatcher
+
+from ..messages import Address, Message
+from ..server import Server
+from ..transports.abc import Connection, ConnectionEvent, ConnectionType, Reliability, TransportEvent
+from ..transports.raknet.connection import RaknetConnection
+from . import new_event_loop, print_results, Results
+
+class _Client(asyncio.DatagramProtocol):
+	"""The client side of a RakNet connection, just enough to connect to a Server."""
+
+	def __init__(self, server_address: Address, dispatcher: EventDispatcher):
+		self._server_address = server_address
+		self._dispatcher = dispatcher
+		self.conn: Optional[RaknetConnection] = None
+		self.connected = asyncio.get_event_loop().create_future()
+
+	def connection_made(self, transport: asyncio.BaseTransport) -> None:
+		self._transport = transport
+		transport.sendto(bytes((Message.OpenConnectionRequest.value, 0)), self._server_address)
+
+	def datagram_received(self, data: bytes, address: Address) -> None:
+		if len(data) <= 2:
+			if data[0] == Message.OpenConnectionReply.value and self.conn is None:
+				self.conn = RaknetConnection(self._transport, self._dispatcher, self._server_address)
+				self.conn.send(bytes((Message.ConnectionRequest.value,)), Reliability.Reliable)
+				self.connected.set_result(None)
+		elif self.conn is not None:
+			self.conn.handle_datagram(data)
+
+async def _measure(messages: int, size: int, window: int) -> Tuple[float, List[float]]:
+	dispatcher = EventDispatcher()
+	addresses: Dict[ConnectionType, Address] = {}
+	dispatcher.add_listener(TransportEvent.NetworkInit, lambda conn_type, address: addresses.__setitem__(conn_type, address))
+	Server(("127.0.0.1", 0), 10, b"", None, dispatcher=dispatcher)
+	dispatcher.add_listener(Message.UserPacket, lambda data, conn: conn.send(bytes((Message.UserPacket.value,)) + data, Reliability.ReliableOrdered))
+	while ConnectionType.RakNet not in addresses:
+		await asyncio.sleep(0.01)
+
+	loop = asyncio.get_event_loop()
+	client_dispatcher = EventDispatcher()
+	transport, client = await loop.create_datagram_endpoint(lambda: _Client(addresses[ConnectionType.RakNet], client_dispatcher), local_addr=("127.0.0.1", 0))
+	await client.connected
+	padding = bytes(size - 5)
+	send_times: List[float] = []
+	rtts: List[float] = []
+	done = loop.create_future()
+
+	def send_next() -> None:
+		send_times.append(time.perf_counter())
+		client.conn.send(bytes((Message.UserPacket.value,)) + c_uint._struct.pack(len(send_times) - 1) + padding, Reliability.ReliableOrdered)
+
+	def on_receive(data: Any, conn: Connection) -> None:
+		if data[0] != Message.UserPacket.value:
+			return
+		rtts.append(time.perf_counter() - send_times[c_uint._struct.unpack(data[1:5])[0]])
+		if len(send_times) < messages:
+			send_next()
+		elif len(rtts) == messages:
+			done.set_result(None)
+	client_dispatcher.add_listener(ConnectionEvent.Receive, on_receive)
+
+	start = time.perf_counter()
+	for _ in range(min(window, messages)):
+		send_next()
+	await asyncio.wait_for(done, 60)
+	elapsed = time.perf_counter() - start
+	client.conn.close()
+	transport.close()
+	return elapsed, rtts
+
+def run(messages: int=1000, size: int=200, window: int=16) -> Results:
+	loop = new_event_loop()
+	elapsed, rtts = loop.run_until_complete(_measure(messages, size, window))
+	loop.close()
+	rtts.sort()
+	return {
+		"echo.messages_per_s": messages / elapsed,
+		"echo.mean_rtt_ms": sum(rtts) / len(rtts) * 1000,
+		"echo.p99_rtt_ms": rtts[int(len(rtts) * 0.99)] * 1000,
+	}
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--messages", type=int, default=1000)
+	parser.add_argument("--size", type=int, default=200, help="message size in bytes")
+	parser.add_argument("--window", type=int, default=16, help="number of messages in flight")
+	args = parser.parse_args()
+	print_results(run(args.messages, args.size, args.window))
@@ -0,0 +1,122 @@
+"""
+Measures the memory used per connection, for idle connections and for connections that have exchanged a few packets, and the memory held for resends after broadcasting a large payload.
+Memory is measured with tracemalloc, so it includes everything allocated for the connections (timers, dispatcher listeners), but not the interpreter's fixed overhead.
+"""
+import argparse
+import tracemalloc
+from typing import Any, Callable, List
+
+from event_dispatcher import EventDispatcher
+
+from ..transports.abc import Reliability
+from ..transports.raknet.clock import VirtualClock
+from ..transports.raknet.connection import RaknetConnection
+from ..transports.raknet.resends import ResendStore
+from ..transports.tcpudp.transport import TCPUDPConnection
+from . import print_results, Results
+
+class _NullTransport:
+	"""Stands in for the datagram and TCP transports, ignoring everything."""
+
+	def __init__(self, dispatcher: EventDispatcher):
+		self._dispatcher = dispatcher
+		self._conns: dict = {}
+
+	def sendto(self, data: bytes, address: Any=None) -> None:
+		pass
+
+	def writelines(self, data: List[bytes]) -> None:
+		pass
+
+	def is_closing(self) -> bool:
+		return False
+
+class _CapturingTransport(_NullTransport):
+	def __init__(self, dispatcher: EventDispatcher):
+		super().__init__(dispatcher)
+		self.sent: List[bytes] = []
+
+	def sendto(self, data: bytes, address: Any=None) -> None:
+		self.sent.append(data)
+
+def measure(create: Callable[[int], Any], count: int) -> float:
+	"""Return the bytes allocated per object for count objects created by create."""
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	objects = [create(i) for i in range(count)]
+	after = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	del objects
+	return (after - before) / count
+
+def raknet_connection(active: bool, count: int) -> Callable[[int], RaknetConnection]:
+	# separate clocks, so that advancing one connection's clock doesn't run the timers of all the others
+	clocks = [VirtualClock() for _ in range(count)]
+	clock = VirtualClock()
+	dispatcher = EventDispatcher()
+	transport = _NullTransport(dispatcher)
+	# a datagram with one ReliableOrdered packet, as the remote would send it
+	remote_transport = _CapturingTransport(EventDispatcher())
+	remote = RaknetConnection(remote_transport, remote_transport._dispatcher, ("10.0.0.1", 1), clock=clock)
+	remote.send(b"\x53" + bytes(20), Reliability.ReliableOrdered)
+	datagram = remote_transport.sent[0]
+
+	def create(i: int) -> RaknetConnection:
+		conn = RaknetConnection(transport, dispatcher, ("10.0.%i.%i" % (i // 256, i % 256), 1001), clock=clocks[i])
+		if active:
+			conn.handle_datagram(datagram)
+			conn.send(b"\x53" + bytes(20), Reliability.ReliableOrdered)
+			clocks[i].advance(0.05)  # send the acks
+		return conn
+	return create
+
+def tcpudp_connection(active: bool, count: int) -> Callable[[int], TCPUDPConnection]:
+	dispatcher = EventDispatcher()
+	transport = _NullTransport(dispatcher)
+	frame = (21).to_bytes(4, "little") + b"\x53" + bytes(20)
+
+	def create(i: int) -> TCPUDPConnection:
+		conn = TCPUDPConnection(transport)
+		conn._tcp = transport
+		if active:
+			buffer = conn.get_buffer(-1)
+			buffer[:len(frame)] = frame
+			del buffer
+			conn.buffer_updated(len(frame))
+		return conn
+	return create
+
+def broadcast(count: int, size: int) -> Results:
+	"""Broadcast a payload to count connections that don't ack anything, and return the memory allocated by that, relative to the payload size."""
+	clock = VirtualClock()
+	dispatcher = EventDispatcher()
+	transport = _NullTransport(dispatcher)
+	store = ResendStore()
+	conns = [RaknetConnection(transport, dispatcher, ("10.0.%i.%i" % (i // 256, i % 256), 1001), clock=clock, resend_store=store) for i in range(count)]
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	conns[0].broadcast(b"\x53" + bytes(size - 1))
+	after = tracemalloc.get_traced_memory()[0]
+	tracemalloc.stop()
+	return {
+		"raknet.broadcast_bytes_per_payload_byte": (after - before) / size,
+		"raknet.broadcast_resend_store_bytes": store.bytes,
+	}
+
+def run(count: int=10000, broadcast_count: int=500, broadcast_size: int=50000) -> Results:
+	results = {
+		"raknet.idle_bytes_per_connection": measure(raknet_connection(False, count), count),
+		"raknet.active_bytes_per_connection": measure(raknet_connection(True, count), count),
+		"tcpudp.idle_bytes_per_connection": measure(tcpudp_connection(False, count), count),
+		"tcpudp.active_bytes_per_connection": measure(tcpudp_connection(True, count), count),
+	}
+	results.update(broadcast(broadcast_count, broadcast_size))
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--count", type=int, default=10000, help="number of connections")
+	parser.add_argument("--broadcast-count", type=int, default=500, help="number of connections broadcast to")
+	parser.add_argument("--broadcast-size", type=int, default=50000, help="size of the broadcast payload in bytes")
+	args = parser.parse_args()
+	print_results(run(args.count, args.broadcast_count, args.broadcast_size))
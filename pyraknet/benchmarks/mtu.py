@@ -0,0 +1,47 @@
+"""
+Measures how the mtu affects sending large packets, like world loads: the number of datagrams a packet is split into, the bytes on the wire (including the IP and UDP headers), the overhead compared to the payload and the number of ack datagrams sent back.
+Runs over an emulated link in virtual time, so the results don't depend on the machine.
+"""
+import argparse
+from typing import List, Sequence
+
+from ..transports.abc import ConnectionEvent, Reliability
+from ..transports.raknet.clock import VirtualClock
+from ..transports.raknet.connection import UDP_HEADER_SIZE
+from ..transports.raknet.emulator import connection_pair
+from . import print_results, Results
+
+PAYLOAD_SIZES = 2000, 8000, 32000, 128000
+MTUS = 576, 1228, 1400, 1492
+
+def send(payload_size: int, mtu: int) -> Results:
+	clock = VirtualClock()
+	a, b = connection_pair(clock, {"latency": 0.02}, {"mtu": mtu})
+	received: List[bytes] = []
+	b._dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: received.append(data))
+	payload = bytes([0x53]) + bytes(payload_size - 1)
+	a.send(payload, Reliability.ReliableOrdered)
+	assert clock.run_until(lambda: len(received) == 1, 60)
+	assert received[0] == payload
+	wire_bytes = a._transport.sent_bytes + a._transport.sent * UDP_HEADER_SIZE
+	return {
+		"datagrams": a._transport.sent,
+		"wire_bytes": wire_bytes,
+		"overhead_pct": (wire_bytes - payload_size) / payload_size * 100,
+		"acks": b._transport.sent,
+	}
+
+def run(payload_sizes: Sequence[int]=PAYLOAD_SIZES, mtus: Sequence[int]=MTUS) -> Results:
+	results = {}
+	for payload_size in payload_sizes:
+		for mtu in mtus:
+			for name, value in send(payload_size, mtu).items():
+				results["%i_bytes.mtu_%i.%s" % (payload_size, mtu, name)] = value
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--payload-sizes", type=int, nargs="+", default=PAYLOAD_SIZES)
+	parser.add_argument("--mtus", type=int, nargs="+", default=MTUS)
+	args = parser.parse_args()
+	print_results(run(args.payload_sizes, args.mtus))
@@ -0,0 +1,75 @@
+"""
+Measures how a slow packet handler affects acks, with the handler running on the event loop and offloaded to a thread pool (see offload.Offloader).
+Two RaknetConnections talk over an emulated link on the real event loop. One sends a steady stream of packets, the other handles each one with a handler that blocks for a while (like a database query).
+The ack latency is the round trip time the sender measures from acks, which includes the receiver's ack delay of 30 ms.
+"""
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from ..offload import Offloader
+from ..transports.abc import ConnectionEvent, Reliability
+from ..transports.raknet.calcs import RenoCongestionControl
+from ..transports.raknet.clock import LoopClock
+from ..transports.raknet.emulator import connection_pair
+from . import new_event_loop, print_results, Results
+
+def measure(offload: bool, packets: int, rate: float, handler_time: float) -> Results:
+	loop = new_event_loop()
+	rtts: List[float] = []
+
+	class RecordingCongestionControl(RenoCongestionControl):
+		def on_rtt(self, rtt: float) -> None:
+			rtts.append(rtt)
+			super().on_rtt(rtt)
+
+	a, b = connection_pair(LoopClock(), {"latency": 0.005}, {"congestion_control": RecordingCongestionControl})
+	handled = 0
+	def handler(data: bytes, address: object) -> None:
+		nonlocal handled
+		time.sleep(handler_time)
+		handled += 1
+
+	executor = None
+	if offload:
+		executor = ThreadPoolExecutor(1)
+		Offloader(b._dispatcher, executor).add_listener(ConnectionEvent.Receive, handler)
+	else:
+		b._dispatcher.add_listener(ConnectionEvent.Receive, handler)
+
+	for i in range(packets):
+		loop.call_later(i / rate, a.send, b"\x53" + bytes(100), Reliability.ReliableOrdered)
+	start = time.perf_counter()
+
+	async def wait() -> None:
+		while handled < packets or a._resends:
+			await asyncio.sleep(0.01)
+
+	loop.run_until_complete(wait())
+	wall_time = time.perf_counter() - start
+	if executor is not None:
+		executor.shutdown()
+	loop.close()
+	rtts.sort()
+	return {
+		"mean_ack_latency_ms": sum(rtts) / len(rtts) * 1000,
+		"max_ack_latency_ms": rtts[-1] * 1000,
+		"wall_time_s": wall_time,
+	}
+
+def run(packets: int=200, rate: float=100, handler_time: float=0.02) -> Results:
+	results = {}
+	for name, offload in (("inline", False), ("offloaded", True)):
+		for metric, value in measure(offload, packets, rate, handler_time).items():
+			results["%s.%s" % (name, metric)] = value
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--packets", type=int, default=200)
+	parser.add_argument("--rate", type=float, default=100, help="packets per second")
+	parser.add_argument("--handler-time", type=float, default=0.02, help="seconds the handler blocks per packet")
+	args = parser.parse_args()
+	print_results(run(args.packets, args.rate, args.handler_time))
@@ -0,0 +1,112 @@
+"""
+Compares building outgoing packets field by field with a bitstream.WriteStream and with a PacketBuilder, for the server's pong and connection request replies and the replica manager's destruction message.
+Reports the time per packet and the memory allocated while building one (the peak traced by tracemalloc, including the packet itself), which counts the temporary stream, buffer and field objects.
+Replica constructions and serializations are still written with a WriteStream, since replicas write bit-level data.
+"""
+import argparse
+import socket
+import time
+import tracemalloc
+from typing import Callable, Dict
+
+from bitstream import c_bit, c_float, c_ubyte, c_uint, c_ushort, WriteStream
+from event_dispatcher import EventDispatcher
+
+from ..messages import Message
+from ..packets import PacketBuilder
+from ..replicamanager import Replica, ReplicaManager
+from ..transports.raknet.clock import VirtualClock
+from . import print_results, Results
+
+ADDRESS = "127.0.0.1", 1001
+
+class _Replica(Replica):
+	def write_construction(self, stream: WriteStream) -> None:
+		stream.write(c_bit(False))
+		for value in (1.0, 2.0, 3.0):
+			stream.write(c_float(value))
+
+def pong_stream() -> bytes:
+	pong = WriteStream()
+	pong.write(c_ubyte(Message.ConnectedPong.value))
+	pong.write(c_uint(123456))
+	pong.write(c_uint(0))
+	return bytes(pong)
+
+def pong_builder() -> bytes:
+	pong = PacketBuilder(Message.ConnectedPong)
+	pong.write_uint(123456)
+	pong.write_uint(0)
+	return bytes(pong)
+
+def connection_request_stream() -> bytes:
+	response = WriteStream()
+	response.write(c_ubyte(Message.ConnectionRequestAccepted.value))
+	response.write(socket.inet_aton(ADDRESS[0]))
+	response.write(c_ushort(ADDRESS[1]))
+	response.write(bytes(2))
+	response.write(socket.inet_aton(ADDRESS[0]))
+	response.write(c_ushort(ADDRESS[1]))
+	return bytes(response)
+
+def connection_request_builder() -> bytes:
+	response = PacketBuilder(Message.ConnectionRequestAccepted)
+	response.write_bytes(socket.inet_aton(ADDRESS[0]))
+	response.write_ushort(ADDRESS[1])
+	response.write_ushort(0)
+	response.write_bytes(socket.inet_aton(ADDRESS[0]))
+	response.write_ushort(ADDRESS[1])
+	return bytes(response)
+
+def replica_paths() -> Dict[str, Callable[[], bytes]]:
+	manager = ReplicaManager(EventDispatcher(), clock=VirtualClock())
+	obj = _Replica()
+	manager.construct(obj)
+
+	def destruction_stream() -> bytes:
+		out = WriteStream()
+		out.write(c_ubyte(Message.ReplicaManagerDestruction.value))
+		out.write(c_ushort(0))
+		return bytes(out)
+	return {
+		"destruction.stream": destruction_stream,
+		"destruction.builder": lambda: manager._destruction(obj),
+	}
+
+def measure(build: Callable[[], bytes], count: int) -> Results:
+	start = time.perf_counter()
+	for _ in range(count):
+		build()
+	elapsed = time.perf_counter() - start
+	build()  # warm up caches before tracing
+	tracemalloc.start()
+	before = tracemalloc.get_traced_memory()[0]
+	build()
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return {
+		"ns": elapsed / count * 1e9,
+		"allocated_bytes": peak - before,
+	}
+
+def run(count: int=100000) -> Results:
+	paths = {
+		"pong.stream": pong_stream,
+		"pong.builder": pong_builder,
+		"connection_request.stream": connection_request_stream,
+		"connection_request.builder": connection_request_builder,
+	}
+	paths.update(replica_paths())
+	for name in ("pong", "connection_request", "destruction"):
+		assert paths[name + ".stream"]() == paths[name + ".builder"]()
+	results = {}
+	for name, build in paths.items():
+		for metric, value in measure(build, count).items():
+			results["%s_%s" % (name, metric)] = value
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--count", type=int, default=100000, help="packets built per path for the timing")
+	args = parser.parse_args()
+	print_results(run(args.count))
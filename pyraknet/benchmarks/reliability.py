@@ -0,0 +1,73 @@
+"""
+Measures the full reliability layer (two RaknetConnections) over emulated links, see transports.raknet.emulator.
+A burst of ReliableOrdered messages is sent from one side, and the virtual time until each one is delivered in order on the other side is recorded.
+The reno_rto_only configuration has fast retransmit disabled, so lost packets are only resent when their rto expires.
+Runs on a VirtualClock, so the results are reproducible for a given seed and don't depend on the machine, except for wall_time_s.
+"""
+import argparse
+import time
+from typing import List
+
+from ..transports.abc import ConnectionEvent, Reliability
+from ..transports.raknet.calcs import DelayCongestionControl, RenoCongestionControl
+from ..transports.raknet.clock import VirtualClock
+from ..transports.raknet.emulator import connection_pair
+from . import print_results, Results
+
+CONFIGS = {
+	# name: RaknetConnection options
+	"reno": {"congestion_control": RenoCongestionControl},
+	"delay": {"congestion_control": DelayCongestionControl},
+	"reno_rto_only": {"congestion_control": RenoCongestionControl, "fast_retransmit_threshold": None},
+}
+
+SCENARIOS = {
+	"lan": {"latency": 0.005, "bandwidth": 10_000_000},
+	"wan": {"latency": 0.05, "jitter": 0.01, "bandwidth": 1_000_000},
+	"wifi": {"latency": 0.02, "jitter": 0.02, "loss": 0.02, "reorder": 0.01, "bandwidth": 1_000_000},
+	"lossy_wan": {"latency": 0.08, "jitter": 0.02, "loss": 0.05, "duplicate": 0.01, "bandwidth": 500_000},
+}
+
+def transfer(link_options: dict, connection_options: dict, messages: int, size: int, timeout: float=600) -> Results:
+	clock = VirtualClock()
+	a, b = connection_pair(clock, link_options, connection_options)
+	send_times: List[float] = []
+	latencies: List[float] = []
+	b._dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: latencies.append(clock.time() - send_times[len(latencies)]))
+	payload = bytes([0x53]) + bytes(size - 1)
+	start = time.perf_counter()
+	for _ in range(messages):
+		send_times.append(clock.time())
+		a.send(payload, Reliability.ReliableOrdered)
+	clock.run_until(lambda: len(latencies) == messages, timeout)
+	wall_time = time.perf_counter() - start
+	latencies.sort()
+	if not latencies:
+		latencies.append(timeout)
+	duration = max(clock.time(), 1e-9)
+	return {
+		"goodput_kb_per_s": len(latencies) * size / duration / 1000,
+		"mean_latency_ms": sum(latencies) / len(latencies) * 1000,
+		"p95_latency_ms": latencies[int(len(latencies) * 0.95)] * 1000 if len(latencies) > 1 else latencies[0] * 1000,
+		"delivered": len(latencies),
+		"fast_retransmits": a.get_stats()["fast_retransmits"],
+		"timeout_retransmits": a.get_stats()["timeout_retransmits"],
+		"wall_time_s": wall_time,
+	}
+
+def run(messages: int=2000, size: int=1000, seed: int=0) -> Results:
+	results = {}
+	for scenario, link_options in SCENARIOS.items():
+		for name, connection_options in CONFIGS.items():
+			scenario_results = transfer(dict(link_options, seed=seed), connection_options, messages, size)
+			for metric, value in scenario_results.items():
+				results["%s.%s.%s" % (scenario, name, metric)] = value
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--messages", type=int, default=2000)
+	parser.add_argument("--size", type=int, default=1000, help="message size in bytes")
+	parser.add_argument("--seed", type=int, default=0)
+	args = parser.parse_args()
+	print_results(run(args.messages, args.size, args.seed))
@@ -0,0 +1,108 @@
+"""
+Compares encodings of transforms (position, rotation and velocity), as replicas send them on every serialization:
+full floats, RakNet's compressed encodings (serialization.write_vector and write_norm_quat), and quantized values (serialization.QuantizedFloat and QuantizedQuaternion).
+Reports the bytes per transform, the time to encode and decode 1000 transforms, and the largest position and rotation errors.
+"""
+import argparse
+import math
+import random
+import time
+from typing import Callable, Dict, List, Tuple
+
+from bitstream import c_float, ReadStream, WriteStream
+
+from ..serialization import QuantizedFloat, QuantizedQuaternion, Quaternion, read_norm_quat, read_vector, Vector, write_norm_quat, write_vector
+from . import print_results, Results
+
+Transform = Tuple[Vector, Quaternion, Vector]  # position, rotation, velocity
+
+POSITION = QuantizedFloat(-2048.0, 2048.0, 22)  # 1 mm precision
+VELOCITY = QuantizedFloat(-64.0, 64.0, 14)
+ROTATION = QuantizedQuaternion(10)
+
+def write_floats(stream: WriteStream, transform: Transform) -> None:
+	for vector in transform:
+		for value in vector:
+			stream.write(c_float(value))
+
+def read_floats(stream: ReadStream) -> Transform:
+	position = stream.read(c_float), stream.read(c_float), stream.read(c_float)
+	rotation = stream.read(c_float), stream.read(c_float), stream.read(c_float), stream.read(c_float)
+	velocity = stream.read(c_float), stream.read(c_float), stream.read(c_float)
+	return position, rotation, velocity
+
+def write_raknet(stream: WriteStream, transform: Transform) -> None:
+	position, rotation, velocity = transform
+	for value in position:
+		stream.write(c_float(value))  # RakNet has no compressed encoding for unbounded values that keeps absolute precision
+	write_norm_quat(stream, *rotation)
+	write_vector(stream, *velocity)
+
+def read_raknet(stream: ReadStream) -> Transform:
+	position = stream.read(c_float), stream.read(c_float), stream.read(c_float)
+	return position, read_norm_quat(stream), read_vector(stream)
+
+def write_quantized(stream: WriteStream, transform: Transform) -> None:
+	position, rotation, velocity = transform
+	POSITION.write_vector(stream, *position)
+	ROTATION.write(stream, *rotation)
+	VELOCITY.write_vector(stream, *velocity)
+
+def read_quantized(stream: ReadStream) -> Transform:
+	return POSITION.read_vector(stream), ROTATION.read(stream), VELOCITY.read_vector(stream)
+
+ENCODINGS: Dict[str, Tuple[Callable[[WriteStream, Transform], None], Callable[[ReadStream], Transform]]] = {
+	"float": (write_floats, read_floats),
+	"raknet": (write_raknet, read_raknet),
+	"quantized": (write_quantized, read_quantized),
+}
+
+def random_transforms(count: int, seed: int=1) -> List[Transform]:
+	rand = random.Random(seed)
+	transforms = []
+	for _ in range(count):
+		position = rand.uniform(-2000, 2000), rand.uniform(-100, 500), rand.uniform(-2000, 2000)
+		components = [rand.gauss(0, 1) for _ in range(4)]
+		length = math.sqrt(sum(component * component for component in components))
+		w, x, y, z = (component / length for component in components)
+		velocity = rand.uniform(-20, 20), rand.uniform(-50, 50), rand.uniform(-20, 20)
+		transforms.append((position, (w, x, y, z), velocity))
+	return transforms
+
+def rotation_error(a: Quaternion, b: Quaternion) -> float:
+	"""Return the angle between the rotations in radians."""
+	dot = abs(sum(x * y for x, y in zip(a, b)))
+	return 2 * math.acos(min(dot, 1.0))
+
+def run(count: int=1000, rounds: int=10) -> Results:
+	transforms = random_transforms(count)
+	results = {}
+	for name, (write, read) in ENCODINGS.items():
+		start = time.perf_counter()
+		for _ in range(rounds):
+			stream = WriteStream()
+			for transform in transforms:
+				write(stream, transform)
+		encode_time = (time.perf_counter() - start) / rounds
+		data = bytes(stream)
+
+		start = time.perf_counter()
+		for _ in range(rounds):
+			read_stream = ReadStream(data)
+			decoded = [read(read_stream) for _ in range(count)]
+		decode_time = (time.perf_counter() - start) / rounds
+
+		results[name + ".bytes_per_transform"] = len(data) / count
+		results[name + ".encode_ms_per_1000"] = encode_time / count * 1000000
+		results[name + ".decode_ms_per_1000"] = decode_time / count * 1000000
+		results[name + ".max_position_error"] = max(abs(a - b) for original, received in zip(transforms, decoded) for a, b in zip(original[0], received[0]))
+		results[name + ".max_rotation_error_deg"] = math.degrees(max(rotation_error(original[1], received[1]) for original, received in zip(transforms, decoded)))
+		results[name + ".max_velocity_error"] = max(abs(a - b) for original, received in zip(transforms, decoded) for a, b in zip(original[2], received[2]))
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--count", type=int, default=1000, help="number of transforms")
+	parser.add_argument("--rounds", type=int, default=10)
+	args = parser.parse_args()
+	print_results(run(args.count, args.rounds))
@@ -0,0 +1,167 @@
+"""
+Benchmarks of the server level: dispatching received packets through Server to listeners, and ReplicaManager construction, serialization and scheduled serialization with many objects and participants.
+The connections don't send anything, so this measures pyraknet's own overhead on top of the transports.
+The zone benchmark loads and unloads a zone's replicas over RaknetConnections (without sockets), once with construct/destruct per object and once with construct_many/destruct_many.
+"""
+import argparse
+import asyncio
+from typing import List
+
+from bitstream import WriteStream
+from event_dispatcher import EventDispatcher
+
+from ..messages import Address, Message
+from ..replicamanager import Replica, ReplicaManager
+from ..server import Server
+from ..transports.abc import Connection, ConnectionEvent, Reliability
+from ..transports.raknet.clock import VirtualClock
+from ..transports.raknet.connection import RaknetConnection
+from . import new_event_loop, print_results, Results, time_per_call
+
+class _NullConnection(Connection):
+	__slots__ = "sent",
+
+	def __init__(self, dispatcher: EventDispatcher):
+		super().__init__(dispatcher)
+		self.sent = 0
+
+	def get_address(self) -> Address:
+		return "0.0.0.0", 0
+
+	def close(self) -> None:
+		pass
+
+	def _send(self, data: bytes, reliability: Reliability) -> None:
+		self.sent += 1
+
+class _CountingTransport:
+	def __init__(self) -> None:
+		self.sent = 0
+
+	def sendto(self, data: bytes, address: object=None) -> None:
+		self.sent += 1
+
+class _Replica(Replica):
+	def __init__(self, size: int):
+		self._data = bytes(size)
+
+	def write_construction(self, stream: WriteStream) -> None:
+		stream.write(self._data)
+
+	def serialize(self, stream: WriteStream) -> None:
+		stream.write(self._data)
+
+def dispatch(count: int) -> Results:
+	loop = new_event_loop()
+	dispatcher = EventDispatcher()
+	Server(("127.0.0.1", 0), 10, b"", None, dispatcher=dispatcher)
+	loop.run_until_complete(asyncio.sleep(0.1))  # let the transports bind
+	conn = _NullConnection(dispatcher)
+	received = []
+	dispatcher.add_listener(Message.UserPacket, lambda data, conn: received.append(data))
+	user_packet = bytes([Message.UserPacket.value]) + bytes(100)
+	ping = bytes([Message.InternalPing.value]) + bytes(4)
+
+	def dispatch_user_packets() -> None:
+		for _ in range(count):
+			dispatcher.dispatch(ConnectionEvent.Receive, user_packet, conn)
+		received.clear()
+
+	def dispatch_pings() -> None:
+		for _ in range(count):
+			dispatcher.dispatch(ConnectionEvent.Receive, ping, conn)
+
+	results = {
+		"dispatch.user_packet_us": time_per_call(dispatch_user_packets) / count * 1000000,
+		"dispatch.internal_ping_us": time_per_call(dispatch_pings) / count * 1000000,
+	}
+	loop.close()
+	return results
+
+def replica_manager(objects: int, participants: int, size: int) -> Results:
+	dispatcher = EventDispatcher()
+	conns: List[_NullConnection] = [_NullConnection(dispatcher) for _ in range(participants)]
+	replicas = [_Replica(size) for _ in range(objects)]
+	clock = VirtualClock()
+
+	def new_manager() -> ReplicaManager:
+		manager = ReplicaManager(EventDispatcher(), clock=clock)  # a dispatcher of its own, so that managers don't pile up as Close listeners
+		for conn in conns:
+			manager.add_participant(conn, bytes_per_second=objects * size * 100)
+		return manager
+
+	def construct() -> None:
+		manager = new_manager()
+		for replica in replicas:
+			manager.construct(replica)
+
+	manager = new_manager()
+	for replica in replicas:
+		manager.construct(replica)
+
+	def serialize() -> None:
+		for replica in replicas:
+			manager.serialize(replica)
+
+	def tick() -> None:
+		for replica in replicas:
+			manager.mark_changed(replica)
+		clock.advance(0.1)
+		manager.tick()
+
+	fan_out = objects * participants
+	return {
+		"replicas.construct_us_per_1000_sends": time_per_call(construct) / fan_out * 1000 * 1000000,
+		"replicas.serialize_us_per_1000_sends": time_per_call(serialize) / fan_out * 1000 * 1000000,
+		"replicas.tick_us_per_1000_sends": time_per_call(tick) / fan_out * 1000 * 1000000,
+	}
+
+def zone(objects: int, participants: int, size: int) -> Results:
+	clock = VirtualClock()
+	replicas = [_Replica(size) for _ in range(objects)]
+	datagrams = {}
+
+	def load_and_unload(bulk: bool) -> None:
+		dispatcher = EventDispatcher()
+		transport = _CountingTransport()
+		manager = ReplicaManager(dispatcher, clock=clock)
+		for i in range(participants):
+			conn = RaknetConnection(transport, dispatcher, ("10.0.0.1", 2000 + i), clock=clock)
+			conn._packets_sent = -objects * 2  # don't hold anything back for the congestion window
+			manager.add_participant(conn)
+		if bulk:
+			manager.construct_many(replicas)
+			manager.destruct_many(replicas)
+		else:
+			for replica in replicas:
+				manager.construct(replica)
+			for replica in replicas:
+				manager.destruct(replica)
+		datagrams[bulk] = transport.sent
+
+	per_object = time_per_call(lambda: load_and_unload(False))
+	bulk = time_per_call(lambda: load_and_unload(True))
+	return {
+		"zone.per_object_ms": per_object * 1000,
+		"zone.bulk_ms": bulk * 1000,
+		"zone.bulk_speedup": per_object / bulk,
+		"zone.per_object_datagrams": datagrams[False],
+		"zone.bulk_datagrams": datagrams[True],
+	}
+
+def run(count: int=10000, objects: int=1000, participants: int=50, size: int=50, zone_objects: int=2000, zone_participants: int=10) -> Results:
+	results = dispatch(count)
+	results.update(replica_manager(objects, participants, size))
+	results.update(zone(zone_objects, zone_participants, size))
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--count", type=int, default=10000, help="number of packets dispatched")
+	parser.add_argument("--objects", type=int, default=1000, help="number of replicas")
+	parser.add_argument("--participants", type=int, default=50)
+	parser.add_argument("--size", type=int, default=50, help="construction and serialization size in bytes")
+	parser.add_argument("--zone-objects", type=int, default=2000, help="number of replicas loaded by the zone benchmark")
+	parser.add_argument("--zone-participants", type=int, default=10)
+	args = parser.parse_args()
+	print_results(run(args.count, args.objects, args.participants, args.size, args.zone_objects, args.zone_participants))
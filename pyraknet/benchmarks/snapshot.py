@@ -0,0 +1,78 @@
+"""
+Compares how long a restarted zone takes until the first participant can be sent the zone's constructions: rebuilding every replica and encoding its construction, and restoring a snapshot written with ReplicaManager.checkpoint.
+The replicas write a few dozen bit-level fields on construction, like a game object with its components. Building the objects themselves (loading them from a database, for example) isn't included, so the rebuild time is a lower bound.
+Also reports the time a checkpoint takes and the size of the snapshot file.
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import List
+from unittest.mock import Mock
+
+from bitstream import c_bit, c_float, c_uint, WriteStream
+from event_dispatcher import EventDispatcher
+
+from ..replicamanager import Replica, ReplicaManager
+from ..transports.raknet.clock import VirtualClock
+from . import print_results, Results
+
+class _Replica(Replica):
+	def __init__(self, lot: int):
+		self.lot = lot
+
+	def write_construction(self, stream: WriteStream) -> None:
+		stream.write(c_uint(self.lot))
+		for component in range(8):
+			stream.write(c_bit(component % 2 == 0))
+			for value in (1.0, 2.0, 3.0):
+				stream.write(c_float(value))
+
+def _manager() -> ReplicaManager:
+	return ReplicaManager(EventDispatcher(), clock=VirtualClock())
+
+def run(replicas: int=5000) -> Results:
+	objs = [_Replica(i) for i in range(replicas)]
+	with tempfile.TemporaryDirectory() as directory:
+		path = os.path.join(directory, "zone.snapshot")
+		before = _manager()
+		before.construct_many(objs)
+		start = time.perf_counter()
+		before.checkpoint(path)
+		checkpoint_time = time.perf_counter() - start
+
+		start = time.perf_counter()
+		rebuilt = _manager()
+		rebuilt.construct_many(objs)
+		conn = Mock()
+		rebuilt.add_participant(conn)
+		rebuild_time = time.perf_counter() - start
+		rebuilt_constructions: List[bytes] = conn.send_many.call_args[0][0]
+
+		start = time.perf_counter()
+		restored = _manager()
+		restored.restore(path)
+		conn = Mock()
+		restored.add_participant(conn)
+		restore_time = time.perf_counter() - start
+		assert conn.send_many.call_args[0][0] == rebuilt_constructions
+
+		# later participants, while the objects are still being rehydrated
+		start = time.perf_counter()
+		restored.add_participant(Mock())
+		join_time = time.perf_counter() - start
+		restored._close_snapshot()
+		size = os.path.getsize(path)
+	return {
+		"rebuild_ms": rebuild_time * 1000,
+		"restore_ms": restore_time * 1000,
+		"restored_join_ms": join_time * 1000,
+		"checkpoint_ms": checkpoint_time * 1000,
+		"snapshot_bytes_per_replica": size / replicas,
+	}
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--replicas", type=int, default=5000, help="replicas in the zone")
+	args = parser.parse_args()
+	print_results(run(args.replicas))
@@ -0,0 +1,58 @@
+"""
+Compares sending a large payload, like a world or asset transfer, with send (split up front) and send_stream (split as the window allows).
+Reports the transfer time, the number of datagrams sent (retransmissions included), the peak number of packets waiting to be acked, and when a small Reliable packet sent right after the payload arrives.
+Runs over an emulated link with limited bandwidth in virtual time, so the results don't depend on the machine, except for cpu_ms.
+"""
+import argparse
+import time
+from typing import List
+
+from ..transports.abc import ConnectionEvent, Reliability
+from ..transports.raknet.clock import VirtualClock
+from ..transports.raknet.emulator import connection_pair
+from . import print_results, Results
+
+def transfer(payload_size: int, stream: bool, bandwidth: float) -> Results:
+	clock = VirtualClock()
+	a, b = connection_pair(clock, {"latency": 0.02, "bandwidth": bandwidth, "queue_limit": 64000})
+	received: List[bytes] = []
+	receive_times: List[float] = []
+
+	def on_receive(data: bytes, conn: object) -> None:
+		received.append(data)
+		receive_times.append(clock.time())
+	b._dispatcher.add_listener(ConnectionEvent.Receive, on_receive)
+	payload = bytes([0x53]) + bytes(payload_size - 1)
+	start = time.perf_counter()
+	if stream:
+		a.send_stream(payload)
+	else:
+		a.send(payload, Reliability.ReliableOrdered)
+	a.send(b"\x53ping", Reliability.Reliable)
+	max_pending = 0
+	while len(received) < 2 and clock.time() < 600:
+		max_pending = max(max_pending, len(a._resends))
+		clock.advance(0.01)
+	cpu = time.perf_counter() - start
+	assert sorted(received, key=len) == [b"\x53ping", payload]
+	return {
+		"transfer_s": receive_times[received.index(payload)],
+		"ping_delay_s": receive_times[received.index(b"\x53ping")],
+		"datagrams": a._transport.sent,
+		"max_pending": max_pending,
+		"cpu_ms": cpu * 1000,
+	}
+
+def run(payload_size: int=2000000, bandwidth: float=1000000) -> Results:
+	results = {}
+	for name, stream in (("send", False), ("send_stream", True)):
+		for metric, value in transfer(payload_size, stream, bandwidth).items():
+			results["%s.%s" % (name, metric)] = value
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--payload-size", type=int, default=2000000, help="in bytes")
+	parser.add_argument("--bandwidth", type=float, default=1000000, help="of the link, in bytes per second")
+	args = parser.parse_args()
+	print_results(run(args.payload_size, args.bandwidth))
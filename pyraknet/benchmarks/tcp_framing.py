@@ -0,0 +1,96 @@
+"""
+Throughput of the TCP half of TCPUDPTransport over loopback, in both directions, with and without SSL.
+The SSL part needs the openssl command line tool to create a temporary self-signed certificate, and is skipped otherwise.
+"""
+import argparse
+import asyncio
+import os.path
+import shutil
+import ssl
+import subprocess
+import tempfile
+import time
+from typing import Optional, Tuple
+
+from event_dispatcher import EventDispatcher
+
+from ..transports.abc import ConnectionEvent, ConnectionType, Reliability, TransportEvent
+from ..transports.tcpudp.transport import TCPUDPTransport
+from . import new_event_loop, print_results, Results
+
+def _create_ssl_contexts(directory: str) -> Optional[Tuple[ssl.SSLContext, ssl.SSLContext]]:
+	if shutil.which("openssl") is None:
+		return None
+	cert = os.path.join(directory, "cert.pem")
+	key = os.path.join(directory, "key.pem")
+	subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key, "-out", cert, "-days", "1", "-subj", "/CN=localhost"], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+	server = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+	server.load_cert_chain(cert, key)
+	client = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+	client.check_hostname = False
+	client.verify_mode = ssl.CERT_NONE
+	return server, client
+
+async def _measure(frames: int, size: int, server_ssl: Optional[ssl.SSLContext], client_ssl: Optional[ssl.SSLContext]) -> Tuple[float, float]:
+	loop = asyncio.get_event_loop()
+	dispatcher = EventDispatcher()
+	listening = loop.create_future()
+	def on_init(conn_type, address):
+		if conn_type == ConnectionType.TcpUdp:
+			listening.set_result(address)
+	dispatcher.add_listener(TransportEvent.NetworkInit, on_init)
+	transport = TCPUDPTransport(("127.0.0.1", 0), 1, dispatcher, server_ssl)
+	host, port = await listening
+
+	received = 0
+	done = loop.create_future()
+	def on_receive(data, conn):
+		nonlocal received
+		received += 1
+		if received == frames:
+			done.set_result(None)
+	dispatcher.add_listener(ConnectionEvent.Receive, on_receive)
+
+	reader, writer = await asyncio.open_connection(host, port, ssl=client_ssl)
+	payload = bytes(size)
+	framed = len(payload).to_bytes(4, "little") + payload
+	start = time.perf_counter()
+	for _ in range(frames):
+		writer.write(framed)
+	await done
+	inbound = time.perf_counter() - start
+
+	conn = next(iter(transport._conns.values()))
+	start = time.perf_counter()
+	for _ in range(frames):
+		conn.send(payload, Reliability.ReliableOrdered)
+	await reader.readexactly(frames * len(framed))
+	outbound = time.perf_counter() - start
+
+	writer.close()
+	return inbound, outbound
+
+def run(frames: int=20000, size: int=512) -> Results:
+	results = {}
+	with tempfile.TemporaryDirectory() as directory:
+		variants = [("plain", None, None)]
+		contexts = _create_ssl_contexts(directory)
+		if contexts is not None:
+			variants.append(("ssl", contexts[0], contexts[1]))
+		for name, server_ssl, client_ssl in variants:
+			loop = new_event_loop()
+			inbound, outbound = loop.run_until_complete(_measure(frames, size, server_ssl, client_ssl))
+			loop.close()
+			megabytes = frames * size / 1e6
+			results["%s.receive.frames_per_s" % name] = frames / inbound
+			results["%s.receive.mb_per_s" % name] = megabytes / inbound
+			results["%s.send.frames_per_s" % name] = frames / outbound
+			results["%s.send.mb_per_s" % name] = megabytes / outbound
+	return results
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument("--frames", type=int, default=20000)
+	parser.add_argument("--size", type=int, default=512, help="payload size in bytes")
+	args = parser.parse_args()
+	print_results(run(args.frames, args.size))
@@ -0,0 +1,65 @@
+"""
+Named groups of connections (zones, parties, chat channels) that can be broadcast to.
+Unlike Connection.broadcast, which goes through every connection and skips the excluded ones, broadcasting to a group only touches its members.
+"""
+from typing import AbstractSet, Container, Dict, Hashable, Set, SupportsBytes
+
+from event_dispatcher import EventDispatcher
+
+from .transports.abc import Connection, ConnectionEvent, Reliability
+
+class BroadcastGroups:
+	"""
+	Groups are identified by any hashable name and hold a set of connections.
+	Connections are removed from all their groups when they're closed.
+	"""
+
+	def __init__(self, dispatcher: EventDispatcher):
+		self._groups: Dict[Hashable, Set[Connection]] = {}
+		self._memberships: Dict[Connection, Set[Hashable]] = {}  # so that closing a connection only touches its own groups
+		dispatcher.add_listener(ConnectionEvent.Close, self._on_close)
+
+	def create(self, group: Hashable) -> None:
+		"""Create an empty group. Raise ValueError if it already exists."""
+		if group in self._groups:
+			raise ValueError("group %r already exists" % (group,))
+		self._groups[group] = set()
+
+	def delete(self, group: Hashable) -> None:
+		for conn in self._groups.pop(group):
+			memberships = self._memberships[conn]
+			memberships.discard(group)
+			if not memberships:
+				del self._memberships[conn]
+
+	def join(self, group: Hashable, conn: Connection) -> None:
+		"""Add the connection to the group. The group has to exist."""
+		self._groups[group].add(conn)
+		self._memberships.setdefault(conn, set()).add(group)
+
+	def leave(self, group: Hashable, conn: Connection) -> None:
+		self._groups[group].discard(conn)
+		memberships = self._memberships.get(conn)
+		if memberships is not None:
+			memberships.discard(group)
+			if not memberships:
+				del self._memberships[conn]
+
+	def members(self, group: Hashable) -> AbstractSet[Connection]:
+		"""Return the connections in the group. The returned set must not be modified."""
+		return self._groups[group]
+
+	def groups_of(self, conn: Connection) -> AbstractSet[Hashable]:
+		return self._memberships.get(conn, frozenset())
+
+	def broadcast(self, group: Hashable, data: SupportsBytes, reliability: Reliability=Reliability.ReliableOrdered, exclude: Container[Connection]=()) -> None:
+		"""Send data to all members of the group, except the ones in exclude. The data is only converted to bytes once."""
+		data = bytes(data)
+		# copy, sending may close connections, which removes them from the group
+		for conn in list(self._groups[group]):
+			if conn not in exclude:
+				conn.send(data, reliability)
+
+	def _on_close(self, conn: Connection) -> None:
+		for group in self._memberships.pop(conn, ()):
+			self._groups[group].discard(conn)
@@ -0,0 +1,197 @@
+"""
+Instrumentation for finding out where the event loop's time goes.
+Instrumentation keeps per message counts, bytes and handler time histograms and measures loop lag, see Server's instrumentation argument.
+SamplingProfiler is an opt-in profiler that periodically samples the loop thread's stack.
+"""
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from .messages import Message
+
+class Histogram:
+	"""
+	Histogram of non-negative integers with logarithmic buckets, like HdrHistogram.
+	Values below 2**sub_bucket_bits are counted exactly, above that each power of two is split into 2**(sub_bucket_bits-1) buckets, so the relative error is below 2**(1-sub_bucket_bits).
+	Recording is O(1) and the memory needed only grows with the logarithm of the largest value.
+	"""
+	__slots__ = "_sub_bucket_bits", "_counts", "count", "total", "max"
+
+	def __init__(self, sub_bucket_bits: int=5):
+		self._sub_bucket_bits = sub_bucket_bits
+		self._counts: List[int] = []
+		self.count = 0
+		self.total = 0
+		self.max = 0
+
+	def _index(self, value: int) -> int:
+		shift = value.bit_length() - self._sub_bucket_bits
+		if shift <= 0:
+			return value
+		half = 1 << (self._sub_bucket_bits - 1)
+		return (shift + 1) * half + (value >> shift) - half
+
+	def _upper_bound(self, index: int) -> int:
+		"""Return the highest value counted in the bucket."""
+		sub_buckets = 1 << self._sub_bucket_bits
+		if index < sub_buckets:
+			return index
+		half = sub_buckets >> 1
+		shift = index // half - 1
+		top = index % half + half
+		return ((top + 1) << shift) - 1
+
+	def record(self, value: int) -> None:
+		index = self._index(value)
+		if index >= len(self._counts):
+			self._counts.extend([0] * (index + 1 - len(self._counts)))
+		self._counts[index] += 1
+		self.count += 1
+		self.total += value
+		if value > self.max:
+			self.max = value
+
+	def mean(self) -> float:
+		if self.count == 0:
+			return 0
+		return self.total / self.count
+
+	def percentile(self, percentile: float) -> int:
+		"""Return a value that at least percentile percent of the recorded values are lower than or equal to (within the bucket precision)."""
+		if self.count == 0:
+			return 0
+		threshold = self.count * percentile / 100
+		seen = 0
+		for index, count in enumerate(self._counts):
+			seen += count
+			if seen >= threshold and count:
+				return min(self._upper_bound(index), self.max)
+		return self.max
+
+class MessageStats:
+	__slots__ = "count", "bytes", "handler_time"
+
+	def __init__(self) -> None:
+		self.count = 0
+		self.bytes = 0
+		self.handler_time = Histogram()  # in microseconds
+
+class Instrumentation:
+	"""
+	Records per message type counts, bytes and listener execution time of received packets, counts and bytes of sent packets, and the event loop's lag.
+	Pass an instance as Server's instrumentation argument, the server then records every packet.
+
+	Loop lag is how late a timer that should fire every loop_lag_interval seconds actually fires. A high lag means that something blocks the loop, delaying acks and resends.
+	By default all user packets are recorded as UserPacket. To tell them apart, pass user_packet_key, which gets the packet (without the message id) and returns a name for its type.
+	"""
+
+	def __init__(self, user_packet_key: Optional[Callable[[bytes], Hashable]]=None, loop_lag_interval: Optional[float]=0.1):
+		self._user_packet_key = user_packet_key
+		self.received: Dict[Hashable, MessageStats] = {}
+		self.sent: Dict[Hashable, MessageStats] = {}
+		self.loop_lag = Histogram()  # in microseconds
+		self._loop_lag_interval = loop_lag_interval
+		if loop_lag_interval is not None:
+			self._expected_time = time.perf_counter() + loop_lag_interval
+			asyncio.get_event_loop().call_later(loop_lag_interval, self._measure_loop_lag)
+
+	def key(self, data: bytes) -> Hashable:
+		"""Return the name packets like data are recorded under."""
+		try:
+			message = Message(data[0])
+		except ValueError:
+			return "Unknown %i" % data[0]
+		if message == Message.UserPacket and self._user_packet_key is not None:
+			return self._user_packet_key(bytes(data[1:]))
+		return message.name
+
+	def record_received(self, data: bytes, handler_time: float) -> None:
+		key = self.key(data)
+		stats = self.received.get(key)
+		if stats is None:
+			stats = self.received[key] = MessageStats()
+		stats.count += 1
+		stats.bytes += len(data)
+		stats.handler_time.record(int(handler_time * 1000000))
+
+	def record_sent(self, data: bytes) -> None:
+		key = self.key(data)
+		stats = self.sent.get(key)
+		if stats is None:
+			stats = self.sent[key] = MessageStats()
+		stats.count += 1
+		stats.bytes += len(data)
+
+	def _measure_loop_lag(self) -> None:
+		now = time.perf_counter()
+		self.loop_lag.record(max(int((now - self._expected_time) * 1000000), 0))
+		self._expected_time = now + self._loop_lag_interval
+		asyncio.get_event_loop().call_later(self._loop_lag_interval, self._measure_loop_lag)
+
+	def report(self) -> str:
+		"""Return a table of the recorded stats, the received messages sorted by total handler time. Times are in milliseconds."""
+		lines = ["%-40s %8s %10s %9s %9s %9s %9s %9s" % ("received", "count", "bytes", "total ms", "mean ms", "p50 ms", "p99 ms", "max ms")]
+		for key, stats in sorted(self.received.items(), key=lambda item: -item[1].handler_time.total):
+			hist = stats.handler_time
+			lines.append("%-40s %8i %10i %9.1f %9.3f %9.3f %9.3f %9.3f" % (key, stats.count, stats.bytes, hist.total / 1000, hist.mean() / 1000, hist.percentile(50) / 1000, hist.percentile(99) / 1000, hist.max / 1000))
+		lines.append("")
+		lines.append("%-40s %8s %10s" % ("sent", "count", "bytes"))
+		for key, stats in sorted(self.sent.items(), key=lambda item: -item[1].bytes):
+			lines.append("%-40s %8i %10i" % (key, stats.count, stats.bytes))
+		lines.append("")
+		lag = self.loop_lag
+		lines.append("loop lag ms: mean %.3f p50 %.3f p99 %.3f max %.3f" % (lag.mean() / 1000, lag.percentile(50) / 1000, lag.percentile(99) / 1000, lag.max / 1000))
+		return "\n".join(lines)
+
+class SamplingProfiler:
+	"""
+	Profiler that samples the stack of a thread (by default the one that created it, normally the loop thread) every interval seconds from a background thread.
+	Much cheaper than cProfile for the sampled thread, since it doesn't trace every call. Call start and stop, then look at top or collapsed.
+	"""
+
+	def __init__(self, interval: float=0.005, thread_id: Optional[int]=None, max_depth: int=64):
+		if thread_id is None:
+			thread_id = threading.get_ident()
+		self._thread_id = thread_id
+		self._interval = interval
+		self._max_depth = max_depth
+		self.samples: Counter = Counter()  # stack (outermost frame first) -> number of samples
+		self._stop = threading.Event()
+		self._thread: Optional[threading.Thread] = None
+
+	def start(self) -> None:
+		self._stop.clear()
+		self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+		self._thread.start()
+
+	def stop(self) -> None:
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join()
+			self._thread = None
+
+	def _run(self) -> None:
+		while not self._stop.wait(self._interval):
+			frame = sys._current_frames().get(self._thread_id)
+			if frame is None:
+				continue
+			stack = []
+			while frame is not None and len(stack) < self._max_depth:
+				code = frame.f_code
+				stack.append("%s (%s:%i)" % (code.co_name, code.co_filename, code.co_firstlineno))
+				frame = frame.f_back
+			self.samples[tuple(reversed(stack))] += 1
+
+	def top(self, count: int=20) -> List[Tuple[str, int]]:
+		"""Return the functions that were most often at the top of the stack (where the time was actually spent), with their number of samples."""
+		functions: Counter = Counter()
+		for stack, samples in self.samples.items():
+			functions[stack[-1]] += samples
+		return functions.most_common(count)
+
+	def collapsed(self) -> str:
+		"""Return the samples in the collapsed stack format used by flame graph tools."""
+		return "\n".join("%s %i" % (";".join(stack), samples) for stack, samples in self.samples.items())
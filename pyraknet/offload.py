@@ -0,0 +1,113 @@
+"""
+Running packet listeners on an executor instead of the event loop.
+Normal listeners run synchronously while a datagram is being handled, so a slow listener (database lookups, pathfinding) delays acks, resends and every other connection's packets.
+"""
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import Executor
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from bitstream import ReadStream
+from event_dispatcher import EventDispatcher
+
+from .messages import Address
+from .transports.abc import Connection, ConnectionEvent
+
+log = logging.getLogger(__name__)
+
+MAX_PENDING = 256  # number of packets of a connection that can wait for the executor before the connection is paused
+
+OffloadedListener = Callable[[bytes, Address], Any]
+
+class _ConnectionQueue:
+	__slots__ = "packets", "running", "paused"
+
+	def __init__(self) -> None:
+		self.packets: Deque[Tuple[OffloadedListener, bytes]] = deque()
+		self.running = False
+		self.paused = False
+
+class Offloader:
+	"""
+	Runs listeners on an executor (a thread or process pool).
+	Packets of a connection are handled one at a time, in the order they were received, across all listeners added to the same offloader. Different connections are handled in parallel.
+
+	Listeners are called with the packet data (as bytes) and the address of the connection, since connections aren't thread safe and can't be passed to other processes.
+	For process pools, listeners must be picklable, e.g. module level functions.
+	A listener can return data to send back to the connection (something bytes() accepts, or a list of those), which is sent from the event loop.
+
+	When max_pending packets of a connection are waiting, the connection is paused (see Connection.pause_receiving) until half of them have been handled.
+	Pauses are counted per connection, so the connection stays paused while another offloader or the receive queue still holds it back.
+	The packets of a datagram that has already been acked are still queued, so the queue can exceed max_pending by a few packets.
+	"""
+
+	def __init__(self, dispatcher: EventDispatcher, executor: Optional[Executor]=None, max_pending: int=MAX_PENDING):
+		"""If executor is None, the event loop's default executor is used."""
+		self._dispatcher = dispatcher
+		self._executor = executor
+		self._max_pending = max_pending
+		self._queues: Dict[Connection, _ConnectionQueue] = {}
+		self.pauses = 0
+		self._dispatcher.add_listener(ConnectionEvent.Close, self._on_close)
+
+	def add_listener(self, event: Any, listener: OffloadedListener) -> None:
+		"""Run listener on the executor whenever event is dispatched with (data, connection), e.g. a Message."""
+		self._dispatcher.add_listener(event, lambda data, conn: self._enqueue(listener, data, conn))
+
+	def pending(self) -> int:
+		"""Return the number of packets waiting for the executor, over all connections."""
+		return sum(len(queue.packets) for queue in self._queues.values())
+
+	def _enqueue(self, listener: OffloadedListener, data: Any, conn: Connection) -> None:
+		# data may be a stream or a view into a receive buffer, the executor needs a copy that stays valid
+		if isinstance(data, ReadStream):
+			data = data.read_remaining()
+		else:
+			data = bytes(data)
+		queue = self._queues.get(conn)
+		if queue is None:
+			queue = self._queues[conn] = _ConnectionQueue()
+		queue.packets.append((listener, data))
+		if not queue.running:
+			self._run_next(conn, queue)
+		elif len(queue.packets) >= self._max_pending and not queue.paused:
+			log.debug("Offload queue of %s full, pausing", conn.get_address())
+			queue.paused = True
+			self.pauses += 1
+			conn.pause_receiving()
+
+	def _run_next(self, conn: Connection, queue: _ConnectionQueue) -> None:
+		listener, data = queue.packets.popleft()
+		queue.running = True
+		future = asyncio.get_event_loop().run_in_executor(self._executor, listener, data, conn.get_address())
+		future.add_done_callback(lambda future: self._on_done(conn, queue, future))
+
+	def _on_done(self, conn: Connection, queue: _ConnectionQueue, future: asyncio.Future) -> None:
+		queue.running = False
+		if self._queues.get(conn) is not queue:
+			return  # the connection has been closed in the meantime
+		try:
+			result = future.result()
+		except Exception:
+			log.exception("Offloaded listener failed for packet from %s", conn.get_address())
+			result = None
+		if result is not None:
+			if isinstance(result, list):
+				for data in result:
+					conn.send(data)
+			else:
+				conn.send(result)
+
+		if queue.paused and len(queue.packets) <= self._max_pending // 2:
+			queue.paused = False
+			conn.resume_receiving()  # undoes only this offloader's pause, and may enqueue buffered packets right away
+		if queue.running:
+			return
+		if queue.packets:
+			self._run_next(conn, queue)
+		else:
+			del self._queues[conn]
+
+	def _on_close(self, conn: Connection) -> None:
+		self._queues.pop(conn, None)
@@ -0,0 +1,114 @@
+"""
+Sending from threads other than the event loop's, e.g. game logic running in worker threads.
+Connections aren't thread safe, and handing every packet to the loop on its own with call_soon_threadsafe wakes the loop (a write to its self-pipe) and schedules a callback per packet.
+The queue collects packets from any thread and wakes the loop once per batch, which then sends the whole batch in one callback.
+"""
+import asyncio
+import logging
+import threading
+from typing import Any, Container, Dict, Hashable, List, Optional, SupportsBytes, Tuple
+
+from event_dispatcher import EventDispatcher
+
+from .groups import BroadcastGroups
+from .transports.abc import Connection, ConnectionEvent, Reliability
+
+log = logging.getLogger(__name__)
+
+_SEND = 0
+_BROADCAST = 1
+
+class ThreadsafeSendQueue:
+	"""
+	send and broadcast can be called from any thread. The data is converted to bytes on the calling thread, so building packets doesn't take time on the loop either.
+	The first packet of a batch schedules the batch to be sent on the loop, packets queued until it runs join the batch.
+	Packets to the same connection with the same reliability are sent with one send_many, so they can share datagrams. They keep the order they were queued in, also relative to broadcasts.
+	Packets queued for a connection that is closed before the batch is sent are dropped.
+	"""
+
+	def __init__(self, dispatcher: EventDispatcher, groups: BroadcastGroups, loop: Optional[asyncio.AbstractEventLoop]=None):
+		"""Must be created on the event loop's thread, or be passed the loop."""
+		self._dispatcher = dispatcher
+		self._groups = groups
+		if loop is None:
+			loop = asyncio.get_event_loop()
+		self._loop = loop
+		self._lock = threading.Lock()
+		self._pending: List[Tuple[Any, ...]] = []
+		self._scheduled = False
+		self.batches = 0
+		self.packets = 0
+		self.max_batch = 0
+		dispatcher.add_listener(ConnectionEvent.Close, self._on_close)
+
+	def send(self, conn: Connection, data: SupportsBytes, reliability: Reliability=Reliability.ReliableOrdered) -> None:
+		self._push((_SEND, conn, bytes(data), reliability))
+
+	def broadcast(self, group: Optional[Hashable], data: SupportsBytes, reliability: Reliability=Reliability.ReliableOrdered, exclude: Container[Connection]=()) -> None:
+		"""Send data to the members of group, or to every connection if group is None, except the ones in exclude."""
+		self._push((_BROADCAST, group, bytes(data), reliability, exclude))
+
+	def pending(self) -> int:
+		with self._lock:
+			return len(self._pending)
+
+	def get_stats(self) -> Dict[str, int]:
+		return {
+			"pending": self.pending(),
+			"batches": self.batches,
+			"packets": self.packets,
+			"max_batch": self.max_batch,
+		}
+
+	def _push(self, entry: Tuple[Any, ...]) -> None:
+		with self._lock:
+			self._pending.append(entry)
+			if self._scheduled:
+				return
+			self._scheduled = True
+		self._loop.call_soon_threadsafe(self._drain)
+
+	def _drain(self) -> None:
+		with self._lock:
+			batch, self._pending = self._pending, []
+			self._scheduled = False
+		self.batches += 1
+		self.packets += len(batch)
+		if len(batch) > self.max_batch:
+			self.max_batch = len(batch)
+		# sends are coalesced per connection and reliability until the next broadcast, which has to go out after the sends queued before it
+		sends: Dict[Tuple[Connection, Reliability], List[bytes]] = {}
+		for entry in batch:
+			if entry[0] == _SEND:
+				_, conn, data, reliability = entry
+				packets = sends.get((conn, reliability))
+				if packets is None:
+					sends[conn, reliability] = [data]
+				else:
+					packets.append(data)
+			else:
+				self._flush(sends)
+				sends = {}
+				_, group, data, reliability, exclude = entry
+				try:
+					if group is None:
+						self._dispatcher.dispatch(ConnectionEvent.Broadcast, data, reliability, exclude)
+					else:
+						self._groups.broadcast(group, data, reliability, exclude)
+				except Exception:
+					log.exception("Queued broadcast to group %r failed", group)
+		self._flush(sends)
+
+	def _flush(self, sends: Dict[Tuple[Connection, Reliability], List[bytes]]) -> None:
+		for (conn, reliability), packets in sends.items():
+			try:
+				if len(packets) == 1:
+					conn.send(packets[0], reliability)
+				else:
+					conn.send_many(packets, reliability)
+			except Exception:
+				log.exception("Queued send to %s failed", conn.get_address())
+
+	def _on_close(self, conn: Connection) -> None:
+		with self._lock:
+			self._pending = [entry for entry in self._pending if entry[0] != _SEND or entry[1] is not conn]
@@ -0,0 +1,92 @@
+"""
+Building outgoing packets without a bitstream.WriteStream per packet.
+A WriteStream allocates the stream, a buffer that grows while writing and an object for every field. PacketBuilder writes byte-aligned fields with precompiled structs into one buffer, which is copied once into the finished packet.
+Use it for packets that don't need bit-level writes, like most system messages. Replicas still write to WriteStreams, since their data isn't byte-aligned.
+"""
+import struct
+from typing import Optional
+
+from .messages import Message
+
+BUFFER_SIZE = 64  # initial size of the buffer, it grows as needed
+
+_UBYTE = struct.Struct("<B")
+_USHORT = struct.Struct("<H")
+_UINT = struct.Struct("<I")
+_UINT64 = struct.Struct("<Q")
+_FLOAT = struct.Struct("<f")
+
+class PacketBuilder:
+	"""
+	Writes a packet into a buffer. Fields are little endian, like bitstream's.
+	Pass the builder to Connection.send, send_many or broadcast (or call bytes() on it): the packet is copied out of the buffer once and the buffer is dropped. bytes() can be called again and returns the same packet, but writing raises RuntimeError.
+
+		out = PacketBuilder(Message.ConnectedPong)
+		out.write_uint(ping_send_time)
+		out.write_uint(0)
+		conn.send(out)
+	"""
+	__slots__ = "_buffer", "_length", "_packet"
+
+	def __init__(self, message: Optional[Message]=None):
+		buffer = bytearray(BUFFER_SIZE)
+		self._buffer: Optional[bytearray] = buffer
+		self._length = 0
+		self._packet: Optional[bytes] = None
+		if message is not None:
+			_UBYTE.pack_into(buffer, 0, message.value)
+			self._length = 1
+
+	def __len__(self) -> int:
+		if self._packet is not None:
+			return len(self._packet)
+		return self._length
+
+	def _reserve(self, length: int) -> int:
+		"""Return the offset to write length bytes at, growing the buffer if necessary."""
+		buffer = self._buffer
+		if buffer is None:
+			raise RuntimeError("the packet has already been built")
+		offset = self._length
+		end = offset + length
+		if end > len(buffer):
+			buffer.extend(bytes(max(end, 2 * len(buffer)) - len(buffer)))
+		self._length = end
+		return offset
+
+	def pack(self, struct_: struct.Struct, *values: object) -> None:
+		"""Write several fields at once with a precompiled struct."""
+		offset = self._reserve(struct_.size)
+		struct_.pack_into(self._buffer, offset, *values)
+
+	def write_ubyte(self, value: int) -> None:
+		offset = self._reserve(1)
+		_UBYTE.pack_into(self._buffer, offset, value)
+
+	def write_ushort(self, value: int) -> None:
+		offset = self._reserve(2)
+		_USHORT.pack_into(self._buffer, offset, value)
+
+	def write_uint(self, value: int) -> None:
+		offset = self._reserve(4)
+		_UINT.pack_into(self._buffer, offset, value)
+
+	def write_uint64(self, value: int) -> None:
+		offset = self._reserve(8)
+		_UINT64.pack_into(self._buffer, offset, value)
+
+	def write_float(self, value: float) -> None:
+		offset = self._reserve(4)
+		_FLOAT.pack_into(self._buffer, offset, value)
+
+	def write_bytes(self, data: bytes) -> None:
+		offset = self._reserve(len(data))
+		self._buffer[offset:offset+len(data)] = data
+
+	def __bytes__(self) -> bytes:
+		if self._packet is None:
+			buffer = self._buffer
+			del buffer[self._length:]  # truncating in place doesn't copy, so the packet is the only copy
+			self._packet = bytes(buffer)
+			self._buffer = None
+		return self._packet
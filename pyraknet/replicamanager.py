@@ -4,24 +4,40 @@ See RakNet's ReplicaManager.
 """
 
 import logging
-from typing import Dict, Iterable, Set
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 from bitstream import c_bit, c_ubyte, c_ushort, WriteStream
 
 from .messages import Message
+from .packets import PacketBuilder
 from .server import Server
+from .snapshot import ReplicaSnapshot, write_snapshot
 from .transports.abc import Connection, ConnectionEvent
+from .transports.raknet.clock import Clock, LoopClock
 
 from event_dispatcher import EventDispatcher
 
 log = logging.getLogger(__name__)
 
+DEFAULT_BYTES_PER_SECOND = 64 * 1024  # serialization budget of a participant, see ReplicaManager.mark_changed
+MAX_TICK_ELAPSED = 0.1  # seconds of budget a tick grants at most when ticks aren't periodic
+
 class Replica:
 	"""Abstract base class for replicas (objects serialized using the replica manager system)."""
+	update_interval = 0.0  # minimum number of seconds between scheduled serializations to the same participant, see ReplicaManager.mark_changed
+
+	def priority(self, conn: Connection) -> float:
+		"""
+		How important updates of this object are to a participant, used by scheduled serialization (see ReplicaManager.mark_changed).
+		For example, the player's own character should have a high priority, far away cosmetic objects a low one.
+		"""
+		return 1
 
 	def write_construction(self, stream: WriteStream) -> None:
 		"""
 		This is where the object should write data to be sent on construction.
+		See the serialization module for compact encodings of positions and rotations.
 		"""
 		raise NotImplementedError
 
@@ -36,28 +52,55 @@ class Replica:
 		This will be called by the ReplicaManager before the destruction message is sent.
 		"""
 
+class _Schedule:
+	"""Scheduled serialization state of a participant."""
+	__slots__ = "bytes_per_second", "budget", "stale", "last_sent"
+
+	def __init__(self, bytes_per_second: float):
+		self.bytes_per_second = bytes_per_second
+		self.budget = 0.0  # bytes that may still be sent, negative if the last tick sent more than its share
+		self.stale: Dict[Replica, float] = {}  # changed replicas that haven't been sent yet, with their accumulated priority
+		self.last_sent: Dict[Replica, float] = {}
+
 class ReplicaManager:
 	"""
 	Handles broadcasting updates of objects to connected players.
 	"""
 
-	def __init__(self, dispatcher: EventDispatcher):
+	def __init__(self, dispatcher: EventDispatcher, tick_interval: Optional[float]=None, clock: Optional[Clock]=None):
+		"""If tick_interval is given, tick is called automatically every tick_interval seconds, otherwise game code has to call it."""
 		self._dispatcher = dispatcher
 		self._dispatcher.add_listener(ConnectionEvent.Close, self._on_conn_close)
-		self._participants: Set[Connection] = set()
+		self._participants: Dict[Connection, _Schedule] = {}
 		self._network_ids: Dict[Replica, int] = {}
 		self._current_network_id = 0
+		self._snapshot: Optional[ReplicaSnapshot] = None
+		self._restored: Set[int] = set()  # network ids in the snapshot that haven't been rehydrated yet
+		if clock is None:
+			clock = LoopClock()
+		self._clock = clock
+		self._last_tick = self._clock.time()
+		self._tick_interval = tick_interval
+		if tick_interval is not None:
+			self._clock.call_later(tick_interval, self._tick_periodically)
 
-	def add_participant(self, conn: Connection) -> None:
+	def add_participant(self, conn: Connection, bytes_per_second: float=DEFAULT_BYTES_PER_SECOND) -> None:
 		"""
 		Add a participant to which object updates will be broadcast to.
 		Updates won't automatically be sent to all connected players, just the ones added via this method.
 		Disconnected players will automatically be removed from the list when they disconnect.
-		Newly added players will receive construction messages for all objects are currently registered with the manager (construct has been called and destruct hasn't been called yet).
+		Newly added players will receive construction messages for all objects are currently registered with the manager (construct has been called and destruct hasn't been called yet), and for the restored objects of a snapshot (see restore).
+		bytes_per_second is the participant's budget for scheduled serializations, see mark_changed.
 		"""
-		self._participants.add(conn)
-		for obj in self._network_ids:
-			self._construct(obj, new=False, recipients=[conn])
+		self._participants[conn] = _Schedule(bytes_per_second)
+		if self._snapshot is not None:
+			constructions: List[Tuple[int, bytes]] = [(network_id, self._construction(obj)) for obj, network_id in self._network_ids.items()]
+			constructions.extend((network_id, self._snapshot.construction(network_id)) for network_id in self._restored)
+			# in network id order, which is the order the objects were constructed in, in case objects depend on earlier ones
+			constructions.sort(key=lambda item: item[0])
+			conn.send_many([data for _, data in constructions])
+		elif self._network_ids:
+			conn.send_many([self._construction(obj) for obj in self._network_ids])
 
 	def construct(self, obj: Replica, new: bool=True) -> None:
 		"""
@@ -66,26 +109,105 @@ class ReplicaManager:
 		The object is registered and participants joining later will also receive a construction message when they join (if the object hasn't been destructed in the meantime).
 		The actual content of the construction message is determined by the object's write_construction method.
 		"""
-		self._construct(obj, new)
-
-	def _construct(self, obj: Replica, new: bool=True, recipients: Iterable[Connection]=None) -> None:
-		# recipients is needed to send replicas to new participants
-		if recipients is None:
-			recipients = self._participants
-
 		if new:
 			self._network_ids[obj] = self._current_network_id
 			self._current_network_id += 1
 
+		out = self._construction(obj)
+		for conn in self._participants:
+			conn.send(out)
+
+	def construct_many(self, objs: Iterable[Replica], new: bool=True) -> None:
+		"""
+		Like calling construct for each object, but faster for many objects, e.g. when loading a zone.
+		Each construction message is only encoded once, and each participant gets all of them in one send_many call, which packs them into as few datagrams as possible.
+		"""
+		objs = list(objs)
+		if new:
+			start = self._current_network_id
+			self._network_ids.update(zip(objs, range(start, start + len(objs))))
+			self._current_network_id += len(objs)
+		messages = [self._construction(obj) for obj in objs]
+		for conn in self._participants:
+			conn.send_many(messages)
+
+	def checkpoint(self, path: str) -> None:
+		"""
+		Write the construction messages of all registered objects to a snapshot file (see the snapshot module), to be restored after a restart.
+		Objects of a restored snapshot that haven't been rehydrated yet are included as they were restored.
+		"""
+		constructions = [(network_id, self._construction(obj)) for obj, network_id in self._network_ids.items()]
+		snapshot = self._snapshot
+		if snapshot is None:
+			write_snapshot(path, constructions, self._current_network_id)
+			return
+		constructions.extend((network_id, snapshot.construction(network_id)) for network_id in self._restored)
+		if not (os.path.exists(path) and os.path.samefile(path, snapshot.path)):
+			write_snapshot(path, constructions, self._current_network_id)
+			return
+		# a mapped file can't be replaced on Windows, the new file has the same restored constructions, so map that one instead
+		snapshot.close()
+		try:
+			write_snapshot(path, constructions, self._current_network_id)
+		finally:
+			self._snapshot = ReplicaSnapshot(path)
+
+	def restore(self, path: str) -> None:
+		"""
+		Load a snapshot written by checkpoint, e.g. when a zone server restarts. Must be called before any objects are constructed.
+		Participants added afterwards receive the snapshot's construction messages right away, without the objects having to exist or write_construction being called.
+		The game can then rebuild its objects at its own pace (see restored_ids and restored_construction) and register them with rehydrate. New objects get network ids following the snapshot's.
+		"""
+		if self._network_ids or self._snapshot is not None:
+			raise RuntimeError("snapshots can only be restored into an empty manager")
+		self._snapshot = ReplicaSnapshot(path)
+		self._restored = set(self._snapshot.network_ids())
+		self._current_network_id = self._snapshot.next_network_id
+		if not self._restored:
+			self._close_snapshot()
+
+	def restored_ids(self) -> List[int]:
+		"""Return the network ids of the restored objects that haven't been rehydrated or discarded yet, in construction order."""
+		return sorted(self._restored)
+
+	def restored_construction(self, network_id: int) -> bytes:
+		"""Return the construction message the restored object was checkpointed with, e.g. to rebuild the object from. Raise KeyError if it isn't waiting to be rehydrated."""
+		if network_id not in self._restored:
+			raise KeyError(network_id)
+		return self._snapshot.construction(network_id)
+
+	def rehydrate(self, obj: Replica, network_id: int) -> None:
+		"""
+		Register a rebuilt object under the network id it had in the snapshot. Raise KeyError if that id isn't waiting to be rehydrated.
+		Nothing is sent, since participants already have the object. If its state differs from the snapshot, serialize it or mark it as changed.
+		"""
+		self._restored.remove(network_id)
+		self._network_ids[obj] = network_id
+		if not self._restored:
+			self._close_snapshot()
+
+	def discard_restored(self, network_id: int) -> None:
+		"""Send a destruction message for a restored object that won't be rehydrated, e.g. because it expired during the restart. Raise KeyError if it isn't waiting to be rehydrated."""
+		self._restored.remove(network_id)
+		out = PacketBuilder(Message.ReplicaManagerDestruction)
+		out.write_ushort(network_id)
+		out = bytes(out)
+		for conn in self._participants:
+			conn.send(out)
+		if not self._restored:
+			self._close_snapshot()
+
+	def _close_snapshot(self) -> None:
+		self._snapshot.close()
+		self._snapshot = None
+
+	def _construction(self, obj: Replica) -> bytes:
 		out = WriteStream()
 		out.write(c_ubyte(Message.ReplicaManagerConstruction.value))
 		out.write(c_bit(True))
 		out.write(c_ushort(self._network_ids[obj]))
 		obj.write_construction(out)
-
-		out = bytes(out)
-		for conn in recipients:
-			conn.send(out)
+		return bytes(out)
 
 	def serialize(self, obj: Replica) -> None:
 		"""
@@ -94,14 +216,64 @@ class ReplicaManager:
 		The actual content of the serialization message is determined by the object's serialize method.
 		Note that the manager does not automatically send a serialization message when some part of your object changes - you have to call this function explicitly.
 		"""
+		out = self._serialization(obj)
+		now = self._clock.time()
+		for conn, schedule in self._participants.items():
+			conn.send(out)
+			schedule.stale.pop(obj, None)
+			schedule.last_sent[obj] = now
+
+	def _serialization(self, obj: Replica) -> bytes:
 		out = WriteStream()
 		out.write(c_ubyte(Message.ReplicaManagerSerialize.value))
 		out.write(c_ushort(self._network_ids[obj]))
 		obj.serialize(out)
+		return bytes(out)
 
-		out = bytes(out)
-		for conn in self._participants:
-			conn.send(out)
+	def mark_changed(self, obj: Replica) -> None:
+		"""
+		Schedule a serialization message to participants, to be sent by tick.
+
+		Unlike serialize, this doesn't send anything right away. Each tick, the changed objects are sent to each participant in order of priority (see Replica.priority) until the participant's byte budget for the tick is used up.
+		Objects that didn't fit have their priority added up over the ticks, so that low priority objects are sent eventually too. Objects aren't sent to a participant more often than their update_interval.
+		Since a participant may skip updates that other participants got, serialize should write the object's full state (or at least everything that's needed after missed updates).
+		Marking an object again before it has been sent doesn't send it twice.
+		"""
+		for schedule in self._participants.values():
+			schedule.stale.setdefault(obj, 0.0)
+
+	def tick(self) -> None:
+		"""Send scheduled serializations, see mark_changed."""
+		now = self._clock.time()
+		# unused budget doesn't carry over, otherwise a long idle period would allow a huge burst
+		elapsed = min(now - self._last_tick, self._tick_interval if self._tick_interval is not None else MAX_TICK_ELAPSED)
+		self._last_tick = now
+		serialized: Dict[Replica, bytes] = {}  # each object is only serialized once per tick
+		for conn, schedule in self._participants.items():
+			schedule.budget = min(schedule.budget, 0) + schedule.bytes_per_second * elapsed
+			if not schedule.stale:
+				continue
+			due = []
+			for obj, priority in schedule.stale.items():
+				if now - schedule.last_sent.get(obj, float("-inf")) >= obj.update_interval:
+					priority += obj.priority(conn)
+					schedule.stale[obj] = priority
+					due.append((priority, obj))
+			due.sort(key=lambda item: item[0], reverse=True)
+			for _, obj in due:
+				if schedule.budget <= 0:
+					break
+				if obj not in serialized:
+					serialized[obj] = self._serialization(obj)
+				out = serialized[obj]
+				conn.send(out)
+				schedule.budget -= len(out)
+				del schedule.stale[obj]
+				schedule.last_sent[obj] = now
+
+	def _tick_periodically(self) -> None:
+		self.tick()
+		self._clock.call_later(self._tick_interval, self._tick_periodically)
 
 	def destruct(self, obj: Replica) -> None:
 		"""
@@ -112,15 +284,33 @@ class ReplicaManager:
 		"""
 		log.debug("destructing %s", obj)
 		obj.on_destruction()
-		out = WriteStream()
-		out.write(c_ubyte(Message.ReplicaManagerDestruction.value))
-		out.write(c_ushort(self._network_ids[obj]))
-
-		out = bytes(out)
+		out = self._destruction(obj)
 		for conn in self._participants:
 			conn.send(out)
+		self._forget(obj)
+
+	def destruct_many(self, objs: Iterable[Replica]) -> None:
+		"""Like calling destruct for each object, but faster for many objects, e.g. when unloading a zone. See construct_many."""
+		objs = list(objs)
+		messages: List[bytes] = []
+		for obj in objs:
+			obj.on_destruction()
+			messages.append(self._destruction(obj))
+		for conn in self._participants:
+			conn.send_many(messages)
+		for obj in objs:
+			self._forget(obj)
+
+	def _destruction(self, obj: Replica) -> bytes:
+		out = PacketBuilder(Message.ReplicaManagerDestruction)
+		out.write_ushort(self._network_ids[obj])
+		return bytes(out)
 
+	def _forget(self, obj: Replica) -> None:
 		del self._network_ids[obj]
+		for schedule in self._participants.values():
+			schedule.stale.pop(obj, None)
+			schedule.last_sent.pop(obj, None)
 
 	def _on_conn_close(self, conn: Connection) -> None:
-		self._participants.discard(conn)
+		self._participants.pop(conn, None)
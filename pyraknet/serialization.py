@@ -0,0 +1,207 @@
+"""
+Compact encodings of floats, vectors and quaternions, for use in Replica.write_construction and Replica.serialize.
+
+The write_compressed_*, *_vector and *_norm_quat functions produce the same bits as the corresponding RakNet BitStream methods, so they can be read by RakNet clients.
+QuantizedFloat and QuantizedQuaternion are configurable encodings for when both ends are under your control, and usually need fewer bits for the same precision.
+Except for write_vector, whose precision depends on the magnitude, decoding an encoded value and encoding it again gives the same bits, so decoded values (or quantize) can be used to make the server's state match what clients see.
+"""
+import math
+from typing import Tuple
+
+from bitstream import c_bit, c_float, c_uint, c_ushort, ReadStream, WriteStream
+
+Vector = Tuple[float, float, float]
+Quaternion = Tuple[float, float, float, float]  # w, x, y, z
+
+# RakNet truncates when encoding. Without some slack, the float error of a decoded value could make it truncate to the next lower integer when it's encoded again.
+_TRUNCATION_SLACK = 1e-6  # in steps
+
+def write_compressed_float(stream: WriteStream, value: float) -> None:
+	"""Write a float in [-1, 1] in 16 bits, like RakNet's WriteCompressed(float). Values outside the range are clamped."""
+	value = min(max(value, -1.0), 1.0)
+	stream.write(c_ushort(int((value + 1.0) * 32767.5 + _TRUNCATION_SLACK)))
+
+def read_compressed_float(stream: ReadStream) -> float:
+	return stream.read(c_ushort) / 32767.5 - 1.0
+
+def write_compressed_double(stream: WriteStream, value: float) -> None:
+	"""Write a double in [-1, 1] in 32 bits, like RakNet's WriteCompressed(double). Values outside the range are clamped."""
+	value = min(max(value, -1.0), 1.0)
+	stream.write(c_uint(min(int((value + 1.0) * 2147483648.0), 0xffffffff)))
+
+def read_compressed_double(stream: ReadStream) -> float:
+	return stream.read(c_uint) / 2147483648.0 - 1.0
+
+def write_vector(stream: WriteStream, x: float, y: float, z: float) -> None:
+	"""Write a vector as its magnitude and its compressed direction, like RakNet's WriteVector. Needs 80 instead of 96 bits, the precision is relative to the magnitude."""
+	magnitude = math.sqrt(x*x + y*y + z*z)
+	stream.write(c_float(magnitude))
+	if magnitude > 0.00001:
+		write_compressed_float(stream, x / magnitude)
+		write_compressed_float(stream, y / magnitude)
+		write_compressed_float(stream, z / magnitude)
+
+def read_vector(stream: ReadStream) -> Vector:
+	magnitude = stream.read(c_float)
+	if magnitude > 0.00001:
+		return read_compressed_float(stream) * magnitude, read_compressed_float(stream) * magnitude, read_compressed_float(stream) * magnitude
+	return 0.0, 0.0, 0.0
+
+def write_norm_vector(stream: WriteStream, x: float, y: float, z: float) -> None:
+	"""Write a normalized vector, like RakNet's WriteNormVector. x is only sent as a sign bit and recalculated from y and z."""
+	stream.write(c_bit(x < 0.0))
+	for value in (y, z):
+		if value == 0.0:
+			stream.write(c_bit(True))
+		else:
+			stream.write(c_bit(False))
+			write_compressed_float(stream, value)
+
+def read_norm_vector(stream: ReadStream) -> Vector:
+	x_negative = stream.read(c_bit)
+	y = 0.0 if stream.read(c_bit) else read_compressed_float(stream)
+	z = 0.0 if stream.read(c_bit) else read_compressed_float(stream)
+	x = math.sqrt(max(1.0 - y*y - z*z, 0.0))
+	if x_negative:
+		x = -x
+	return x, y, z
+
+def write_norm_quat(stream: WriteStream, w: float, x: float, y: float, z: float) -> None:
+	"""Write a normalized quaternion in 52 bits, like RakNet's WriteNormQuat. w is only sent as a sign bit and recalculated from the others."""
+	for value in (w, x, y, z):
+		stream.write(c_bit(value < 0.0))
+	for value in (x, y, z):
+		stream.write(c_ushort(min(int(abs(value) * 65535.0 + _TRUNCATION_SLACK), 0xffff)))
+
+def read_norm_quat(stream: ReadStream) -> Quaternion:
+	signs = [stream.read(c_bit) for _ in range(4)]
+	x, y, z = (stream.read(c_ushort) / 65535.0 for _ in range(3))
+	w = math.sqrt(max(1.0 - x*x - y*y - z*z, 0.0))
+	w, x, y, z = (-value if negative else value for value, negative in zip((w, x, y, z), signs))
+	return w, x, y, z
+
+def _write_uint(stream: WriteStream, value: int, bit_count: int) -> None:
+	"""Write the lowest bit_count bits of value, most significant bit first, using as few stream calls as possible."""
+	whole_bytes, rest = divmod(bit_count, 8)
+	if rest:
+		stream.write_bits(value >> (whole_bytes * 8), rest)
+	if whole_bytes:
+		stream.write((value & ((1 << (whole_bytes * 8)) - 1)).to_bytes(whole_bytes, "big"))
+
+def _read_uint(stream: ReadStream, bit_count: int) -> int:
+	whole_bytes, rest = divmod(bit_count, 8)
+	value = stream.read_bits(rest) if rest else 0
+	if whole_bytes:
+		value = value << (whole_bytes * 8) | int.from_bytes(stream.read(bytes, length=whole_bytes), "big")
+	return value
+
+class QuantizedFloat:
+	"""
+	Floats in [minimum, maximum], stored in bit_count bits as the nearest of 2**bit_count evenly spaced values (the ends included).
+	The maximum error is half a step, (maximum - minimum) / (2**bit_count - 1) / 2. Values outside the range are clamped.
+	"""
+	__slots__ = "minimum", "maximum", "bit_count", "_max_int", "_step"
+
+	def __init__(self, minimum: float, maximum: float, bit_count: int):
+		if not minimum < maximum:
+			raise ValueError("minimum must be lower than maximum")
+		if bit_count < 1:
+			raise ValueError("bit_count must be positive")
+		self.minimum = minimum
+		self.maximum = maximum
+		self.bit_count = bit_count
+		self._max_int = (1 << bit_count) - 1
+		self._step = (maximum - minimum) / self._max_int
+
+	def to_int(self, value: float) -> int:
+		if value <= self.minimum:
+			return 0
+		if value >= self.maximum:
+			return self._max_int
+		return int((value - self.minimum) / self._step + 0.5)
+
+	def from_int(self, value: int) -> float:
+		return self.minimum + value * self._step
+
+	def quantize(self, value: float) -> float:
+		"""Return the value that will be received when value is sent."""
+		return self.from_int(self.to_int(value))
+
+	def write(self, stream: WriteStream, value: float) -> None:
+		_write_uint(stream, self.to_int(value), self.bit_count)
+
+	def read(self, stream: ReadStream) -> float:
+		return self.from_int(_read_uint(stream, self.bit_count))
+
+	def write_vector(self, stream: WriteStream, x: float, y: float, z: float) -> None:
+		"""Write three values (with the same range and precision), in one go."""
+		bit_count = self.bit_count
+		_write_uint(stream, (self.to_int(x) << bit_count | self.to_int(y)) << bit_count | self.to_int(z), 3 * bit_count)
+
+	def read_vector(self, stream: ReadStream) -> Vector:
+		bit_count = self.bit_count
+		value = _read_uint(stream, 3 * bit_count)
+		return self.from_int(value >> (2 * bit_count)), self.from_int(value >> bit_count & self._max_int), self.from_int(value & self._max_int)
+
+class QuantizedQuaternion:
+	"""
+	Normalized quaternions stored with the smallest three method in 2 + 3 * bit_count bits.
+	The component with the largest absolute value is left out and recalculated from the others, which makes the others lie in [-1/sqrt(2), 1/sqrt(2)].
+	Since q and -q are the same rotation, the quaternion is negated if needed so that the left out component is positive.
+	With the default 10 bits per component, a rotation is sent in 32 bits with a maximum component error of about 0.002.
+	"""
+	__slots__ = "bit_count", "_component"
+
+	def __init__(self, bit_count: int=10):
+		self.bit_count = bit_count
+		self._component = QuantizedFloat(-math.sqrt(0.5), math.sqrt(0.5), bit_count)
+
+	def to_int(self, w: float, x: float, y: float, z: float) -> int:
+		components: Quaternion = (w, x, y, z)
+		for _ in range(4):
+			value, stable = self._encode(components)
+			if stable:
+				break
+			# the two largest components are nearly equal and the left out one would be decoded as the smaller one, so the received quaternion would be encoded differently when it's sent again
+			# encode the decoded quaternion instead, which leaves out the component that's the largest after decoding
+			components = self.from_int(value)
+		return value
+
+	def _encode(self, components: Quaternion) -> Tuple[int, bool]:
+		"""Return the encoding, and whether the left out component is still the largest one after decoding."""
+		largest = max(range(4), key=lambda index: abs(components[index]))
+		sign = -1.0 if components[largest] < 0.0 else 1.0
+		to_int = self._component.to_int
+		from_int = self._component.from_int
+		value = largest
+		sum_squares = 0.0
+		max_square = 0.0
+		for index in range(4):
+			if index != largest:
+				quantized = to_int(components[index] * sign)
+				value = value << self.bit_count | quantized
+				square = from_int(quantized) ** 2
+				sum_squares += square
+				if square > max_square:
+					max_square = square
+		return value, 1.0 - sum_squares >= max_square
+
+	def from_int(self, value: int) -> Quaternion:
+		bit_count = self.bit_count
+		mask = (1 << bit_count) - 1
+		from_int = self._component.from_int
+		others = [from_int(value >> shift & mask) for shift in (2 * bit_count, bit_count, 0)]
+		largest = value >> (3 * bit_count)
+		others.insert(largest, math.sqrt(max(1.0 - sum(other * other for other in others), 0.0)))
+		w, x, y, z = others
+		return w, x, y, z
+
+	def quantize(self, w: float, x: float, y: float, z: float) -> Quaternion:
+		"""Return the quaternion that will be received when this one is sent."""
+		return self.from_int(self.to_int(w, x, y, z))
+
+	def write(self, stream: WriteStream, w: float, x: float, y: float, z: float) -> None:
+		_write_uint(stream, self.to_int(w, x, y, z), 2 + 3 * self.bit_count)
+
+	def read(self, stream: ReadStream) -> Quaternion:
+		return self.from_int(_read_uint(stream, 2 + 3 * self.bit_count))
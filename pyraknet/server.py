@@ -2,13 +2,19 @@ import asyncio
 import logging
 import socket
 import time
+from concurrent.futures import Executor
 from ssl import SSLContext
-from typing import Optional
+from typing import Any, Container, Dict, Hashable, Optional, SupportsBytes
 
-from bitstream import c_ubyte, c_uint, c_ushort, ReadStream, WriteStream
+from bitstream import c_uint, ReadStream
 
+from .groups import BroadcastGroups
+from .instrumentation import Instrumentation
 from .logger import PacketLogger
 from .messages import Address, Message
+from .offload import OffloadedListener, Offloader
+from .outbound import ThreadsafeSendQueue
+from .packets import PacketBuilder
 from .transports.abc import Connection, ConnectionEvent, Reliability
 from .transports.raknet.transport import RaknetTransport
 from .transports.tcpudp.transport import TCPUDPTransport
@@ -18,7 +24,13 @@ from event_dispatcher import EventDispatcher
 log = logging.getLogger(__name__)
 
 class Server:
-	def __init__(self, address: Address, max_connections: int, incoming_password: bytes, ssl: Optional[SSLContext], dispatcher=None, excluded_packets=None):
+	def __init__(self, address: Address, max_connections: int, incoming_password: bytes, ssl: Optional[SSLContext], dispatcher=None, excluded_packets=None, raknet_options: Optional[Dict[str, Any]]=None, instrumentation: Optional[Instrumentation]=None, tcpudp_options: Optional[Dict[str, Any]]=None):
+		"""
+		raknet_options are passed on to every RaknetConnection of this server, see RaknetConnection's keyword arguments.
+		For example, to use delay-based congestion control: raknet_options={"congestion_control": DelayCongestionControl}
+		tcpudp_options are passed on to TCPUDPTransport, e.g. tcpudp_options={"compression": Compression(dictionary=...)} to let clients negotiate compressed reliable frames.
+		If instrumentation is given, every received and sent packet is recorded in it, including the time the listeners took.
+		"""
 		host, port = address
 		if host == "localhost":
 			host = "127.0.0.1"
@@ -34,8 +46,14 @@ class Server:
 		self._dispatcher.add_listener(Message.ConnectionRequest, self._on_connection_request)
 		self._dispatcher.add_listener(Message.NewIncomingConnection, self._on_new_connection)
 		self._dispatcher.add_listener(Message.InternalPing, self._on_internal_ping)
+		self._instrumentation = instrumentation
+		if instrumentation is not None:
+			self._dispatcher.add_listener(ConnectionEvent.Send, lambda data, conn: instrumentation.record_sent(data))
 
 		self._start_time = int(time.perf_counter() * 1000)
+		self._offloaders: Dict[Optional[Executor], Offloader] = {}
+		self._groups = BroadcastGroups(self._dispatcher)
+		self._outbound = ThreadsafeSendQueue(self._dispatcher, self._groups)
 
 		if port == 1001:
 			tcp_udp_port = 21836
@@ -43,30 +61,81 @@ class Server:
 			tcp_udp_port = port + 1
 		else:
 			tcp_udp_port = 0
-		TCPUDPTransport((host, tcp_udp_port), max_connections, self._dispatcher, ssl)
-		RaknetTransport(self._address, max_connections, self._dispatcher)
+		if tcpudp_options is None:
+			tcpudp_options = {}
+		TCPUDPTransport((host, tcp_udp_port), max_connections, self._dispatcher, ssl, **tcpudp_options)
+		if raknet_options is None:
+			raknet_options = {}
+		RaknetTransport(self._address, max_connections, self._dispatcher, **raknet_options)
 
 		log.info("Started up")
 
+	def add_offloaded_listener(self, message: Message, listener: OffloadedListener, executor: Optional[Executor]=None) -> None:
+		"""
+		Register a listener for message that runs on executor (the event loop's default thread pool if None) instead of blocking the network loop.
+		The listener is called with the packet data as bytes and the connection's address, and can return data to send back. See offload.Offloader for details.
+		Packets of a connection are handled in order across all listeners that share an executor.
+		"""
+		if executor not in self._offloaders:
+			self._offloaders[executor] = Offloader(self._dispatcher, executor)
+		self._offloaders[executor].add_listener(message, listener)
+
+	def create_group(self, group: Hashable) -> None:
+		"""Create a broadcast group, e.g. for a zone, party or chat channel. See groups.BroadcastGroups."""
+		self._groups.create(group)
+
+	def delete_group(self, group: Hashable) -> None:
+		self._groups.delete(group)
+
+	def join_group(self, group: Hashable, conn: Connection) -> None:
+		"""Add the connection to the group. Connections are removed from their groups automatically when they're closed."""
+		self._groups.join(group, conn)
+
+	def leave_group(self, group: Hashable, conn: Connection) -> None:
+		self._groups.leave(group, conn)
+
+	def broadcast(self, group: Hashable, data: SupportsBytes, reliability: Reliability=Reliability.ReliableOrdered, exclude: Container[Connection]=()) -> None:
+		"""Send data to the members of the group, except the ones in exclude."""
+		self._groups.broadcast(group, data, reliability, exclude)
+
+	def send_threadsafe(self, conn: Connection, data: SupportsBytes, reliability: Reliability=Reliability.ReliableOrdered) -> None:
+		"""
+		Send data to the connection from any thread. Connection.send may only be called on the event loop's thread.
+		Packets queued from other threads are sent in batches, waking the loop once per batch, see outbound.ThreadsafeSendQueue.
+		"""
+		self._outbound.send(conn, data, reliability)
+
+	def broadcast_threadsafe(self, group: Optional[Hashable], data: SupportsBytes, reliability: Reliability=Reliability.ReliableOrdered, exclude: Container[Connection]=()) -> None:
+		"""Like broadcast, but can be called from any thread. If group is None, data is sent to every connection."""
+		self._outbound.broadcast(group, data, reliability, exclude)
+
 	def _on_packet(self, data: bytes, conn: Connection) -> None:
+		if self._instrumentation is not None:
+			start = time.perf_counter()
+			self._dispatch_packet(data, conn)
+			self._instrumentation.record_received(data, time.perf_counter() - start)
+		else:
+			self._dispatch_packet(data, conn)
+
+	def _dispatch_packet(self, data: bytes, conn: Connection) -> None:
 		message = Message(data[0])
 		if message != Message.UserPacket:
 			args = lambda: ((ReadStream(data[1:]), conn), {})
 			self._dispatcher.dispatch_callable(message, args)
 		else:
-			self._dispatcher.dispatch(Message.UserPacket, data[1:], conn)
+			# data may be a view into a receive buffer, user packet listeners get their own copy
+			self._dispatcher.dispatch(Message.UserPacket, bytes(data[1:]), conn)
 
 	def _on_connection_request(self, data: ReadStream, conn: Connection) -> None:
 		packet_password = data.read_remaining()
 		if packet_password == self._incoming_password:
 			address = conn.get_address()
-			response = WriteStream()
-			response.write(c_ubyte(Message.ConnectionRequestAccepted.value))
-			response.write(socket.inet_aton(address[0]))
-			response.write(c_ushort(address[1]))
-			response.write(bytes(2))  # Connection index, seems like this was right out ignored in RakNet
-			response.write(socket.inet_aton(self._address[0]))
-			response.write(c_ushort(self._address[1]))
+			response = PacketBuilder(Message.ConnectionRequestAccepted)
+			response.write_bytes(socket.inet_aton(address[0]))
+			response.write_ushort(address[1])
+			response.write_ushort(0)  # Connection index, seems like this was right out ignored in RakNet
+			response.write_bytes(socket.inet_aton(self._address[0]))
+			response.write_ushort(self._address[1])
 			conn.send(response, reliability=Reliability.Reliable)
 		else:
 			conn.close()
@@ -78,8 +147,7 @@ class Server:
 	def _on_internal_ping(self, data: ReadStream, conn: Connection) -> None:
 		ping_send_time = data.read(c_uint)
 
-		pong = WriteStream()
-		pong.write(c_ubyte(Message.ConnectedPong.value))
-		pong.write(c_uint(ping_send_time))
-		pong.write(c_uint(int(0)))
+		pong = PacketBuilder(Message.ConnectedPong)
+		pong.write_uint(ping_send_time)
+		pong.write_uint(0)
 		conn.send(pong)
@@ -0,0 +1,91 @@
+"""
+Snapshots of the replicas registered with a ReplicaManager, so that a restarted zone server can serve constructions before its game objects have been rebuilt.
+A snapshot file holds the network id and the encoded construction message of every replica. It's memory-mapped when restored, so opening it only reads the index, and constructions are read from the page cache when a participant joins.
+
+The format (all fields little endian):
+	header: magic b"PRKS", version (ushort), number of replicas (uint), next network id (uint)
+	index: network id (ushort), offset (uint), length (uint) for every replica, in network id order
+	the construction messages, at their offsets from the start of the file
+"""
+import mmap
+import os
+import struct
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+MAGIC = b"PRKS"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHII")
+_ENTRY = struct.Struct("<HII")
+
+def write_snapshot(path: str, constructions: Iterable[Tuple[int, bytes]], next_network_id: int) -> None:
+	"""
+	Write the (network id, construction message) pairs to path.
+	The file is written next to path and then renamed, so a crash while checkpointing leaves the previous snapshot intact.
+	"""
+	constructions = sorted(constructions, key=lambda item: item[0])
+	offset = _HEADER.size + len(constructions) * _ENTRY.size
+	index = bytearray(_HEADER.pack(MAGIC, VERSION, len(constructions), next_network_id))
+	for network_id, data in constructions:
+		index += _ENTRY.pack(network_id, offset, len(data))
+		offset += len(data)
+	temp_path = path + ".tmp"
+	with open(temp_path, "wb") as file:
+		file.write(index)
+		file.writelines(data for _, data in constructions)
+		file.flush()
+		os.fsync(file.fileno())
+	os.replace(temp_path, path)
+
+class ReplicaSnapshot:
+	"""
+	A memory-mapped snapshot file. Raise ValueError if the file isn't a snapshot of a supported version.
+	The mapping stays open until close is called, also usable as a context manager.
+	"""
+
+	def __init__(self, path: str):
+		self.path = path
+		with open(path, "rb") as file:
+			self._map: Optional[mmap.mmap] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+		try:
+			if len(self._map) < _HEADER.size:
+				raise ValueError("%s is too short for a snapshot" % path)
+			magic, version, count, self.next_network_id = _HEADER.unpack_from(self._map)
+			if magic != MAGIC or version != VERSION:
+				raise ValueError("%s is not a version %i snapshot" % (path, VERSION))
+			if _HEADER.size + count * _ENTRY.size > len(self._map):
+				raise ValueError("%s is truncated" % path)
+			self._index: Dict[int, Tuple[int, int]] = {}
+			for network_id, offset, length in _ENTRY.iter_unpack(self._map[_HEADER.size:_HEADER.size + count * _ENTRY.size]):
+				if offset + length > len(self._map):
+					raise ValueError("%s is truncated" % path)
+				self._index[network_id] = offset, length
+		except Exception:
+			self.close()
+			raise
+
+	def __len__(self) -> int:
+		return len(self._index)
+
+	def __contains__(self, network_id: int) -> bool:
+		return network_id in self._index
+
+	def network_ids(self) -> Iterator[int]:
+		"""Return the network ids of the replicas in the snapshot, in ascending order."""
+		return iter(self._index)
+
+	def construction(self, network_id: int) -> bytes:
+		"""Return the construction message of the replica. Raise KeyError if it isn't in the snapshot."""
+		offset, length = self._index[network_id]
+		return self._map[offset:offset + length]
+
+	def close(self) -> None:
+		if self._map is not None:
+			self._map.close()
+			self._map = None
+
+	def __enter__(self) -> "ReplicaSnapshot":
+		return self
+
+	def __exit__(self, *exc_info: object) -> None:
+		self.close()
@@ -0,0 +1,45 @@
+import unittest
+from unittest.mock import Mock
+
+from event_dispatcher import EventDispatcher
+
+from pyraknet.groups import BroadcastGroups
+from pyraknet.transports.abc import Connection, ConnectionEvent, Reliability
+
+class GroupsTest(unittest.TestCase):
+	def setUp(self):
+		self.dispatcher = EventDispatcher()
+		self.groups = BroadcastGroups(self.dispatcher)
+		self.conns = [Mock(spec=Connection) for _ in range(3)]
+		self.groups.create("zone")
+		self.groups.create("party")
+		for conn in self.conns:
+			self.groups.join("zone", conn)
+		self.groups.join("party", self.conns[0])
+
+	def test_broadcast(self):
+		self.groups.broadcast("party", b"\x53hi", Reliability.Reliable)
+		self.conns[0].send.assert_called_once_with(b"\x53hi", Reliability.Reliable)
+		self.conns[1].send.assert_not_called()
+		self.groups.broadcast("zone", b"\x53all", exclude={self.conns[1]})
+		self.conns[1].send.assert_not_called()
+		self.conns[2].send.assert_called_once_with(b"\x53all", Reliability.ReliableOrdered)
+
+	def test_leave(self):
+		self.groups.leave("zone", self.conns[0])
+		self.assertEqual(self.groups.members("zone"), set(self.conns[1:]))
+		self.assertEqual(self.groups.groups_of(self.conns[0]), {"party"})
+
+	def test_close(self):
+		self.dispatcher.dispatch(ConnectionEvent.Close, self.conns[0])
+		self.assertEqual(self.groups.members("zone"), set(self.conns[1:]))
+		self.assertEqual(self.groups.members("party"), set())
+		self.assertEqual(self.groups.groups_of(self.conns[0]), frozenset())
+
+	def test_delete(self):
+		self.groups.delete("zone")
+		self.assertEqual(self.groups.groups_of(self.conns[1]), frozenset())
+		with self.assertRaises(KeyError):
+			self.groups.broadcast("zone", b"\x53")
+		with self.assertRaises(ValueError):
+			self.groups.create("party")
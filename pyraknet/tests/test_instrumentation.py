@@ -0,0 +1,57 @@
+import time
+import unittest
+
+from pyraknet.instrumentation import Histogram, Instrumentation, SamplingProfiler
+
+class HistogramTest(unittest.TestCase):
+	def test_small_values_exact(self):
+		hist = Histogram()
+		for value in range(32):
+			hist.record(value)
+		self.assertEqual(hist.percentile(50), 15)
+		self.assertEqual(hist.percentile(100), 31)
+		self.assertEqual(hist.mean(), 15.5)
+
+	def test_relative_error(self):
+		for value in (32, 33, 100, 1000, 123456, 10**9):
+			hist = Histogram()
+			hist.record(value)
+			hist.record(value * 4)  # so that the bucket bound isn't clipped to the maximum
+			self.assertGreaterEqual(hist.percentile(50), value)
+			self.assertLessEqual(hist.percentile(50), value * (1 + 1/16))
+
+	def test_percentiles(self):
+		hist = Histogram()
+		for value in range(1, 10001):
+			hist.record(value)
+		self.assertAlmostEqual(hist.percentile(50), 5000, delta=5000/16)
+		self.assertAlmostEqual(hist.percentile(99), 9900, delta=9900/16)
+		self.assertEqual(hist.max, 10000)
+		self.assertEqual(hist.count, 10000)
+
+class InstrumentationTest(unittest.TestCase):
+	def test_record(self):
+		instrumentation = Instrumentation(user_packet_key=lambda data: "User %i" % data[0], loop_lag_interval=None)
+		instrumentation.record_received(b"\x53\x01abc", 0.002)
+		instrumentation.record_received(b"\x53\x01de", 0.004)
+		instrumentation.record_received(b"\x00ping", 0.001)
+		instrumentation.record_sent(b"\x53\x02x")
+		user = instrumentation.received["User 1"]
+		self.assertEqual(user.count, 2)
+		self.assertEqual(user.bytes, 9)
+		self.assertEqual(user.handler_time.max, 4000)
+		self.assertEqual(instrumentation.received["InternalPing"].count, 1)
+		self.assertEqual(instrumentation.sent["User 2"].bytes, 3)
+		report = instrumentation.report()
+		self.assertLess(report.index("User 1"), report.index("InternalPing"))
+
+class SamplingProfilerTest(unittest.TestCase):
+	def test_samples_busy_thread(self):
+		profiler = SamplingProfiler(interval=0.001)
+		profiler.start()
+		end = time.perf_counter() + 0.1
+		while time.perf_counter() < end:
+			pass
+		profiler.stop()
+		self.assertGreater(sum(profiler.samples.values()), 0)
+		self.assertIn("test_samples_busy_thread", profiler.top(1)[0][0])
@@ -0,0 +1,19 @@
+import unittest
+
+from pyraknet.benchmarks.memory import measure, raknet_connection, tcpudp_connection
+
+# Generous limits, these are meant to catch per-connection buffers being allocated up front again, not small changes
+RAKNET_IDLE_LIMIT = 3000
+RAKNET_ACTIVE_LIMIT = 4000
+TCPUDP_IDLE_LIMIT = 1000
+COUNT = 200
+
+class MemoryTest(unittest.TestCase):
+	def test_raknet_idle(self):
+		self.assertLess(measure(raknet_connection(False, COUNT), COUNT), RAKNET_IDLE_LIMIT)
+
+	def test_raknet_active(self):
+		self.assertLess(measure(raknet_connection(True, COUNT), COUNT), RAKNET_ACTIVE_LIMIT)
+
+	def test_tcpudp_idle(self):
+		self.assertLess(measure(tcpudp_connection(False, COUNT), COUNT), TCPUDP_IDLE_LIMIT)
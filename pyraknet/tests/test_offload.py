@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import Mock
+
+from event_dispatcher import EventDispatcher
+
+from pyraknet.messages import Message
+from pyraknet.offload import Offloader
+from pyraknet.transports.abc import ConnectionEvent
+from pyraknet.transports.raknet.clock import VirtualClock
+from pyraknet.transports.raknet.connection import RaknetConnection
+
+class OffloaderTest(unittest.TestCase):
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		asyncio.set_event_loop(self.loop)
+		self.dispatcher = EventDispatcher()
+		self.offloader = Offloader(self.dispatcher, max_pending=4)
+		self.conn = Mock()
+		self.conn.get_address.return_value = ("127.0.0.1", 1234)
+
+	def tearDown(self):
+		self.loop.close()
+		asyncio.set_event_loop(asyncio.new_event_loop())  # other tests use the current loop
+
+	def run_until(self, condition, timeout=5):
+		end = time.perf_counter() + timeout
+		while not condition():
+			self.assertLess(time.perf_counter(), end)
+			self.loop.run_until_complete(asyncio.sleep(0.001))
+
+	def test_order_and_replies(self):
+		threads = set()
+		def echo(data, address):
+			threads.add(threading.get_ident())
+			time.sleep(0.001)
+			return b"re:" + data
+		self.offloader.add_listener(Message.UserPacket, echo)
+		for i in range(10):
+			self.dispatcher.dispatch(Message.UserPacket, bytes([i]), self.conn)
+		self.run_until(lambda: self.conn.send.call_count == 10)
+		self.assertEqual([call[0][0] for call in self.conn.send.call_args_list], [b"re:" + bytes([i]) for i in range(10)])
+		self.assertNotIn(threading.get_ident(), threads)
+		self.assertEqual(self.offloader.pending(), 0)
+
+	def test_backpressure(self):
+		release = threading.Event()
+		self.offloader.add_listener(Message.UserPacket, lambda data, address: release.wait())
+		for i in range(5):
+			self.dispatcher.dispatch(Message.UserPacket, bytes([i]), self.conn)
+		self.conn.pause_receiving.assert_called_once_with()
+		self.assertEqual(self.offloader.pauses, 1)
+		release.set()
+		self.run_until(lambda: self.offloader.pending() == 0)
+		self.conn.resume_receiving.assert_called_once_with()
+
+	def test_backpressure_other_offloader(self):
+		conn = RaknetConnection(Mock(), self.dispatcher, ("127.0.0.1", 1234), clock=VirtualClock())
+		other = Offloader(self.dispatcher, max_pending=4)
+		release = threading.Event()
+		other_release = threading.Event()
+		self.offloader.add_listener(Message.UserPacket, lambda data, address: release.wait())
+		other.add_listener(Message.InternalPing, lambda data, address: other_release.wait())
+		for i in range(5):
+			self.dispatcher.dispatch(Message.UserPacket, bytes([i]), conn)
+			self.dispatcher.dispatch(Message.InternalPing, bytes([i]), conn)
+		self.assertEqual(conn._receiving_paused, 2)
+		release.set()
+		self.run_until(lambda: self.offloader.pending() == 0)
+		self.assertEqual(conn._receiving_paused, 1)  # the other offloader is still full
+		other_release.set()
+		self.run_until(lambda: other.pending() == 0)
+		self.assertEqual(conn._receiving_paused, 0)
+
+	def test_close_drops_pending(self):
+		release = threading.Event()
+		handled = []
+		def listener(data, address):
+			release.wait()
+			handled.append(data)
+		self.offloader.add_listener(Message.UserPacket, listener)
+		for i in range(3):
+			self.dispatcher.dispatch(Message.UserPacket, bytes([i]), self.conn)
+		self.dispatcher.dispatch(ConnectionEvent.Close, self.conn)
+		release.set()
+		self.loop.run_until_complete(asyncio.sleep(0.05))
+		self.assertEqual(handled, [b"\x00"])
+
+	def test_exception(self):
+		def listener(data, address):
+			if data == b"\x00":
+				raise ValueError
+			return data
+		self.offloader.add_listener(Message.UserPacket, listener)
+		self.dispatcher.dispatch(Message.UserPacket, b"\x00", self.conn)
+		self.dispatcher.dispatch(Message.UserPacket, b"\x01", self.conn)
+		with self.assertLogs("pyraknet.offload"):
+			self.run_until(lambda: self.conn.send.called)
+		self.conn.send.assert_called_once_with(b"\x01")
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import Mock
+
+from event_dispatcher import EventDispatcher
+
+from pyraknet.groups import BroadcastGroups
+from pyraknet.outbound import ThreadsafeSendQueue
+from pyraknet.transports.abc import Connection, ConnectionEvent, Reliability
+
+class _Connection(Connection):
+	def __init__(self, dispatcher, port):
+		super().__init__(dispatcher)
+		self.port = port
+		self.sent = []
+
+	def get_address(self):
+		return ("127.0.0.1", self.port)
+
+	def _send(self, data, reliability):
+		self.sent.append((data, reliability))
+
+class ThreadsafeSendQueueTest(unittest.TestCase):
+	def setUp(self):
+		self.loop = asyncio.new_event_loop()
+		self.dispatcher = EventDispatcher()
+		self.groups = BroadcastGroups(self.dispatcher)
+		self.queue = ThreadsafeSendQueue(self.dispatcher, self.groups, self.loop)
+		self.a = _Connection(self.dispatcher, 1)
+		self.b = _Connection(self.dispatcher, 2)
+
+	def tearDown(self):
+		self.loop.close()
+
+	def run_loop(self):
+		self.loop.run_until_complete(asyncio.sleep(0))
+
+	def test_batch(self):
+		self.loop.call_soon_threadsafe = Mock(wraps=self.loop.call_soon_threadsafe)
+		self.queue.send(self.a, b"\x53a")
+		self.queue.send(self.b, b"\x53b")
+		self.queue.send(self.a, b"\x53c")
+		self.assertEqual(self.a.sent, [])
+		self.assertEqual(self.queue.pending(), 3)
+		self.assertEqual(self.loop.call_soon_threadsafe.call_count, 1)
+		self.run_loop()
+		self.assertEqual(self.a.sent, [(b"\x53a", Reliability.ReliableOrdered), (b"\x53c", Reliability.ReliableOrdered)])
+		self.assertEqual(self.b.sent, [(b"\x53b", Reliability.ReliableOrdered)])
+		self.assertEqual(self.queue.get_stats(), {"pending": 0, "batches": 1, "packets": 3, "max_batch": 3})
+		# the next packet starts a new batch
+		self.queue.send(self.a, b"\x53d")
+		self.assertEqual(self.loop.call_soon_threadsafe.call_count, 2)
+		self.run_loop()
+		self.assertEqual(self.queue.batches, 2)
+
+	def test_coalesced(self):
+		self.a.send_many = Mock()
+		self.queue.send(self.a, b"\x53a")
+		self.queue.send(self.a, b"\x53b", Reliability.Unreliable)
+		self.queue.send(self.a, b"\x53c")
+		self.run_loop()
+		self.a.send_many.assert_called_once_with([b"\x53a", b"\x53c"], Reliability.ReliableOrdered)
+		self.assertEqual(self.a.sent, [(b"\x53b", Reliability.Unreliable)])
+
+	def test_broadcast(self):
+		self.groups.create("zone")
+		self.groups.join("zone", self.a)
+		self.queue.send(self.a, b"\x53first")
+		self.queue.broadcast("zone", b"\x53zone")
+		self.queue.broadcast(None, b"\x53all", exclude=(self.b,))
+		self.queue.broadcast(None, b"\x53everyone", Reliability.Reliable)
+		self.run_loop()
+		self.assertEqual([data for data, _ in self.a.sent], [b"\x53first", b"\x53zone", b"\x53all", b"\x53everyone"])
+		self.assertEqual(self.b.sent, [(b"\x53everyone", Reliability.Reliable)])
+
+	def test_unknown_group(self):
+		self.queue.broadcast("deleted", b"\x53lost")
+		self.queue.send(self.a, b"\x53a")
+		with self.assertLogs("pyraknet.outbound"):
+			self.run_loop()
+		self.assertEqual(self.a.sent, [(b"\x53a", Reliability.ReliableOrdered)])
+
+	def test_closed(self):
+		self.queue.send(self.a, b"\x53a")
+		self.queue.send(self.b, b"\x53b")
+		self.dispatcher.dispatch(ConnectionEvent.Close, self.a)
+		self.run_loop()
+		self.assertEqual(self.a.sent, [])
+		self.assertEqual(self.b.sent, [(b"\x53b", Reliability.ReliableOrdered)])
+
+	def test_threads(self):
+		count = 1000
+
+		def worker(conn):
+			for i in range(count):
+				self.queue.send(conn, i.to_bytes(2, "little"))
+		threads = [threading.Thread(target=worker, args=(conn,)) for conn in (self.a, self.b)]
+		for thread in threads:
+			thread.start()
+
+		async def wait():
+			while any(thread.is_alive() for thread in threads) or self.queue.pending():
+				await asyncio.sleep(0.001)
+		self.loop.run_until_complete(wait())
+		for conn in (self.a, self.b):
+			self.assertEqual([data for data, _ in conn.sent], [i.to_bytes(2, "little") for i in range(count)])
+		self.assertLessEqual(self.queue.batches, 2 * count)
@@ -0,0 +1,63 @@
+import struct
+import unittest
+from unittest.mock import Mock
+
+from bitstream import c_float, c_ubyte, c_uint, c_uint64, c_ushort, WriteStream
+from event_dispatcher import EventDispatcher
+
+from pyraknet.messages import Message
+from pyraknet.packets import PacketBuilder
+from pyraknet.transports.abc import Connection, ConnectionEvent
+
+class _Connection(Connection):
+	def _send(self, data, reliability):
+		pass
+
+class PacketBuilderTest(unittest.TestCase):
+	def test_fields(self):
+		out = PacketBuilder(Message.ConnectedPong)
+		out.write_ubyte(1)
+		out.write_ushort(2)
+		out.write_uint(3)
+		out.write_uint64(4)
+		out.write_float(0.5)
+		out.write_bytes(b"abc")
+		out.pack(struct.Struct("<HB"), 5, 6)
+		expected = WriteStream()
+		expected.write(c_ubyte(Message.ConnectedPong.value))
+		expected.write(c_ubyte(1))
+		expected.write(c_ushort(2))
+		expected.write(c_uint(3))
+		expected.write(c_uint64(4))
+		expected.write(c_float(0.5))
+		expected.write(b"abc")
+		expected.write(c_ushort(5))
+		expected.write(c_ubyte(6))
+		self.assertEqual(len(out), len(bytes(expected)))
+		self.assertEqual(bytes(out), bytes(expected))
+
+	def test_grows(self):
+		out = PacketBuilder()
+		out.write_bytes(bytes(range(256)) * 3)
+		out.write_uint(7)
+		self.assertEqual(bytes(out), bytes(range(256)) * 3 + b"\x07\x00\x00\x00")
+
+	def test_built_once(self):
+		out = PacketBuilder(Message.ConnectedPong)
+		packet = bytes(out)
+		self.assertEqual(packet, b"\x03")
+		self.assertIs(bytes(out), packet)
+		self.assertEqual(len(out), 1)
+		with self.assertRaises(RuntimeError):
+			out.write_uint(0)
+
+	def test_send(self):
+		dispatcher = EventDispatcher()
+		conn = _Connection(dispatcher)
+		listener = Mock()
+		dispatcher.add_listener(ConnectionEvent.Send, listener)
+		out = PacketBuilder(Message.ConnectedPong)
+		out.write_uint(1)
+		conn.send(out)
+		listener.assert_called_once_with(b"\x03\x01\x00\x00\x00", conn)
+		self.assertIsNone(out._buffer)
@@ -1,7 +1,7 @@
 import random
 import unittest
 
-from pyraknet.transports.raknet._rangelist import RangeList, ReadStream, WriteStream
+from pyraknet.transports.raknet._rangelist import _Range, RangeList, ReadStream, WriteStream
 
 class _BitStream(WriteStream, ReadStream):
 	def __init__(self):
@@ -159,3 +159,26 @@ class RangeListTest(unittest.TestCase):
 		for value in values:
 			self.list.insert(value)
 		self.assertEqual(len(list(self.list.holes())), self.list.num_holes())
+
+	def test_is_valid(self):
+		for value in [1, 2, 4, 5]:
+			self.list.insert(value)
+		self.assertTrue(self.list.is_valid(6))
+		self.assertFalse(self.list.is_valid(5))
+
+	def test_is_valid_unsorted(self):
+		self.list._ranges = [_Range(4, 5), _Range(1, 2)]
+		self.assertFalse(self.list.is_valid(10))
+		self.list._ranges = [_Range(1, 4), _Range(3, 5)]
+		self.assertFalse(self.list.is_valid(10))
+		self.list._ranges = [_Range(5, 4)]
+		self.assertFalse(self.list.is_valid(10))
+		self.list.clear()
+
+	def test_discard_below(self):
+		for value in [1, 2, 4, 5, 6, 9]:
+			self.list.insert(value)
+		self.list.discard_below(5)
+		self.assertEqual(list(self.list), [5, 6, 9])
+		self.list.discard_below(10)
+		self.assertEqual(list(self.list), [])
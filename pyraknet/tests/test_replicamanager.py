@@ -1,6 +1,14 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+
+from event_dispatcher import EventDispatcher
+
 from pyraknet.replicamanager import Replica, ReplicaManager
 from pyraknet.messages import Message
 from pyraknet.transports.abc import ConnectionEvent
+from pyraknet.transports.raknet.clock import VirtualClock
 from pyraknet.tests.test_server import ServerTest
 
 class TestReplica(Replica):
@@ -60,3 +68,216 @@ class ReplicaTest(BaseReplicaTest):
 			self.replica_manager.serialize(self.replica)
 		with self.assertRaises(KeyError):
 			self.replica_manager.destruct(self.replica)
+
+class BulkTest(ParticipantTest):
+	def test_construct_many(self):
+		self.replica_manager.construct(self.replica)
+		self.replica_manager.construct_many([TestReplica(), TestReplica()])
+		self.assertEqual([call[0][0][:3] for call in self.listener.call_args_list], [b"\x24\x80\x00", b"\x24\x80\x80", b"\x24\x81\x00"])  # network ids 0, 1, 2 after the bit
+
+	def test_destruct_many(self):
+		replicas = [TestReplica(), TestReplica()]
+		self.replica_manager.construct_many(replicas)
+		self.replica_manager.mark_changed(replicas[0])
+		self.listener.reset_mock()
+		self.replica_manager.destruct_many(replicas)
+		self.assertEqual([call[0][0] for call in self.listener.call_args_list], [b"\x25\x00\x00", b"\x25\x01\x00"])
+		self.assertFalse(self.replica_manager._participants[self.conn].stale)
+		with self.assertRaises(KeyError):
+			self.replica_manager.serialize(replicas[0])
+
+	def test_delayed_add_many(self):
+		self.replica_manager.construct_many([TestReplica(), TestReplica()])
+		other = Mock()
+		self.replica_manager.add_participant(other)
+		self.assertEqual(len(other.send_many.call_args[0][0]), 2)
+
+class ScheduledReplica(Replica):
+	def __init__(self, name, priority=1, update_interval=0):
+		self.name = name
+		self._priority = priority
+		self.update_interval = update_interval
+		self.serializations = 0
+
+	def write_construction(self, stream):
+		pass
+
+	def serialize(self, stream):
+		self.serializations += 1
+		stream.write(self.name)
+
+	def priority(self, conn):
+		return self._priority
+
+class ScheduleTest(unittest.TestCase):
+	def setUp(self):
+		self.clock = VirtualClock()
+		self.replica_manager = ReplicaManager(EventDispatcher(), tick_interval=0.1, clock=self.clock)
+		self.conn = Mock()
+		self.replica_manager.add_participant(self.conn, bytes_per_second=100)  # 10 bytes per tick, each serialization is 3 + 7 bytes
+		self.conn.send.reset_mock()
+
+	def sent(self):
+		names = [call[0][0][3:] for call in self.conn.send.call_args_list]
+		self.conn.send.reset_mock()
+		return names
+
+	def add(self, *args, **kwargs):
+		obj = ScheduledReplica(*args, **kwargs)
+		self.replica_manager.construct(obj)
+		self.conn.send.reset_mock()
+		return obj
+
+	def test_priority_within_budget(self):
+		objs = [self.add(b"cosmetc", 1), self.add(b"player!", 10), self.add(b"npc....", 2)]
+		for obj in objs:
+			self.replica_manager.mark_changed(obj)
+		self.clock.advance(0.1)
+		self.assertEqual(self.sent(), [b"player!"])
+		self.clock.advance(0.1)
+		self.assertEqual(self.sent(), [b"npc...."])
+		self.clock.advance(0.1)
+		self.assertEqual(self.sent(), [b"cosmetc"])
+
+	def test_no_starvation(self):
+		low = self.add(b"cosmetc", 1)
+		high = self.add(b"player!", 3)
+		self.replica_manager.mark_changed(low)
+		sent = []
+		for _ in range(10):
+			self.replica_manager.mark_changed(high)
+			self.clock.advance(0.1)
+			sent.extend(self.sent())
+		self.assertIn(b"cosmetc", sent)
+
+	def test_update_interval(self):
+		obj = self.add(b"slow...", update_interval=0.5)
+		sent = []
+		for _ in range(10):
+			self.replica_manager.mark_changed(obj)
+			self.clock.advance(0.1)
+			sent.extend(self.sent())
+		self.assertEqual(len(sent), 2)
+
+	def test_serialized_once_per_tick(self):
+		other = Mock()
+		self.replica_manager.add_participant(other, bytes_per_second=100)
+		obj = self.add(b"shared.")
+		other.send.reset_mock()
+		self.replica_manager.mark_changed(obj)
+		self.clock.advance(0.1)
+		self.assertEqual(self.sent(), [b"shared."])
+		other.send.assert_called_once()
+		self.assertEqual(obj.serializations, 1)
+
+	def test_idle_manual_tick(self):
+		replica_manager = ReplicaManager(EventDispatcher(), clock=self.clock)
+		replica_manager.add_participant(self.conn, bytes_per_second=100)
+		objs = [ScheduledReplica(bytes([0x61 + i]) * 7) for i in range(3)]
+		replica_manager.construct_many(objs)
+		self.conn.send.reset_mock()
+		self.clock.advance(10)
+		for obj in objs:
+			replica_manager.mark_changed(obj)
+		replica_manager.tick()
+		self.assertEqual(len(self.sent()), 1)  # the idle time doesn't add up to a burst
+
+	def test_serialize_update_interval(self):
+		obj = self.add(b"slow...", update_interval=0.5)
+		self.replica_manager.serialize(obj)
+		self.assertEqual(self.sent(), [b"slow..."])
+		self.replica_manager.mark_changed(obj)
+		self.clock.advance(0.1)
+		self.assertEqual(self.sent(), [])
+		self.clock.advance(0.4)
+		self.assertEqual(self.sent(), [b"slow..."])
+
+class SnapshotTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.directory.name, "zone.snapshot")
+		before = ReplicaManager(EventDispatcher(), clock=VirtualClock())
+		self.replicas = [ScheduledReplica(name) for name in (b"a", b"b", b"c")]
+		before.construct_many(self.replicas)
+		before.destruct(self.replicas[1])
+		self.conn = Mock()
+		before.add_participant(self.conn)
+		self.constructions = self.conn.send_many.call_args[0][0]
+		before.checkpoint(self.path)
+		self.replica_manager = ReplicaManager(EventDispatcher(), clock=VirtualClock())
+		self.replica_manager.restore(self.path)
+
+	def tearDown(self):
+		if self.replica_manager._snapshot is not None:
+			self.replica_manager._snapshot.close()
+		self.directory.cleanup()
+
+	def test_add_participant(self):
+		conn = Mock()
+		self.replica_manager.add_participant(conn)
+		conn.send_many.assert_called_once_with(self.constructions)
+		self.assertEqual(self.replica_manager.restored_ids(), [0, 2])
+		self.assertEqual(self.replica_manager.restored_construction(2), self.constructions[1])
+
+	def test_rehydrate(self):
+		conn = Mock()
+		self.replica_manager.add_participant(conn)
+		new = ScheduledReplica(b"d")
+		self.replica_manager.construct(new)
+		self.assertEqual(conn.send.call_args[0][0][:3], b"\x24\x81\x80")  # network id 3, after the snapshot's
+		rehydrated = ScheduledReplica(b"c")
+		self.replica_manager.rehydrate(rehydrated, 2)
+		with self.assertRaises(KeyError):
+			self.replica_manager.rehydrate(rehydrated, 2)
+		self.replica_manager.serialize(rehydrated)
+		self.assertEqual(conn.send.call_args[0][0], b"\x27\x02\x00c")
+		# the restored constructions come first, in construction order
+		other = Mock()
+		self.replica_manager.add_participant(other)
+		self.assertEqual(other.send_many.call_args[0][0][:2], self.constructions)
+		self.replica_manager.rehydrate(ScheduledReplica(b"a"), 0)
+		self.assertIsNone(self.replica_manager._snapshot)
+
+	def test_discard(self):
+		conn = Mock()
+		self.replica_manager.add_participant(conn)
+		self.replica_manager.discard_restored(0)
+		conn.send.assert_called_once_with(b"\x25\x00\x00")
+		self.assertEqual(self.replica_manager.restored_ids(), [2])
+		with self.assertRaises(KeyError):
+			self.replica_manager.restored_construction(0)
+
+	def test_checkpoint_restored(self):
+		self.replica_manager.rehydrate(ScheduledReplica(b"a"), 0)
+		mapped = self.replica_manager._snapshot
+		replace = os.replace
+
+		def replace_unmapped(source, destination):
+			# like on Windows, a file that's still mapped can't be replaced
+			if mapped._map is not None:
+				raise PermissionError(destination)
+			replace(source, destination)
+		with patch("pyraknet.snapshot.os.replace", replace_unmapped):
+			self.replica_manager.checkpoint(self.path)
+		# the manager maps the new file and keeps serving the restored constructions from it
+		self.assertIsNot(self.replica_manager._snapshot, mapped)
+		conn = Mock()
+		self.replica_manager.add_participant(conn)
+		self.assertEqual(conn.send_many.call_args[0][0][1], self.constructions[1])
+		restored = ReplicaManager(EventDispatcher(), clock=VirtualClock())
+		restored.restore(self.path)
+		conn = Mock()
+		restored.add_participant(conn)
+		conn.send_many.assert_called_once_with(self.constructions)
+		restored._snapshot.close()
+
+	def test_checkpoint_other_path(self):
+		other = os.path.join(self.directory.name, "other.snapshot")
+		mapped = self.replica_manager._snapshot
+		self.replica_manager.checkpoint(other)
+		self.assertIs(self.replica_manager._snapshot, mapped)
+		self.assertIsNotNone(mapped._map)
+
+	def test_restore_not_empty(self):
+		with self.assertRaises(RuntimeError):
+			self.replica_manager.restore(self.path)
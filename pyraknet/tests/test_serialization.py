@@ -0,0 +1,119 @@
+import math
+import random
+import unittest
+
+from bitstream import ReadStream, WriteStream
+
+from pyraknet.serialization import QuantizedFloat, QuantizedQuaternion, read_compressed_double, read_compressed_float, read_norm_quat, read_norm_vector, read_vector, write_compressed_double, write_compressed_float, write_norm_quat, write_norm_vector, write_vector
+
+def random_quaternion(rand):
+	components = [rand.gauss(0, 1) for _ in range(4)]
+	length = math.sqrt(sum(component * component for component in components))
+	return tuple(component / length for component in components)
+
+class RaknetCompatibleTest(unittest.TestCase):
+	def round_trip(self, write, read, *values, exact=True):
+		stream = WriteStream()
+		write(stream, *values)
+		data = bytes(stream)
+		decoded = read(ReadStream(data))
+		if not exact:
+			return data, decoded
+		# sending the decoded value again gives the same bits
+		stream = WriteStream()
+		if isinstance(decoded, tuple):
+			write(stream, *decoded)
+		else:
+			write(stream, decoded)
+		self.assertEqual(bytes(stream), data)
+		return data, decoded
+
+	def test_compressed_float(self):
+		self.assertEqual(self.round_trip(write_compressed_float, read_compressed_float, -1.0), (b"\x00\x00", -1.0))
+		self.assertEqual(self.round_trip(write_compressed_float, read_compressed_float, 1.0), (b"\xff\xff", 1.0))
+		self.assertEqual(self.round_trip(write_compressed_float, read_compressed_float, 2.0)[1], 1.0)
+		for value in (-0.5, 0.0, 0.3, 0.999):
+			data, decoded = self.round_trip(write_compressed_float, read_compressed_float, value)
+			self.assertAlmostEqual(decoded, value, delta=1/32767.5)
+		for value in range(1 << 16):
+			self.round_trip(write_compressed_float, read_compressed_float, read_compressed_float(ReadStream(value.to_bytes(2, "little"))))
+
+	def test_compressed_double(self):
+		for value in (-1.0, -0.25, 0.0, 0.123456789, 1.0):
+			data, decoded = self.round_trip(write_compressed_double, read_compressed_double, value)
+			self.assertEqual(len(data), 4)
+			self.assertAlmostEqual(decoded, value, delta=1/2147483648)
+
+	def test_vector(self):
+		data, decoded = self.round_trip(write_vector, read_vector, 3.0, -4.0, 12.0, exact=False)
+		self.assertEqual(len(data), 10)
+		for component, value in zip(decoded, (3.0, -4.0, 12.0)):
+			self.assertAlmostEqual(component, value, delta=13/32767.5)
+		self.assertEqual(self.round_trip(write_vector, read_vector, 0.0, 0.0, 0.0), (bytes(4), (0.0, 0.0, 0.0)))
+
+	def test_norm_vector(self):
+		data, decoded = self.round_trip(write_norm_vector, read_norm_vector, -0.6, 0.0, 0.8)
+		self.assertEqual(len(data), 3)  # 3 bits and one compressed float
+		for component, value in zip(decoded, (-0.6, 0.0, 0.8)):
+			self.assertAlmostEqual(component, value, delta=0.0001)
+
+	def test_norm_quat(self):
+		rand = random.Random(1)
+		for _ in range(100):
+			quaternion = random_quaternion(rand)
+			data, decoded = self.round_trip(write_norm_quat, read_norm_quat, *quaternion)
+			self.assertEqual(len(data), 7)
+			for component, value in zip(decoded, quaternion):
+				self.assertAlmostEqual(component, value, delta=0.01)
+
+class QuantizedFloatTest(unittest.TestCase):
+	def test_all_values_round_trip(self):
+		quantized = QuantizedFloat(-10.0, 30.0, 9)
+		for value in range(1 << 9):
+			self.assertEqual(quantized.to_int(quantized.from_int(value)), value)
+
+	def test_error_and_clamping(self):
+		quantized = QuantizedFloat(-1000.0, 1000.0, 20)
+		rand = random.Random(1)
+		for _ in range(1000):
+			value = rand.uniform(-1000, 1000)
+			self.assertLessEqual(abs(quantized.quantize(value) - value), 2000 / ((1 << 20) - 1) / 2 + 1e-9)
+		self.assertEqual(quantized.quantize(-5000.0), -1000.0)
+		self.assertEqual(quantized.quantize(5000.0), 1000.0)
+
+	def test_stream(self):
+		position = QuantizedFloat(-1000.0, 1000.0, 20)
+		health = QuantizedFloat(0.0, 1.0, 7)
+		stream = WriteStream()
+		position.write_vector(stream, 1.5, -200.25, 999.0)
+		health.write(stream, 0.5)
+		data = bytes(stream)
+		self.assertEqual(len(data), 9)  # 67 bits
+		read = ReadStream(data)
+		self.assertEqual(position.read_vector(read), tuple(position.quantize(value) for value in (1.5, -200.25, 999.0)))
+		self.assertEqual(health.read(read), health.quantize(0.5))
+
+	def test_invalid(self):
+		with self.assertRaises(ValueError):
+			QuantizedFloat(1.0, 1.0, 8)
+		with self.assertRaises(ValueError):
+			QuantizedFloat(0.0, 1.0, 0)
+
+class QuantizedQuaternionTest(unittest.TestCase):
+	def test_round_trip(self):
+		quantized = QuantizedQuaternion()
+		rand = random.Random(1)
+		for _ in range(1000):
+			quaternion = random_quaternion(rand)
+			stream = WriteStream()
+			quantized.write(stream, *quaternion)
+			data = bytes(stream)
+			self.assertEqual(len(data), 4)
+			decoded = quantized.read(ReadStream(data))
+			self.assertEqual(decoded, quantized.quantize(*quaternion))
+			self.assertEqual(quantized.quantize(*decoded), decoded)
+			# q and -q are the same rotation
+			dot = sum(a * b for a, b in zip(decoded, quaternion))
+			self.assertGreater(abs(dot), 0.99999)
+			for component, value in zip(decoded, quaternion):
+				self.assertAlmostEqual(component, math.copysign(1, dot) * value, delta=0.002)
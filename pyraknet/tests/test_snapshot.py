@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+
+from pyraknet.snapshot import ReplicaSnapshot, write_snapshot
+
+class SnapshotTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.directory.name, "zone.snapshot")
+
+	def tearDown(self):
+		self.directory.cleanup()
+
+	def test_round_trip(self):
+		write_snapshot(self.path, [(5, b"\x24five"), (1, b"\x24one"), (2, b"")], 6)
+		self.assertFalse(os.path.exists(self.path + ".tmp"))
+		with ReplicaSnapshot(self.path) as snapshot:
+			self.assertEqual(len(snapshot), 3)
+			self.assertEqual(list(snapshot.network_ids()), [1, 2, 5])
+			self.assertIn(5, snapshot)
+			self.assertNotIn(3, snapshot)
+			self.assertEqual(snapshot.construction(1), b"\x24one")
+			self.assertEqual(snapshot.construction(2), b"")
+			self.assertEqual(snapshot.construction(5), b"\x24five")
+			self.assertEqual(snapshot.next_network_id, 6)
+			with self.assertRaises(KeyError):
+				snapshot.construction(3)
+
+	def test_empty(self):
+		write_snapshot(self.path, [], 0)
+		with ReplicaSnapshot(self.path) as snapshot:
+			self.assertEqual(len(snapshot), 0)
+
+	def test_invalid(self):
+		with open(self.path, "wb") as file:
+			file.write(b"not a snapshot")
+		with self.assertRaises(ValueError):
+			ReplicaSnapshot(self.path)
+
+	def test_truncated(self):
+		write_snapshot(self.path, [(0, b"\x24" * 100)], 1)
+		with open(self.path, "r+b") as file:
+			file.truncate(os.path.getsize(self.path) - 1)
+		with self.assertRaises(ValueError):
+			ReplicaSnapshot(self.path)
@@ -0,0 +1,54 @@
+import unittest
+
+from pyraknet.transports.raknet.calcs import DelayCongestionControl, RenoCongestionControl
+from pyraknet.transports.raknet.clock import VirtualClock
+
+class RenoCongestionControlTest(unittest.TestCase):
+	def test_halve_on_holes(self):
+		control = RenoCongestionControl(VirtualClock())
+		for _ in range(10):
+			control.on_ack(int(control.cwnd()), int(control.cwnd()), 0)
+		cwnd = control.cwnd()
+		control.on_ack(int(cwnd), 1, 1)
+		self.assertEqual(control.cwnd(), cwnd / 2)
+		self.assertEqual(control.send_interval(), 0)
+
+class DelayCongestionControlTest(unittest.TestCase):
+	def setUp(self):
+		self.clock = VirtualClock()
+		self.control = DelayCongestionControl(self.clock, target_delay=0.05)
+
+	def ack(self, rtt, num_holes=0):
+		self.clock.advance(0.03)
+		self.control.on_rtt(rtt)
+		cwnd = int(self.control.cwnd())
+		self.control.on_ack(cwnd, cwnd, num_holes)
+
+	def test_grow_without_queueing(self):
+		for _ in range(20):
+			self.ack(0.1)
+		self.assertGreater(self.control.cwnd(), 100)
+
+	def test_ignore_random_loss(self):
+		for _ in range(20):
+			self.ack(0.1)
+		cwnd = self.control.cwnd()
+		self.ack(0.1, num_holes=1)
+		self.assertGreaterEqual(self.control.cwnd(), cwnd)
+
+	def test_shrink_with_queueing(self):
+		for _ in range(20):
+			self.ack(0.1)
+		cwnd = self.control.cwnd()
+		for _ in range(10):
+			self.ack(0.3)
+		self.assertLess(self.control.cwnd(), cwnd)
+		cwnd = self.control.cwnd()
+		self.ack(0.3, num_holes=1)
+		self.assertLessEqual(self.control.cwnd(), cwnd / 2)
+
+	def test_pacing(self):
+		self.assertEqual(self.control.send_interval(), 0)
+		for _ in range(5):
+			self.ack(0.1)
+		self.assertAlmostEqual(self.control.send_interval(), 0.03 / self.control.cwnd())
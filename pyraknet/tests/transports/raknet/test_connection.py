@@ -1,30 +1,41 @@
 import asyncio
+import gc
+import io
+import math
 import os.path
-import time
 import unittest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
+from bitstream import c_uint, ReadStream
 from event_dispatcher import EventDispatcher
 
+from pyraknet.messages import Message
+
 from pyraknet.transports.abc import Connection, ConnectionEvent, Reliability
-from pyraknet.transports.raknet.connection import RaknetConnection
+from pyraknet.transports.raknet.calcs import DelayCongestionControl
+from pyraknet.transports.raknet.clock import VirtualClock
+from pyraknet.transports.raknet.connection import MAX_SPLIT_PACKET_COUNT, MAX_SPLIT_PACKETS, OverflowPolicy, RaknetConnection, SPLIT_PACKET_TIMEOUT
+from pyraknet.transports.raknet.limits import InboundLimits
+from pyraknet.transports.raknet.emulator import connection_pair
+from pyraknet.transports.raknet.resends import ResendStore
 
-time.perf_counter = lambda *args, **kwargs: 0
+RES_DIR = os.path.join(os.path.dirname(__file__), "res")
 
 class ConnectionTest(unittest.TestCase):
 	ADDRESS = "127.0.0.1", 1234
 
 	def setUp(self):
+		self.clock = VirtualClock()
 		self.transport = Mock()
 		self.dispatcher = EventDispatcher()
-		self.conn = RaknetConnection(self.transport, self.dispatcher, self.ADDRESS)
+		self.conn = RaknetConnection(self.transport, self.dispatcher, self.ADDRESS, clock=self.clock)
 		self.listener = Mock()
 		self.dispatcher.add_listener(ConnectionEvent.Receive, self.listener)
 
 	def test_parse_ping(self):
 		self.conn.handle_datagram(b"\x41\x86\xc4\x40\x1e\x80\x00\x00\x12\x28\x00\x06\x1b\x11\x00")
 		self.listener.assert_called_once_with(b"\x00\x06\x1b\x11\x00", self.conn)
-		asyncio.get_event_loop().run_until_complete(asyncio.sleep(0.03))
+		self.clock.advance(0.03)
 		self.transport.sendto.assert_called_once_with(b"\x83\x0d\x88\x80\x63\x7a\x00\x00\x00", self.ADDRESS)
 
 	def test_parse_acks(self):
@@ -32,15 +43,16 @@ class ConnectionTest(unittest.TestCase):
 		self.listener.assert_not_called()
 
 	def test_parse_split_packet(self):
-		with open(os.path.join(__file__, "..", "res/in_split1.bin"), "rb") as file:
+		with open(os.path.join(RES_DIR, "in_split1.bin"), "rb") as file:
 			dgram1 = file.read()
-		with open(os.path.join(__file__, "..", "res/in_split2.bin"), "rb") as file:
+		with open(os.path.join(RES_DIR, "in_split2.bin"), "rb") as file:
 			dgram2 = file.read()
-		with open(os.path.join(__file__, "..", "res/in_split3.bin"), "rb") as file:
+		with open(os.path.join(RES_DIR, "in_split3.bin"), "rb") as file:
 			dgram3 = file.read()
-		with open(os.path.join(__file__, "..", "res/in_payload.bin"), "rb") as file:
+		with open(os.path.join(RES_DIR, "in_payload.bin"), "rb") as file:
 			payload = file.read()
 
+		self.conn._out_of_order_packets.head = 47  # the packet was captured mid-session, don't wait for the earlier ones
 		self.conn.handle_datagram(dgram1)
 		self.listener.assert_not_called()
 		self.conn.handle_datagram(dgram2)
@@ -49,13 +61,13 @@ class ConnectionTest(unittest.TestCase):
 		self.listener.assert_called_once_with(payload, self.conn)
 
 	def test_send_split_packet(self):
-		with open(os.path.join(__file__, "..", "res/out_payload.bin"), "rb") as file:
+		with open(os.path.join(RES_DIR, "out_payload.bin"), "rb") as file:
 			payload = file.read()
-		with open(os.path.join(__file__, "..", "res/out_split1.bin"), "rb") as file:
+		with open(os.path.join(RES_DIR, "out_split1.bin"), "rb") as file:
 			dgram1 = file.read()
-		with open(os.path.join(__file__, "..", "res/out_split2.bin"), "rb") as file:
+		with open(os.path.join(RES_DIR, "out_split2.bin"), "rb") as file:
 			dgram2 = file.read()
-		with open(os.path.join(__file__, "..", "res/out_split3.bin"), "rb") as file:
+		with open(os.path.join(RES_DIR, "out_split3.bin"), "rb") as file:
 			dgram3 = file.read()
 
 		self.conn._packets_sent = -10 # otherwise	 packets won't actually be sent
@@ -64,3 +76,668 @@ class ConnectionTest(unittest.TestCase):
 		self.transport.sendto.assert_any_call(dgram2, self.ADDRESS)
 		self.transport.sendto.assert_any_call(dgram3, self.ADDRESS)
 
+	def test_reliable_duplicate(self):
+		sender = RaknetConnection(Mock(), EventDispatcher(), self.ADDRESS, clock=self.clock)
+		sender.send(b"\x53test", Reliability.Reliable)
+		dgram = sender._transport.sendto.call_args[0][0]
+		self.conn.handle_datagram(dgram)
+		self.conn.handle_datagram(dgram)
+		self.listener.assert_called_once_with(b"\x53test", self.conn)
+		self.assertEqual(self.conn.get_stats()["duplicates_dropped"], 1)
+
+	def test_reliable_too_old(self):
+		self.conn = RaknetConnection(self.transport, self.dispatcher, self.ADDRESS, duplicate_window=4, clock=self.clock)
+		sender = RaknetConnection(Mock(), EventDispatcher(), self.ADDRESS, clock=self.clock)
+		sender._packets_sent = -6
+		for i in range(6):
+			sender.send(bytes((0x53, i)), Reliability.Reliable)
+		dgrams = [call[0][0] for call in sender._transport.sendto.call_args_list]
+		self.conn.handle_datagram(dgrams[1])
+		self.conn.handle_datagram(dgrams[5])  # slides the window past the hole at 0
+		self.conn.handle_datagram(dgrams[0])  # may be the resend of a lost packet
+		self.assertIn(0, self.conn._acks)  # acked, otherwise the remote would resend it forever
+		self.assertEqual(self.received(), [b"\x53\x01", b"\x53\x05", b"\x53\x00"])
+		self.assertEqual(self.conn.get_stats()["too_old_messages"], 1)
+		self.assertEqual(self.conn.get_stats()["duplicates_dropped"], 0)
+
+	def test_reliable_ordered_too_old(self):
+		self.conn = RaknetConnection(self.transport, self.dispatcher, self.ADDRESS, duplicate_window=4, clock=self.clock)
+		dgrams = self.send_ordered(6)
+		self.conn.handle_datagram(dgrams[1])
+		self.conn.handle_datagram(dgrams[5])  # slides the window past the hole at 0
+		self.listener.assert_not_called()
+		self.conn.handle_datagram(dgrams[0])  # the lost packet, releases the buffered ones
+		self.assertEqual(self.received(), [b"\x53\x00", b"\x53\x01"])
+		self.conn._acks.clear()
+		self.conn.handle_datagram(dgrams[0])  # a duplicate, dropped by its ordering index
+		self.assertEqual(self.received(), [b"\x53\x00", b"\x53\x01"])
+		self.assertIn(0, self.conn._acks)
+		self.assertEqual(self.conn.get_stats()["too_old_messages"], 2)
+		self.assertEqual(self.conn.get_stats()["duplicates_dropped"], 1)
+
+	def send_ordered(self, count):
+		sender = RaknetConnection(Mock(), EventDispatcher(), self.ADDRESS, clock=self.clock)
+		sender._packets_sent = -count
+		for i in range(count):
+			sender.send(bytes([0x53, i]), Reliability.ReliableOrdered)
+		return [call[0][0] for call in sender._transport.sendto.call_args_list]
+
+	def received(self):
+		return [call[0][0] for call in self.listener.call_args_list]
+
+	def test_reliable_ordered_release(self):
+		dgrams = self.send_ordered(3)
+		self.conn.handle_datagram(dgrams[2])
+		self.conn.handle_datagram(dgrams[1])
+		self.listener.assert_not_called()
+		self.conn.handle_datagram(dgrams[0])
+		self.assertEqual(self.received(), [b"\x53\x00", b"\x53\x01", b"\x53\x02"])
+		self.assertEqual(self.conn.get_stats()["reorder_max_depth"], 2)
+
+	def test_reliable_ordered_stall(self):
+		self.conn = RaknetConnection(self.transport, self.dispatcher, self.ADDRESS, reorder_buffer_size=2, clock=self.clock)
+		dgrams = self.send_ordered(3)
+		self.conn.handle_datagram(dgrams[1])
+		self.conn.handle_datagram(dgrams[2])  # doesn't fit, not acked
+		self.assertNotIn(2, self.conn._acks)
+		self.assertEqual(self.conn.get_stats()["reorder_overflows"], 1)
+		self.conn.handle_datagram(dgrams[0])
+		self.assertEqual(self.received(), [b"\x53\x00", b"\x53\x01"])
+		self.conn.handle_datagram(dgrams[2])  # resend
+		self.assertEqual(self.received(), [b"\x53\x00", b"\x53\x01", b"\x53\x02"])
+
+	def test_reliable_ordered_overflow_close(self):
+		self.conn = RaknetConnection(self.transport, self.dispatcher, self.ADDRESS, reorder_buffer_size=2, reorder_overflow_policy=OverflowPolicy.Close, clock=self.clock)
+		close_listener = Mock()
+		self.dispatcher.add_listener(ConnectionEvent.Close, close_listener)
+		dgrams = self.send_ordered(3)
+		self.conn.handle_datagram(dgrams[2])
+		close_listener.assert_called_once_with(self.conn)
+
+
+	def send_ordered_split(self):
+		"""Return the datagram of a short ReliableOrdered packet and the datagrams of the parts of a 3000 byte one after it."""
+		sender = RaknetConnection(Mock(), EventDispatcher(), self.ADDRESS, clock=self.clock)
+		sender._packets_sent = -4
+		sender.send(b"\x53\x00", Reliability.ReliableOrdered)
+		sender.send(b"\x53" + bytes(2999), Reliability.ReliableOrdered)
+		dgrams = [call[0][0] for call in sender._transport.sendto.call_args_list]
+		self.assertEqual(len(dgrams), 4)
+		return dgrams[0], dgrams[1:]
+
+	def test_reliable_ordered_split_reserved(self):
+		self.conn = RaknetConnection(self.transport, self.dispatcher, self.ADDRESS, reorder_buffer_max_bytes=4000, clock=self.clock)
+		first, parts = self.send_ordered_split()
+		self.conn.handle_datagram(parts[0])
+		self.assertGreaterEqual(self.conn.get_stats()["reorder_reserved_bytes"], 3000)
+		for dgram in parts[1:]:
+			self.conn.handle_datagram(dgram)
+		self.assertEqual(self.conn.get_stats()["reorder_reserved_bytes"], 0)
+		self.assertEqual(self.conn.get_stats()["reorder_bytes"], 3000)
+		self.conn.handle_datagram(first)
+		self.assertEqual(self.received(), [b"\x53\x00", b"\x53" + bytes(2999)])
+		self.assertEqual(self.conn.get_stats()["reorder_bytes"], 0)
+
+	def test_reliable_ordered_split_stall(self):
+		# every part fits on its own, the reassembled packet doesn't
+		self.conn = RaknetConnection(self.transport, self.dispatcher, self.ADDRESS, reorder_buffer_max_bytes=2500, clock=self.clock)
+		first, parts = self.send_ordered_split()
+		for dgram in parts:
+			self.conn.handle_datagram(dgram)
+		self.assertEqual(list(self.conn._acks), [3])  # only the shorter last part fits, the full ones aren't acked
+		self.assertEqual(self.conn.get_stats()["reorder_overflows"], 2)
+		self.conn.handle_datagram(first)
+		for dgram in parts:  # resends
+			self.conn.handle_datagram(dgram)
+		self.assertEqual(self.received(), [b"\x53\x00", b"\x53" + bytes(2999)])
+
+	def test_pause_receiving(self):
+		dgrams = self.send_ordered(2)
+		self.conn.pause_receiving()
+		self.conn.handle_datagram(dgrams[0])
+		self.clock.advance(1)
+		self.listener.assert_not_called()
+		self.transport.sendto.assert_not_called()  # not acked
+		self.conn.resume_receiving()
+		self.conn.handle_datagram(dgrams[0])
+		self.conn.handle_datagram(dgrams[1])
+		self.assertEqual(self.received(), [b"\x53\x00", b"\x53\x01"])
+		self.assertEqual(self.conn.get_stats()["datagrams_stalled"], 1)
+
+	def test_receive_queue(self):
+		dgrams = self.send_ordered(3)
+		self.conn.start_receive_queue(max_size=2)
+		self.conn.handle_datagram(dgrams[0])
+		self.conn.handle_datagram(dgrams[1])
+		self.assertTrue(self.conn._receiving_paused)
+		self.conn.handle_datagram(dgrams[2])  # dropped, the queue is full
+
+		async def consume():
+			received = [await self.conn.recv()]
+			self.conn.handle_datagram(dgrams[2])  # resent by the remote after receiving was resumed
+			self.conn.close()
+			async for packet in self.conn:
+				received.append(packet)
+			return received
+		received = asyncio.get_event_loop().run_until_complete(consume())
+		self.assertEqual(received, [b"\x53\x00", b"\x53\x01", b"\x53\x02"])
+
+	def test_receive_queue_other_pause(self):
+		dgrams = self.send_ordered(3)
+		self.conn.start_receive_queue(max_size=2)
+		self.conn.handle_datagram(dgrams[0])
+		self.conn.handle_datagram(dgrams[1])  # the queue pauses receiving
+		self.conn.pause_receiving()  # another consumer pauses too
+		loop = asyncio.get_event_loop()
+		self.assertEqual(loop.run_until_complete(self.conn.recv()), b"\x53\x00")  # the queue resumes
+		self.conn.handle_datagram(dgrams[2])  # still paused by the other consumer
+		self.assertEqual(self.conn.get_stats()["datagrams_stalled"], 1)
+		self.conn.resume_receiving()
+		self.conn.handle_datagram(dgrams[2])
+		self.assertEqual(self.received(), [b"\x53\x00", b"\x53\x01", b"\x53\x02"])
+
+class RetransmitTest(unittest.TestCase):
+	def setUp(self):
+		self.clock = VirtualClock()
+		self.received = []
+
+	def transfer_with_loss(self, **connection_options):
+		"""Warm up the connection, then lose one packet in the middle of a burst. Return the time until the burst has been delivered."""
+		a, b = connection_pair(self.clock, {"latency": 0.02}, connection_options)
+		b._dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: self.received.append(data))
+		for i in range(30):
+			a.send(bytes([0x53, i]), Reliability.ReliableOrdered)
+		self.assertTrue(self.clock.run_until(lambda: len(self.received) == 30, 10))
+		self.clock.advance(1)
+
+		link = a._transport
+		sendto = link.sendto
+		def lose_first(data, address=None):
+			link.sendto = sendto
+		link.sendto = lose_first
+		start = self.clock.time()
+		for i in range(30, 40):
+			a.send(bytes([0x53, i]), Reliability.ReliableOrdered)
+		self.assertTrue(self.clock.run_until(lambda: len(self.received) == 40, 10))
+		self.assertEqual(self.received, [bytes([0x53, i]) for i in range(40)])
+		return self.clock.time() - start, a.get_stats()
+
+	def test_fast_retransmit(self):
+		duration, stats = self.transfer_with_loss()
+		self.assertLess(duration, 0.5)
+		self.assertEqual(stats["fast_retransmits"], 1)
+		self.assertEqual(stats["timeout_retransmits"], 0)
+
+	def test_fast_retransmit_disabled(self):
+		duration, stats = self.transfer_with_loss(fast_retransmit_threshold=None)
+		self.assertGreaterEqual(duration, 1)
+		self.assertEqual(stats["fast_retransmits"], 0)
+		self.assertEqual(stats["timeout_retransmits"], 1)
+
+	def test_drain(self):
+		a, b = connection_pair(self.clock, {"latency": 0.02})
+		b._dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: self.received.append(data))
+		loop = asyncio.get_event_loop()
+		for i in range(100):
+			a.send(bytes([0x53, i]), Reliability.ReliableOrdered)
+		drain = loop.create_task(a.drain())
+		loop.run_until_complete(asyncio.sleep(0))
+		self.assertFalse(drain.done())
+		self.assertTrue(self.clock.run_until(lambda: len(a._resends) <= 2 * a._congestion.cwnd(), 10))
+		loop.run_until_complete(drain)
+		self.assertLess(len(self.received), 100)  # didn't have to wait for everything
+
+	def test_close_while_draining(self):
+		a, b = connection_pair(self.clock, {"latency": 0.02})
+		loop = asyncio.get_event_loop()
+		for i in range(100):
+			a.send(bytes([0x53, i]), Reliability.ReliableOrdered)
+		drain = loop.create_task(a.drain())
+		cancelled = loop.create_task(a.drain())
+		loop.run_until_complete(asyncio.sleep(0))
+		cancelled.cancel()
+		loop.run_until_complete(asyncio.sleep(0))
+		a.close()
+		with self.assertRaises(ConnectionError):
+			loop.run_until_complete(drain)
+
+	def test_close_after_cancelled_drain(self):
+		a, b = connection_pair(self.clock, {"latency": 0.02})
+		loop = asyncio.get_event_loop()
+		errors = []
+		loop.set_exception_handler(lambda loop, context: errors.append(context))
+		self.addCleanup(loop.set_exception_handler, None)
+		for i in range(100):
+			a.send(bytes([0x53, i]), Reliability.ReliableOrdered)
+		drain = loop.create_task(a.drain())
+		loop.run_until_complete(asyncio.sleep(0))
+		drain.cancel()
+		loop.run_until_complete(asyncio.sleep(0))
+		a.close()
+		del drain
+		gc.collect()
+		self.assertEqual(errors, [])  # no "Future exception was never retrieved"
+
+	def test_close_while_pacing(self):
+		a, b = connection_pair(self.clock, {"latency": 0.02}, {"congestion_control": DelayCongestionControl})
+		for i in range(100):
+			a.send(bytes([0x53, i]), Reliability.ReliableOrdered)
+		self.assertTrue(self.clock.run_until(lambda: a._sends, 10))
+		a.close()
+		sent = a._transport.sent
+		self.clock.advance(1)
+		self.assertEqual(a._transport.sent, sent)
+		self.assertIsNone(a._send_paced_handle)
+
+class SendManyTest(unittest.TestCase):
+	def setUp(self):
+		self.clock = VirtualClock()
+		self.received = []
+		self.a, self.b = connection_pair(self.clock, {"latency": 0.02})
+		self.b._dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: self.received.append(data))
+
+	def test_coalesced(self):
+		packets = [bytes([0x53, i]) + bytes(50) for i in range(8)]
+		self.a.send_many(packets)
+		self.assertEqual(self.a._transport.sent, 1)
+		self.assertTrue(self.clock.run_until(lambda: len(self.received) == len(packets), 10))
+		self.assertEqual(self.received, packets)
+
+	def test_mtu(self):
+		packets = [bytes([0x53, i]) + bytes(500) for i in range(8)] + [bytes([0x53]) + bytes(3000)]
+		self.a._packets_sent = -100  # don't hold anything back for the congestion window
+		self.a.send_many(packets, Reliability.Reliable)
+		self.assertEqual(self.a._transport.sent, 4 + 3)
+		self.assertTrue(self.clock.run_until(lambda: len(self.received) == len(packets), 10))
+		self.assertEqual(sorted(self.received), sorted(packets))
+		self.assertEqual(self.a._transport.too_large, 0)
+
+class ResendLimitTest(unittest.TestCase):
+	def setUp(self):
+		self.clock = VirtualClock()
+		self.received = []
+
+	def pair(self, link_options=None, **connection_options):
+		a, b = connection_pair(self.clock, dict({"latency": 0.02}, **(link_options or {})), connection_options)
+		b._dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: self.received.append(data))
+		return a, b
+
+	def test_shared_broadcast(self):
+		store = ResendStore()
+		dispatcher = EventDispatcher()
+		conns = [RaknetConnection(Mock(), dispatcher, ("10.0.0.1", 2000 + i), clock=self.clock, resend_store=store) for i in range(10)]
+		payload = bytes([0x53]) + bytes(50000)
+		conns[0].broadcast(payload)
+		self.assertEqual(store.bytes, len(payload))
+		self.assertEqual(store.packet_bytes, 10 * len(payload))
+		self.assertEqual(conns[3].get_stats()["resend_bytes"], len(payload))
+		for conn in conns:
+			conn.close()
+		self.assertEqual(store.get_stats(), {"bytes": 0, "packet_bytes": 0, "buffers": 0})
+
+	def test_queue(self):
+		a, b = self.pair(max_resend_bytes=3000)
+		packets = [bytes([0x53, i]) + bytes(998) for i in range(20)]
+		for packet in packets:
+			a.send(packet, Reliability.ReliableOrdered)
+		self.assertEqual(a.get_stats()["resend_bytes"], 3000)
+		self.assertEqual(a.get_stats()["queued_bytes"], 17000)
+		max_resend_bytes = 0
+		while len(self.received) < len(packets):
+			max_resend_bytes = max(max_resend_bytes, a.get_stats()["resend_bytes"])
+			self.clock.advance(0.01)
+			self.assertLess(self.clock.time(), 10)
+		self.assertEqual(self.received, packets)
+		self.assertLessEqual(max_resend_bytes, 3000)
+		self.assertIsNone(a._backlog)
+
+	def test_unreliable_not_queued(self):
+		a, b = self.pair(max_resend_bytes=1000)
+		a.send(bytes([0x53]) + bytes(999), Reliability.Reliable)
+		a.send(b"\x53reliable", Reliability.Reliable)
+		self.assertEqual(a.get_stats()["queued_bytes"], 9)
+		sent = a._transport.sent
+		a._packets_sent = 0  # make room in the congestion window
+		a.send(b"\x53unreliable", Reliability.Unreliable)
+		self.assertEqual(a.get_stats()["queued_bytes"], 9)
+		self.assertEqual(a._transport.sent, sent + 1)
+
+	def test_global_limit(self):
+		store = ResendStore(max_bytes=5000)
+		a, b = self.pair(resend_store=store)
+		for i in range(10):
+			a.send(bytes([0x53, i]) + bytes(998), Reliability.Reliable)
+		self.assertEqual(store.bytes, 5000)
+		self.assertTrue(self.clock.run_until(lambda: len(self.received) == 10, 10))
+
+	def test_stalled_remote_closed(self):
+		a, b = self.pair({"loss": 1}, max_resend_bytes=2000, max_queued_bytes=10000)
+		closed = []
+		a._dispatcher.add_listener(ConnectionEvent.Close, closed.append)
+		for i in range(20):
+			a.send(bytes([0x53, i]) + bytes(998), Reliability.ReliableOrdered)
+			if closed:
+				break
+		self.assertEqual(closed, [a])
+		self.assertEqual(i, 12)  # 2000 bytes in flight, then 11 * 1000 queued
+		self.assertEqual(a.get_stats()["resend_bytes"], 0)
+		self.assertEqual(a.get_stats()["queued_bytes"], 0)
+		self.assertEqual(a._resend_store.bytes, 0)
+
+class MtuTest(unittest.TestCase):
+	def setUp(self):
+		self.clock = VirtualClock()
+		self.received = []
+
+	def pair(self, link_mtu, **connection_options):
+		a, b = connection_pair(self.clock, {"latency": 0.02, "mtu": link_mtu}, connection_options)
+		b._dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: self.received.append(data))
+		return a, b
+
+	def test_sizes_near_limit(self):
+		a, b = self.pair(1492, mtu=1492)
+		payloads = [bytes([0x53]) + bytes(size) for size in range(1420, 1500)]
+		for payload in payloads:
+			a.send(payload, Reliability.Reliable)
+		self.assertTrue(self.clock.run_until(lambda: len(self.received) == len(payloads), 10))
+		self.assertEqual(sorted(self.received, key=len), payloads)
+		self.assertEqual(a._transport.too_large, 0)
+
+	def establish(self, a):
+		"""Send a ReliableOrdered packet like the first game message after the handshake, probing starts once it's acked."""
+		a.send(b"\x53", Reliability.ReliableOrdered)
+		self.assertTrue(self.clock.run_until(lambda: self.received == [b"\x53"], 5))
+		self.received.clear()
+
+	def test_probe(self):
+		a, b = self.pair(1492, probe_mtus=(576, 1492))
+		self.establish(a)
+		self.clock.advance(1)
+		self.assertEqual(a.get_stats()["mtu"], 1492)
+		self.assertEqual(self.received, [])  # the probe isn't delivered
+		payload = bytes([0x53]) + bytes(4000)
+		sent = a._transport.sent
+		a.send(payload, Reliability.ReliableOrdered)
+		self.assertTrue(self.clock.run_until(lambda: self.received == [payload], 10))
+		self.assertEqual(a._transport.sent - sent, 3)  # 4 with the default mtu
+
+	def test_probe_not_before_established(self):
+		a, b = self.pair(1492, probe_mtus=(1492,))
+		a.send(b"\x53", Reliability.Reliable)
+		self.clock.advance(5)
+		self.assertEqual(a.get_stats()["mtu"], 1228)
+		self.assertEqual(a._transport.sent, 1)
+		self.received.clear()
+		self.establish(a)
+		self.clock.advance(1)
+		self.assertEqual(a.get_stats()["mtu"], 1492)
+		self.assertEqual(self.received, [])
+
+	def test_probe_fallback(self):
+		a, b = self.pair(1400, probe_mtus=(1492, 1450, 1300))
+		self.establish(a)
+		self.clock.advance(5)
+		self.assertEqual(a.get_stats()["mtu"], 1300)
+		self.assertEqual(a._transport.too_large, 2)
+		self.assertIsNone(a._mtu_probe)
+		self.assertEqual(self.received, [])
+
+	def test_probe_no_larger_mtu(self):
+		a, b = self.pair(1228, probe_mtus=(1492,))
+		self.establish(a)
+		self.clock.advance(5)
+		self.assertEqual(a.get_stats()["mtu"], 1228)
+		payload = bytes([0x53]) + bytes(4000)
+		a.send(payload, Reliability.ReliableOrdered)
+		self.assertTrue(self.clock.run_until(lambda: payload in self.received, 10))
+
+class StreamTest(unittest.TestCase):
+	def setUp(self):
+		self.clock = VirtualClock()
+		self.received = []
+		self.payload = bytes([0x53]) + bytes(i % 251 for i in range(200000))
+
+	def pair(self, **connection_options):
+		a, b = connection_pair(self.clock, {"latency": 0.02}, connection_options)
+		b._dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: self.received.append(data))
+		return a, b
+
+	def test_bytes(self):
+		a, b = self.pair()
+		acked = []
+		stream = a.send_stream(self.payload, max_in_flight=20000, progress=lambda stream: acked.append(stream.acked))
+		# only what the window allows has been split
+		self.assertLess(stream.sent, 20000)
+		max_unacked = 0
+		while not stream.done():
+			max_unacked = max(max_unacked, stream.sent - stream.acked)
+			self.clock.advance(0.01)
+			self.assertLess(self.clock.time(), 60)
+		self.assertLessEqual(max_unacked, 20000 + 1200)
+		self.assertEqual(self.received, [self.payload])
+		self.assertEqual(acked, sorted(acked))
+		self.assertEqual(acked[-1], len(self.payload))
+		self.assertEqual(a._transport.too_large, 0)
+		self.assertIsNone(a._streams)
+
+	def test_wait(self):
+		a, b = self.pair()
+		loop = asyncio.get_event_loop()
+		stream = a.send_stream(self.payload)
+		wait = loop.create_task(stream.wait())
+		loop.run_until_complete(asyncio.sleep(0))
+		self.assertFalse(wait.done())
+		self.assertTrue(self.clock.run_until(stream.done, 60))
+		loop.run_until_complete(wait)
+		self.assertEqual(self.received, [self.payload])
+
+	def test_file_and_iterable(self):
+		a, b = self.pair()
+		file = io.BytesIO(b"header" + self.payload)
+		file.seek(6)
+		a.send_stream(file, reliability=Reliability.Reliable)
+		pieces = (self.payload[i:i+777] for i in range(0, len(self.payload), 777))
+		a.send_stream(pieces, len(self.payload))
+		self.assertTrue(self.clock.run_until(lambda: len(self.received) == 2, 60))
+		self.assertEqual(self.received, [self.payload, self.payload])
+
+	def test_ordered_after_stream(self):
+		a, b = self.pair()
+		a.send_stream(self.payload)
+		a.send(b"\x53after", Reliability.ReliableOrdered)
+		self.assertTrue(self.clock.run_until(lambda: len(self.received) == 2, 60))
+		self.assertEqual(self.received, [self.payload, b"\x53after"])
+
+	def test_source_too_short(self):
+		a, b = self.pair()
+		closed = []
+		a._dispatcher.add_listener(ConnectionEvent.Close, closed.append)
+		stream = a.send_stream(iter([self.payload]), len(self.payload) + 1)
+		self.clock.run_until(stream.done, 60)
+		self.assertEqual(closed, [a])
+		loop = asyncio.get_event_loop()
+		with self.assertRaises(ConnectionError):
+			loop.run_until_complete(stream.wait())
+
+	def test_invalid(self):
+		a, b = self.pair()
+		with self.assertRaises(ValueError):
+			a.send_stream(self.payload, reliability=Reliability.Unreliable)
+		with self.assertRaises(ValueError):
+			a.send_stream(iter([self.payload]))
+		with self.assertRaises(ValueError):
+			a.send_stream(b"")
+
+	def test_download_progress(self):
+		a, b = self.pair(download_progress_interval=0.05)
+		a.send_stream(self.payload)
+		self.assertTrue(self.clock.run_until(lambda: self.payload in self.received, 60))
+		progress = [ReadStream(packet[1:]) for packet in self.received if packet[0] == Message.DownloadProgress.value]
+		self.assertGreater(len(progress), 2)
+		counts = [(stream.read(c_uint), stream.read(c_uint), stream.read(c_uint)) for stream in progress]
+		self.assertEqual([received for received, total, length in counts], sorted(received for received, total, length in counts))
+		self.assertTrue(all(total == math.ceil(len(self.payload) / length) for received, total, length in counts))
+
+class InboundLimitTest(unittest.TestCase):
+	ADDRESS = "127.0.0.1", 1234
+
+	def setUp(self):
+		self.clock = VirtualClock()
+		self.transport = Mock()
+		self.dispatcher = EventDispatcher()
+		self.listener = Mock()
+		self.dispatcher.add_listener(ConnectionEvent.Receive, self.listener)
+		self.close_listener = Mock()
+		self.dispatcher.add_listener(ConnectionEvent.Close, self.close_listener)
+
+	def connect(self, **limits):
+		self.limits = InboundLimits(**limits)
+		self.conn = RaknetConnection(self.transport, self.dispatcher, self.ADDRESS, inbound_limits=self.limits, clock=self.clock)
+
+	def packet(self, data, message_number=0, split_packet_info=None, reliability=Reliability.Reliable):
+		sender = RaknetConnection(Mock(), EventDispatcher(), self.ADDRESS, clock=self.clock)
+		sender._send_packet(data, message_number, reliability, None, split_packet_info)
+		return sender._transport.sendto.call_args[0][0]
+
+	def test_datagram_rate(self):
+		self.connect(datagrams_per_second=2)
+		for i in range(4):
+			self.conn.handle_datagram(self.packet(bytes((0x53, i)), i))
+		self.assertEqual(self.listener.call_count, 2)
+		self.assertEqual(self.conn.get_stats()["datagrams_limited"], 2)
+		self.assertEqual(self.limits.datagrams_limited, 2)
+		self.clock.advance(0.5)
+		self.conn.handle_datagram(self.packet(b"\x53\x02", 2))
+		self.assertEqual(self.listener.call_count, 3)
+
+	def test_byte_rate(self):
+		self.connect(bytes_per_second=100)
+		self.conn.handle_datagram(self.packet(b"\x53" + bytes(60), 0))
+		self.conn.handle_datagram(self.packet(b"\x53" + bytes(60), 1))
+		self.assertEqual(self.listener.call_count, 1)
+
+	def test_byte_rate_keeps_datagram_budget(self):
+		self.connect(datagrams_per_second=2, bytes_per_second=100)
+		self.conn.handle_datagram(self.packet(b"\x53" + bytes(200), 0))  # over the byte limit
+		self.conn.handle_datagram(self.packet(b"\x53\x01", 1))
+		self.conn.handle_datagram(self.packet(b"\x53\x02", 2))
+		self.assertEqual(self.listener.call_count, 2)
+		self.assertEqual(self.conn.get_stats()["datagrams_limited"], 1)
+
+	def test_message_rate(self):
+		self.connect(messages_per_second={Message.UserPacket: 1})
+		self.conn.handle_datagram(self.packet(b"\x53\x00", 0))
+		self.conn.handle_datagram(self.packet(b"\x53\x01", 1))
+		self.conn.handle_datagram(self.packet(b"\x00\x01", 2))  # other message types aren't limited
+		self.assertEqual([call[0][0] for call in self.listener.call_args_list], [b"\x53\x00", b"\x00\x01"])
+		self.assertNotIn(1, self.conn._acks)  # not acked, so that the remote resends it
+		self.assertEqual(self.conn.get_stats()["messages_limited"], 1)
+		self.clock.advance(1)
+		self.conn.handle_datagram(self.packet(b"\x53\x01", 1))  # resend
+		self.assertEqual(self.listener.call_count, 3)
+
+	def test_duplicates_not_limited(self):
+		self.connect(messages_per_second={Message.UserPacket: 2})
+		self.conn.handle_datagram(self.packet(b"\x53\x00", 0))
+		for _ in range(3):
+			self.conn.handle_datagram(self.packet(b"\x53\x00", 0))  # resends, the ack was lost
+		self.assertEqual(list(self.conn._acks), [0])
+		self.conn.handle_datagram(self.packet(b"\x53\x01", 1))
+		self.assertEqual(self.listener.call_count, 2)
+		self.assertEqual(self.conn.get_stats()["messages_limited"], 0)
+		self.assertEqual(self.conn.get_stats()["duplicates_dropped"], 3)
+
+	def test_close_policy(self):
+		self.connect(messages_per_second={Message.UserPacket: 1}, policy=OverflowPolicy.Close)
+		self.conn.handle_datagram(self.packet(b"\x53\x00", 0))
+		self.close_listener.assert_not_called()
+		self.conn.handle_datagram(self.packet(b"\x53\x01", 1))
+		self.close_listener.assert_called_once_with(self.conn)
+
+	def test_invalid_split_packets(self):
+		self.connect()
+		for split_packet_info in ((0, 0, 0), (0, 2, 2), (0, 0, MAX_SPLIT_PACKET_COUNT + 1)):
+			self.conn.handle_datagram(self.packet(b"\x53", 0, split_packet_info))
+		self.conn.handle_datagram(self.packet(b"\x53", 0, (1, 0, 2)))
+		self.conn.handle_datagram(self.packet(b"\x53", 1, (1, 1, 3)))  # count doesn't match the first part
+		self.assertEqual(self.conn.get_stats()["invalid_datagrams"], 4)
+		self.assertEqual(self.limits.invalid_datagrams, 4)
+		self.assertEqual(list(self.conn._acks), [0])
+		self.listener.assert_not_called()
+
+	def test_too_many_split_packets(self):
+		self.connect()
+		for i in range(MAX_SPLIT_PACKETS + 1):
+			self.conn.handle_datagram(self.packet(b"\x53", i, (i, 0, 2)))
+		self.assertEqual(len(self.conn._split_packet_queue), MAX_SPLIT_PACKETS)
+		self.assertNotIn(MAX_SPLIT_PACKETS, self.conn._acks)
+
+	def test_unreliable_split_packets_dropped(self):
+		self.connect()
+		for i in range(MAX_SPLIT_PACKETS):
+			self.conn.handle_datagram(self.packet(b"\x53", i, (i, 0, 2), Reliability.Unreliable))  # the other parts are lost
+			self.clock.advance(0.01)
+		self.conn.handle_datagram(self.packet(b"\x53", MAX_SPLIT_PACKETS, (MAX_SPLIT_PACKETS, 0, 2)))
+		self.assertIn(MAX_SPLIT_PACKETS, self.conn._acks)  # the oldest unreliable one made room
+		self.assertNotIn(0, self.conn._split_packet_queue)
+		self.assertEqual(len(self.conn._split_packet_queue), MAX_SPLIT_PACKETS)
+		self.clock.advance(SPLIT_PACKET_TIMEOUT + 10)
+		self.assertEqual(list(self.conn._split_packet_queue), [MAX_SPLIT_PACKETS])  # reliable ones are kept, their parts will be resent
+		self.assertEqual(self.conn.get_stats()["split_packets_dropped"], MAX_SPLIT_PACKETS)
+
+	@patch("pyraknet.transports.raknet.connection.MAX_SPLIT_PACKET_BYTES", 1000)
+	def test_split_packet_bytes(self):
+		self.connect()
+		self.conn.handle_datagram(self.packet(b"\x53" + bytes(99), 0, (0, 0, 5)))  # 500 bytes and the overhead of 5 parts
+		self.assertGreater(self.conn.get_stats()["split_packet_bytes"], 500)
+		self.conn.handle_datagram(self.packet(b"\x53" + bytes(99), 1, (1, 0, 5)))
+		self.assertNotIn(1, self.conn._acks)  # stalled, both don't fit
+		for i in range(1, 5):
+			self.conn.handle_datagram(self.packet(bytes(100), 1 + i, (0, i, 5)))
+		self.assertEqual(self.listener.call_count, 1)
+		self.assertEqual(self.conn.get_stats()["split_packet_bytes"], 0)
+		self.conn.handle_datagram(self.packet(b"\x53" + bytes(99), 1, (1, 0, 5)))  # resend
+		self.assertIn(1, self.conn._acks)
+		self.conn.handle_datagram(self.packet(b"\x53" + bytes(99), 6, (2, 0, 20)))  # can never fit
+		self.assertEqual(self.conn.get_stats()["invalid_datagrams"], 1)
+
+	@patch("pyraknet.transports.raknet.connection.MAX_SPLIT_PACKET_BYTES", 1000)
+	def test_unreliable_split_packet_bytes_dropped(self):
+		self.connect()
+		self.conn.handle_datagram(self.packet(b"\x53" + bytes(99), 0, (0, 0, 5), Reliability.Unreliable))
+		self.conn.handle_datagram(self.packet(b"\x53" + bytes(99), 1, (1, 0, 5)))
+		self.assertIn(1, self.conn._acks)  # the unreliable one was dropped to make room
+		self.assertEqual(list(self.conn._split_packet_queue), [1])
+		self.conn.handle_datagram(self.packet(b"\x53" + bytes(99), 2, (2, 0, 5), Reliability.Unreliable))
+		self.assertEqual(list(self.conn._split_packet_queue), [1])  # reliable ones aren't dropped
+		self.assertEqual(self.conn.get_stats()["split_packets_dropped"], 1)
+
+	def test_malformed(self):
+		self.connect(policy=OverflowPolicy.Close)
+		dgram = bytearray(self.packet(b"\x53test"))
+		dgram[8] |= 0x38  # reliability 7
+		self.conn = RaknetConnection(self.transport, self.dispatcher, self.ADDRESS, clock=self.clock)
+		self.conn.handle_datagram(bytes(dgram))
+		self.conn.handle_datagram(self.packet(b"\x53test")[:-2])
+		self.assertEqual(self.conn.get_stats()["invalid_datagrams"], 2)
+		self.close_listener.assert_not_called()  # without limits, malformed datagrams are only dropped
+		self.listener.assert_not_called()
+
+	def test_invalid_acks(self):
+		self.connect(policy=OverflowPolicy.Close)
+		remote = RaknetConnection(Mock(), EventDispatcher(), self.ADDRESS, clock=self.clock)
+		remote._acks.insert(5)  # was never sent
+		remote._send_acks_only()
+		self.conn.handle_datagram(remote._transport.sendto.call_args[0][0])
+		self.assertEqual(self.limits.invalid_datagrams, 1)
+		self.close_listener.assert_called_once_with(self.conn)
+
+	def test_old_acks_ignored(self):
+		a, b = connection_pair(self.clock, {"latency": 0.02})
+		a.send(b"\x53", Reliability.Reliable)
+		self.assertTrue(self.clock.run_until(lambda: not a._resends, 5))
+		remote = RaknetConnection(Mock(), EventDispatcher(), self.ADDRESS, clock=self.clock)
+		remote._acks.insert(0)
+		remote._send_acks_only()
+		a.handle_datagram(remote._transport.sendto.call_args[0][0])  # acked again
+		self.assertEqual(a.get_stats()["invalid_datagrams"], 0)
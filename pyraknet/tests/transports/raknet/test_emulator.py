@@ -0,0 +1,85 @@
+import unittest
+
+from pyraknet.transports.abc import ConnectionEvent, Reliability
+from pyraknet.transports.raknet.clock import VirtualClock
+from pyraknet.transports.raknet.emulator import connection_pair, EmulatedLink
+
+class VirtualClockTest(unittest.TestCase):
+	def test_timers_in_order(self):
+		clock = VirtualClock()
+		called = []
+		clock.call_later(2, lambda: called.append((2, clock.time())))
+		clock.call_later(1, lambda: called.append((1, clock.time())))
+		clock.call_later(1, lambda: called.append((3, clock.time())))
+		clock.call_later(5, lambda: called.append((5, clock.time())))
+		clock.advance(3)
+		self.assertEqual(called, [(1, 1), (3, 1), (2, 2)])
+		self.assertEqual(clock.time(), 3)
+
+	def test_cancel(self):
+		clock = VirtualClock()
+		called = []
+		clock.call_later(1, called.append, 1).cancel()
+		clock.advance(2)
+		self.assertEqual(called, [])
+
+class EmulatedLinkTest(unittest.TestCase):
+	def setUp(self):
+		self.clock = VirtualClock()
+		self.received = []
+
+	def send(self, count, **options):
+		link = EmulatedLink(self.clock, lambda data: self.received.append((self.clock.time(), data)), **options)
+		for i in range(count):
+			link.sendto(bytes([i % 256]))
+		self.clock.advance(10)
+		return link
+
+	def test_latency(self):
+		self.send(1, latency=0.1)
+		self.assertEqual(self.received, [(0.1, b"\x00")])
+
+	def test_jitter_keeps_order(self):
+		self.send(50, latency=0.1, jitter=0.05)
+		self.assertEqual([data for _, data in self.received], [bytes([i]) for i in range(50)])
+
+	def test_loss(self):
+		link = self.send(1000, loss=0.1)
+		self.assertEqual(len(self.received), 1000 - link.lost)
+		self.assertTrue(50 < link.lost < 150)
+
+	def test_bandwidth(self):
+		link = self.send(10, bandwidth=10, queue_limit=5)
+		self.assertEqual(len(self.received), 5)
+		self.assertEqual(link.dropped, 5)
+		self.assertEqual(self.received[-1][0], 0.5)
+
+	def test_reproducible(self):
+		self.send(100, latency=0.1, jitter=0.05, loss=0.1, duplicate=0.1, reorder=0.1)
+		first = self.received
+		self.received = []
+		self.clock = VirtualClock()
+		self.send(100, latency=0.1, jitter=0.05, loss=0.1, duplicate=0.1, reorder=0.1)
+		self.assertEqual(self.received, first)
+
+class ConnectionPairTest(unittest.TestCase):
+	def transfer(self, count, link_options):
+		clock = VirtualClock()
+		a, b = connection_pair(clock, link_options)
+		received = []
+		b._dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: received.append(data))
+		sent = [bytes([0x53]) + i.to_bytes(4, "little") for i in range(count)]
+		for data in sent:
+			a.send(data, Reliability.ReliableOrdered)
+		self.assertTrue(clock.run_until(lambda: len(received) == count, 60))
+		self.assertEqual(received, sent)
+
+	def test_clean(self):
+		self.transfer(50, {"latency": 0.05})
+
+	def test_impaired(self):
+		self.transfer(50, {"latency": 0.05, "jitter": 0.02, "loss": 0.1, "duplicate": 0.05, "reorder": 0.05, "seed": 1})
+
+	def test_first_packet_lost(self):
+		# losing everything in flight must not block sending
+		self.transfer(5, {"latency": 0.05, "loss": 0.5, "seed": 2})
@@ -0,0 +1,78 @@
+import unittest
+
+from pyraknet.transports.raknet._reorder import ReorderBuffer
+
+class ReorderBufferTest(unittest.TestCase):
+	def setUp(self):
+		self.buffer = ReorderBuffer(4, 100)
+
+	def release(self, now=0):
+		released = []
+		while True:
+			packet = self.buffer.pop(now)
+			if packet is None:
+				return released
+			released.append(packet)
+
+	def test_in_order(self):
+		self.buffer.advance(0)
+		self.assertEqual(self.release(), [])
+		self.assertEqual(self.buffer.head, 1)
+
+	def test_release(self):
+		self.assertTrue(self.buffer.insert(2, b"2", 0))
+		self.assertTrue(self.buffer.insert(1, b"1", 0))
+		self.assertEqual(self.buffer.depth, 2)
+		self.buffer.advance(0)
+		self.assertEqual(self.release(), [b"1", b"2"])
+		self.assertEqual(self.buffer.head, 3)
+		self.assertEqual(self.buffer.depth, 0)
+		self.assertEqual(self.buffer.bytes, 0)
+		self.assertEqual(self.buffer.max_depth, 2)
+
+	def test_release_until_hole(self):
+		self.buffer.insert(1, b"1", 0)
+		self.buffer.insert(3, b"3", 0)
+		self.buffer.advance(0)
+		self.assertEqual(self.release(), [b"1"])
+		self.assertEqual(self.buffer.head, 2)
+		self.buffer.advance(0)
+		self.assertEqual(self.release(), [b"3"])
+
+	def test_insert_duplicate(self):
+		self.assertTrue(self.buffer.insert(1, b"1", 0))
+		self.assertFalse(self.buffer.insert(1, b"1", 0))
+		self.assertEqual(self.buffer.depth, 1)
+
+	def test_fits_capacity(self):
+		self.assertTrue(self.buffer.fits(0, 1000))  # the head is never buffered
+		self.assertTrue(self.buffer.fits(3, 1))
+		self.assertFalse(self.buffer.fits(4, 1))
+
+	def test_fits_bytes(self):
+		self.buffer.insert(1, bytes(60), 0)
+		self.assertTrue(self.buffer.fits(2, 40))
+		self.assertFalse(self.buffer.fits(2, 41))
+
+	def test_fits_reserved(self):
+		self.buffer.reserve(60)
+		self.assertFalse(self.buffer.fits(2, 41))
+		self.buffer.unreserve(60)
+		self.assertTrue(self.buffer.fits(2, 100))
+
+	def test_ring_wraps(self):
+		for i in range(20):
+			self.buffer.insert(self.buffer.head + 1, bytes([i]), 0)
+			self.buffer.advance(0)
+			self.assertEqual(self.release(), [bytes([i])])
+		self.assertEqual(self.buffer.head, 40)
+
+	def test_blocked_time(self):
+		self.buffer.insert(1, b"1", 10)
+		self.buffer.insert(3, b"3", 11)
+		self.buffer.advance(12)
+		self.assertEqual(self.release(12), [b"1"])
+		self.buffer.advance(15)
+		self.assertEqual(self.release(15), [b"3"])
+		self.assertEqual(self.buffer.blocked_time, 5)
+		self.assertEqual(self.buffer.max_blocked_time, 3)
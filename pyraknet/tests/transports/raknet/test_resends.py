@@ -0,0 +1,60 @@
+import unittest
+
+from pyraknet.transports.raknet.resends import ResendStore
+
+class ResendStoreTest(unittest.TestCase):
+	def test_shared(self):
+		store = ResendStore()
+		payload = bytes(1000)
+		for _ in range(3):
+			store.add(payload)
+		self.assertEqual(store.get_stats(), {"bytes": 1000, "packet_bytes": 3000, "buffers": 1})
+		for _ in range(3):
+			store.remove(payload)
+		self.assertEqual(store.get_stats(), {"bytes": 0, "packet_bytes": 0, "buffers": 0})
+
+	def test_views(self):
+		store = ResendStore()
+		payload = bytes(1000)
+		view = memoryview(payload)
+		store.add(view[:600])
+		store.add(view[600:])
+		store.add(b"other")
+		self.assertEqual(store.get_stats(), {"bytes": 1005, "packet_bytes": 1005, "buffers": 2})
+		store.remove(view[:600])
+		self.assertEqual(store.bytes, 1005)  # the rest of the payload is still referenced
+		store.remove(view[600:])
+		self.assertEqual(store.bytes, 5)
+
+	def test_full(self):
+		store = ResendStore(max_bytes=100)
+		store.add(bytes(99))
+		self.assertFalse(store.full())
+		store.add(bytes(1))
+		self.assertTrue(store.full())
+
+	def test_split_shared(self):
+		store = ResendStore()
+		payload = bytes(range(250)) * 10
+		chunks = store.split(payload, 1000)
+		self.assertEqual([bytes(chunk) for chunk in chunks], [payload[:1000], payload[1000:2000], payload[2000:]])
+		for chunk in chunks:
+			store.add(chunk)
+		self.assertIs(store.split(payload, 1000), chunks)
+		self.assertIsNot(store.split(payload, 500), chunks)
+		self.assertEqual(store.bytes, 2500)
+		for chunk in chunks:
+			store.remove(chunk)
+		self.assertEqual(store.get_stats(), {"bytes": 0, "packet_bytes": 0, "buffers": 0})
+
+	def test_split_view(self):
+		store = ResendStore()
+		buffer = bytearray(range(250)) * 10
+		chunks = store.split(memoryview(buffer)[:2400], 1000)
+		self.assertEqual([len(chunk) for chunk in chunks], [1000, 1000, 400])
+		for chunk in chunks:
+			store.add(chunk)
+		self.assertEqual(store.get_stats(), {"bytes": 2500, "packet_bytes": 2400, "buffers": 1})
+		for chunk in chunks:
+			store.remove(chunk)
+		self.assertEqual(store.get_stats(), {"bytes": 0, "packet_bytes": 0, "buffers": 0})
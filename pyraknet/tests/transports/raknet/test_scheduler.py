@@ -0,0 +1,102 @@
+import unittest
+from unittest.mock import Mock
+
+from event_dispatcher import EventDispatcher
+
+from pyraknet.messages import Message
+from pyraknet.transports.abc import ConnectionEvent, Reliability
+from pyraknet.transports.raknet.clock import VirtualClock
+from pyraknet.transports.raknet.connection import RaknetConnection
+from pyraknet.transports.raknet.scheduler import InboundScheduler
+from pyraknet.transports.raknet.tracing import Tracer
+
+class InboundSchedulerTest(unittest.TestCase):
+	def setUp(self):
+		self.clock = VirtualClock()
+		self.dispatcher = EventDispatcher()
+		self.received = []
+		self.dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: self.received.append((conn.get_address()[1], data)))
+
+	def connections(self, count, **scheduler_options):
+		self.scheduler = InboundScheduler(clock=self.clock, **scheduler_options)
+		return [RaknetConnection(Mock(), self.dispatcher, ("127.0.0.1", i), inbound_scheduler=self.scheduler, clock=self.clock) for i in range(count)]
+
+	def datagrams(self, packets):
+		sender = RaknetConnection(Mock(), EventDispatcher(), ("127.0.0.1", 1000), clock=self.clock)
+		sender._packets_sent = -len(packets)
+		for packet in packets:
+			sender.send(packet, Reliability.ReliableOrdered)
+		return [call[0][0] for call in sender._transport.sendto.call_args_list]
+
+	def test_round_robin(self):
+		heavy, light = self.connections(2, max_messages=None)
+		for datagram in self.datagrams([bytes((0x53, i)) for i in range(10)]):
+			heavy.handle_datagram(datagram)
+		light.handle_datagram(self.datagrams([b"\x53light"])[0])
+		self.assertEqual(self.received, [])
+		self.assertEqual(self.scheduler.get_stats()["queued"], 11)
+		self.assertEqual(heavy.get_stats()["inbound_queued"], 10)
+		# acks don't wait for the messages to be dispatched
+		self.assertIn(9, heavy._acks)
+		self.clock.advance(0)
+		self.assertEqual(self.received[:3], [(0, b"\x53\x00"), (1, b"\x53light"), (0, b"\x53\x01")])
+		self.assertEqual([data for port, data in self.received if port == 0], [bytes((0x53, i)) for i in range(10)])
+		self.assertEqual(self.scheduler.get_stats()["queued"], 0)
+		self.assertEqual(self.scheduler.get_stats()["max_queued"], 11)
+
+	def test_budget(self):
+		conn, = self.connections(1, max_messages=3)
+		for datagram in self.datagrams([bytes((0x53, i)) for i in range(5)]):
+			conn.handle_datagram(datagram)
+		# one event loop iteration (advancing the clock would also run the continuation right away)
+		self.scheduler._drain()
+		self.assertEqual(len(self.received), 3)
+		self.assertEqual(self.scheduler.get_stats()["budget_exhausted"], 1)
+		self.clock.advance(0)
+		self.assertEqual(len(self.received), 5)
+
+	def test_max_depth(self):
+		conn, = self.connections(1, max_depth=2)
+		datagrams = self.datagrams([bytes((0x53, i)) for i in range(3)])
+		for datagram in datagrams:
+			conn.handle_datagram(datagram)
+		self.assertNotIn(2, conn._acks)  # not acked, so that the remote resends it
+		self.assertEqual(conn.get_stats()["datagrams_stalled"], 1)
+		self.clock.advance(0)
+		conn.handle_datagram(datagrams[2])  # resend
+		self.clock.advance(0)
+		self.assertEqual(len(self.received), 3)
+
+	def test_close_discards(self):
+		conn, other = self.connections(2)
+		close_listener = Mock()
+		self.dispatcher.add_listener(ConnectionEvent.Close, close_listener)
+		for datagram in self.datagrams([bytes((Message.DisconnectionNotification.value,)), b"\x53late"]):
+			conn.handle_datagram(datagram)
+		other.handle_datagram(self.datagrams([b"\x53other"])[0])
+		self.clock.advance(0)
+		close_listener.assert_called_once_with(conn)
+		self.assertEqual(self.received, [(1, b"\x53other")])
+		self.assertEqual(self.scheduler.get_stats()["queued"], 0)
+
+	def test_failing_listener(self):
+		failing, other = self.connections(2)
+
+		def fail(data, conn):
+			if conn is failing:
+				raise ValueError
+		self.dispatcher.add_listener(ConnectionEvent.Receive, fail)
+		failing.handle_datagram(self.datagrams([b"\x53fail"])[0])
+		other.handle_datagram(self.datagrams([b"\x53other"])[0])
+		with self.assertLogs("pyraknet.transports.raknet.scheduler"):
+			self.clock.advance(0)
+		self.assertEqual(self.received, [(0, b"\x53fail"), (1, b"\x53other")])
+
+	def test_tracing(self):
+		tracer = Tracer(sample_rate=1)
+		self.scheduler = InboundScheduler(clock=self.clock)
+		conn = RaknetConnection(Mock(), self.dispatcher, ("127.0.0.1", 0), inbound_scheduler=self.scheduler, tracer=tracer, clock=self.clock)
+		for datagram in self.datagrams([b"\x53a", b"\x53b"]):
+			conn.handle_datagram(datagram)
+		self.clock.advance(0.01)
+		self.assertEqual(tracer.stats[conn.get_address()].dispatch.count, 2)
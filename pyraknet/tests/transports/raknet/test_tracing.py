@@ -0,0 +1,133 @@
+import json
+import os
+import tempfile
+import unittest
+
+from pyraknet.transports.abc import ConnectionEvent, Reliability
+from pyraknet.transports.raknet.clock import VirtualClock
+from pyraknet.transports.raknet.emulator import connection_pair
+from pyraknet.transports.raknet.tracing import Tracer
+
+class TracingTest(unittest.TestCase):
+	def setUp(self):
+		self.clock = VirtualClock()
+		self.received = []
+		handle, self.path = tempfile.mkstemp(suffix=".jsonl")
+		os.close(handle)
+		self.addCleanup(os.remove, self.path)
+
+	def pair(self, tracer, **link_options):
+		link_options.setdefault("latency", 0.02)
+		a, b = connection_pair(self.clock, link_options, {"tracer": tracer})
+		b._dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: self.received.append(data))
+		return a, b
+
+	def read_traces(self):
+		with open(self.path) as file:
+			return [json.loads(line) for line in file]
+
+	def test_reliable(self):
+		tracer = Tracer(sample_rate=1, path=self.path)
+		a, b = self.pair(tracer)
+		a.send(b"\x53hello", Reliability.Reliable)
+		self.clock.advance(1)
+		tracer.close()
+		self.assertEqual(self.received, [b"\x53hello"])
+		stats = tracer.stats[a.get_address()]
+		self.assertEqual(stats.total.count, 1)
+		self.assertEqual(stats.queueing.percentile(50), 0)
+		self.assertEqual(stats.retransmit.count, 0)
+		# acks are delayed by up to 30 ms before they're sent
+		self.assertGreaterEqual(stats.total.max, 40000)
+		self.assertLess(stats.total.max, 80000)
+		self.assertEqual(tracer.stats[b.get_address()].dispatch.count, 1)
+
+		traces = self.read_traces()
+		outbound = [trace for trace in traces if trace["direction"] == "out"]
+		inbound = [trace for trace in traces if trace["direction"] == "in"]
+		self.assertEqual([event[0] for event in outbound[0]["events"]], ["send", "transmit", "ack"])
+		self.assertEqual(outbound[0]["reliability"], "Reliable")
+		self.assertEqual(outbound[0]["size"], 6)
+		self.assertEqual([event[0] for event in inbound[0]["events"]], ["arrive", "release", "dispatched"])
+
+	def test_retransmit(self):
+		tracer = Tracer(sample_rate=1)
+		a, b = self.pair(tracer, loss=0.3, seed=3)
+		for i in range(20):
+			a.send(bytes((0x53, i)), Reliability.ReliableOrdered)
+		self.assertTrue(self.clock.run_until(lambda: len(self.received) == 20 and not a._resends, 30))
+		stats = tracer.stats[a.get_address()]
+		self.assertEqual(stats.total.count, 20)
+		self.assertGreater(stats.retransmits, 0)
+		self.assertGreater(stats.retransmit.count, 0)
+		# lost packets held back later ones at the receiver
+		self.assertEqual(tracer.stats[b.get_address()].reorder.count, 20)
+		self.assertGreater(tracer.stats[b.get_address()].reorder.max, 0)
+
+	def test_split_packet(self):
+		tracer = Tracer(sample_rate=1, path=self.path)
+		a, b = self.pair(tracer)
+		payload = bytes([0x53]) + bytes(4000)
+		a.send(payload, Reliability.ReliableOrdered)
+		self.assertTrue(self.clock.run_until(lambda: not a._resends, 10))
+		tracer.close()
+		self.assertEqual(self.received, [payload])
+		outbound = [trace for trace in self.read_traces() if trace["direction"] == "out"]
+		self.assertEqual(len(outbound), 1)
+		self.assertEqual(outbound[0]["parts"], 4)
+		self.assertEqual(sum(1 for event in outbound[0]["events"] if event[0] == "ack"), 4)
+
+	def test_unreliable(self):
+		tracer = Tracer(sample_rate=1)
+		a, b = self.pair(tracer)
+		a.send(b"\x53", Reliability.Unreliable)
+		self.clock.advance(1)
+		stats = tracer.stats[a.get_address()]
+		self.assertEqual(stats.queueing.count, 1)
+		self.assertEqual(stats.total.count, 0)
+
+	def test_sampling(self):
+		tracer = Tracer(sample_rate=0.1, seed=1)
+		a, b = self.pair(tracer)
+		for i in range(1000):
+			a.send(bytes((0x53, i % 256)), Reliability.Reliable)
+			self.clock.advance(0.01)
+		self.assertTrue(self.clock.run_until(lambda: len(self.received) == 1000 and not a._resends, 30))
+		self.assertTrue(50 < tracer.total.total.count < 150)
+
+	def test_close(self):
+		tracer = Tracer(sample_rate=1, path=self.path)
+		a, b = self.pair(tracer)
+		a.send(b"\x53", Reliability.Reliable)
+		a.close()
+		tracer.close()
+		self.assertNotIn(a.get_address(), tracer.stats)
+		self.assertEqual(tracer.total.unfinished, 1)
+		self.assertEqual([event[0] for event in self.read_traces()[0]["events"]], ["send", "transmit"])
+
+	def test_queued(self):
+		tracer = Tracer(sample_rate=1)
+		a, b = connection_pair(self.clock, {"latency": 0.02}, {"tracer": tracer, "max_resend_bytes": 1})
+		a.send(b"\x53\x00", Reliability.Reliable)
+		a.send(b"\x53\x01", Reliability.Reliable)  # waits in the queue until the first one is acked
+		self.assertTrue(self.clock.run_until(lambda: a._backlog is None and not a._resends, 5))
+		stats = tracer.stats[a.get_address()]
+		self.assertEqual(stats.queueing.count, 2)
+		self.assertGreaterEqual(stats.queueing.max, 40000)
+
+	def test_queued_discarded(self):
+		tracer = Tracer(sample_rate=1, path=self.path)
+		a, b = connection_pair(self.clock, {"latency": 0.02}, {"tracer": tracer, "max_resend_bytes": 1, "max_queued_bytes": 1})
+		a.send(b"\x53\x00", Reliability.Reliable)
+		a.send(b"\x53\x01", Reliability.Reliable)  # closes the connection, the queue is over its limit
+		tracer.close()
+		self.assertEqual(tracer.total.dropped, 1)
+		self.assertEqual(tracer.total.unfinished, 1)
+		self.assertEqual(sorted([event[0] for event in trace["events"]] for trace in self.read_traces()), [["send", "discard"], ["send", "transmit"]])
+
+	def test_disabled(self):
+		a, b = self.pair(None)
+		self.assertIsNone(a._tracing)
+		a.send(b"\x53", Reliability.ReliableOrdered)
+		self.clock.advance(1)
+		self.assertEqual(self.received, [b"\x53"])
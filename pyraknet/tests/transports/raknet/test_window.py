@@ -0,0 +1,79 @@
+import unittest
+
+from pyraknet.transports.raknet._window import ReceivedWindow
+
+class ReceivedWindowTest(unittest.TestCase):
+	def setUp(self):
+		self.window = ReceivedWindow(16)
+
+	def test_insert_in_order(self):
+		for i in range(100):
+			self.assertTrue(self.window.insert(i))
+		self.assertEqual(self.window.base, 100)
+		self.assertEqual(self.window.duplicates, 0)
+
+	def test_duplicate(self):
+		self.assertTrue(self.window.insert(0))
+		self.assertFalse(self.window.insert(0))
+		self.assertEqual(self.window.duplicates, 1)
+
+	def test_duplicate_out_of_order(self):
+		for i in (0, 5, 3, 1):
+			self.assertTrue(self.window.insert(i))
+		for i in (5, 3, 1, 0):
+			self.assertFalse(self.window.insert(i))
+		self.assertEqual(self.window.duplicates, 4)
+		self.assertEqual(self.window.base, 2)
+
+	def test_fill_hole(self):
+		for i in (0, 2, 3, 4):
+			self.window.insert(i)
+		self.assertEqual(self.window.base, 1)
+		self.window.insert(1)
+		self.assertEqual(self.window.base, 5)
+
+	def test_contains(self):
+		self.window.insert(0)
+		self.window.insert(2)
+		self.assertIn(0, self.window)
+		self.assertNotIn(1, self.window)
+		self.assertIn(2, self.window)
+		self.assertNotIn(3, self.window)
+		self.assertNotIn(100, self.window)
+		self.assertNotIn("test", self.window)
+
+	def test_slide(self):
+		self.window.insert(1)  # leave a hole at 0
+		self.assertTrue(self.window.insert(16))
+		self.assertEqual(self.window.base, 2)
+		self.assertEqual(self.window.forgotten, 1)
+		self.assertFalse(self.window.insert(0))  # too old to tell, counted as duplicate
+		self.assertTrue(self.window.insert(2))
+
+	def test_slide_far(self):
+		self.window.insert(3)
+		self.assertTrue(self.window.insert(1000))
+		self.assertEqual(self.window.base, 985)
+		self.assertEqual(self.window.forgotten, 984)
+		self.assertFalse(self.window.insert(1000))
+
+	def test_too_old(self):
+		for i in (0, 1, 3, 4):
+			self.window.insert(i)
+		self.window.insert(20)  # forgets the hole at 2
+		self.assertEqual(self.window.base, 5)
+		self.assertTrue(self.window.is_too_old(2))
+		self.assertTrue(self.window.is_too_old(1))  # can't be told apart from the hole
+		self.assertFalse(self.window.is_too_old(3))  # received, a duplicate
+		self.assertFalse(self.window.is_too_old(5))
+		self.window.insert(100)
+		self.assertTrue(self.window.is_too_old(84))
+
+	def test_bounded(self):
+		for i in range(1, 10000, 2):  # every other number is lost
+			self.window.insert(i)
+		self.assertLessEqual(self.window._bits.bit_length(), 16)
+
+	def test_invalid_size(self):
+		with self.assertRaises(ValueError):
+			ReceivedWindow(0)
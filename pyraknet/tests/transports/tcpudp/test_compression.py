@@ -0,0 +1,136 @@
+import unittest
+from unittest.mock import Mock
+
+from event_dispatcher import EventDispatcher
+
+from pyraknet.transports.abc import ConnectionEvent, Reliability
+from pyraknet.transports.tcpudp.compression import Compression, CONTROL
+from pyraknet.transports.tcpudp.transport import TCPUDPConnection
+
+PAYLOAD = b"inventory item 1234, count 5, slot 7; " * 20
+
+class _Peer:
+	def __init__(self, compression):
+		self.dispatcher = EventDispatcher()
+		transport = Mock()
+		transport._dispatcher = self.dispatcher
+		transport._conns = {}
+		self.conn = TCPUDPConnection(transport, compression)
+		self.conn._tcp = Mock()
+		self.conn._tcp.is_closing.return_value = False
+		self.received = []
+		self.dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: self.received.append(bytes(data)))
+
+	def written(self):
+		"""Flush and return the bytes written to the TCP stream since the last call."""
+		self.conn._flush()
+		data = b"".join(b"".join(call[0][0]) for call in self.conn._tcp.writelines.call_args_list)
+		self.conn._tcp.writelines.reset_mock()
+		return data
+
+	def feed(self, data):
+		buffer = self.conn.get_buffer(-1)
+		while len(buffer) < len(data):
+			del buffer
+			self.conn._read_filled_buffer = True
+			buffer = self.conn.get_buffer(-1)
+		buffer[:len(data)] = data
+		del buffer
+		self.conn.buffer_updated(len(data))
+
+class CompressionTest(unittest.TestCase):
+	def pair(self, server_compression, client_compression):
+		self.server = _Peer(server_compression)
+		self.client = _Peer(client_compression)
+
+	def exchange(self):
+		self.server.feed(self.client.written())
+		self.client.feed(self.server.written())
+
+	def negotiate(self):
+		self.client.conn.offer_compression()
+		self.exchange()
+
+	def test_negotiated(self):
+		self.pair(Compression(), Compression())
+		self.negotiate()
+		self.assertIsNotNone(self.server.conn._compressor)
+		self.assertIsNotNone(self.client.conn._compressor)
+		self.assertEqual(self.server.received, [])
+		self.server.conn.send(PAYLOAD)
+		self.server.conn.send(b"short")
+		self.server.conn.send(PAYLOAD)
+		wire = self.server.written()
+		self.assertLess(len(wire), len(PAYLOAD) // 4)
+		self.client.feed(wire)
+		self.assertEqual(self.client.received, [PAYLOAD, b"short", PAYLOAD])
+		self.client.conn.send(PAYLOAD, Reliability.Reliable)
+		self.exchange()
+		self.assertEqual(self.server.received, [PAYLOAD])
+		# the second copy refers back to the first one
+		compressor = self.server.conn._compressor
+		self.assertLess(compressor.bytes_out, len(PAYLOAD) // 2)
+
+	def test_threshold(self):
+		self.pair(Compression(threshold=10), Compression(threshold=10))
+		self.negotiate()
+		self.server.conn.send(b"123456789")
+		self.assertEqual(self.server.written(), b"\x09\x00\x00\x00123456789")
+
+	def test_dictionary(self):
+		dictionary = b"inventory item count slot"
+		self.pair(Compression(threshold=0, dictionary=dictionary), Compression(threshold=0, dictionary=dictionary))
+		self.negotiate()
+		self.server.conn.send(b"inventory item 1, count 2, slot 3")
+		wire = self.server.written()
+		self.client.feed(wire)
+		self.assertEqual(self.client.received, [b"inventory item 1, count 2, slot 3"])
+		self.pair(Compression(threshold=0), Compression(threshold=0))
+		self.negotiate()
+		self.server.conn.send(b"inventory item 1, count 2, slot 3")
+		self.assertLess(len(wire), len(self.server.written()))
+
+	def test_dictionary_mismatch(self):
+		self.pair(Compression(dictionary=b"server"), Compression(dictionary=b"client"))
+		self.negotiate()
+		self.assertIsNone(self.server.conn._compressor)
+		self.assertIsNone(self.client.conn._compressor)
+		self.server.conn.send(PAYLOAD)
+		self.client.feed(self.server.written())
+		self.assertEqual(self.client.received, [PAYLOAD])
+
+	def test_not_offered(self):
+		# clients that don't know about compression get the usual frames
+		self.pair(Compression(), None)
+		self.server.conn.send(PAYLOAD)
+		self.assertEqual(self.server.written(), len(PAYLOAD).to_bytes(4, "little") + PAYLOAD)
+		self.client.conn.send(PAYLOAD)
+		self.exchange()
+		self.assertEqual(self.server.received, [PAYLOAD])
+
+	def test_offer_without_settings(self):
+		self.pair(Compression(), None)
+		with self.assertRaises(RuntimeError):
+			self.client.conn.offer_compression()
+
+	def test_compressed_before_negotiation(self):
+		self.pair(Compression(), Compression())
+		with self.assertLogs("pyraknet.transports.tcpudp.transport"):
+			self.server.feed(b"\x01\x00\x00\x80\x00" + (b"\x01\x00\x00\x00a"))
+		self.server.conn._tcp.close.assert_called_once_with()
+		self.assertEqual(self.server.received, [])
+
+	def test_invalid_control(self):
+		self.pair(Compression(), Compression())
+		with self.assertLogs("pyraknet.transports.tcpudp.transport"):
+			self.server.feed((CONTROL | 1).to_bytes(4, "little") + b"\x07")
+		self.server.conn._tcp.close.assert_called_once_with()
+
+	def test_max_frame_size(self):
+		self.pair(Compression(max_frame_size=1000), Compression())
+		self.negotiate()
+		self.client.conn.send(bytes(2000))
+		with self.assertLogs("pyraknet.transports.tcpudp.transport"):
+			self.server.feed(self.client.written())
+		self.assertEqual(self.server.received, [])
+		self.server.conn._tcp.close.assert_called_once_with()
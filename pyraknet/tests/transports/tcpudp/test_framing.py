@@ -0,0 +1,148 @@
+import asyncio
+import gc
+import unittest
+from unittest.mock import Mock
+
+from event_dispatcher import EventDispatcher
+
+from pyraknet.transports.abc import ConnectionEvent, Reliability
+from pyraknet.transports.tcpudp.transport import RECEIVE_BUFFER_SIZE, TCPUDPConnection
+
+def frame(data):
+	return len(data).to_bytes(4, "little") + data
+
+class FramingTest(unittest.TestCase):
+	def setUp(self):
+		self.dispatcher = EventDispatcher()
+		transport = Mock()
+		transport._dispatcher = self.dispatcher
+		self.conn = TCPUDPConnection(transport)
+		self.received = []
+		self.dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: self.received.append(bytes(data)))
+
+	def feed(self, data, chunk_size):
+		offset = 0
+		while offset < len(data):
+			buffer = self.conn.get_buffer(-1)
+			# like the event loop, read at most as much as fits into the buffer
+			chunk = data[offset:offset+min(chunk_size, len(buffer))]
+			buffer[:len(chunk)] = chunk
+			del buffer
+			self.conn.buffer_updated(len(chunk))
+			offset += len(chunk)
+
+	def test_multiple_frames_per_read(self):
+		self.feed(frame(b"abc") + frame(b"") + frame(b"defg"), 1000)
+		self.assertEqual(self.received, [b"abc", b"", b"defg"])
+
+	def test_split_length_prefix(self):
+		data = frame(b"abc") + frame(b"defg")
+		for chunk_size in range(1, len(data)):
+			self.received.clear()
+			self.feed(data, chunk_size)
+			self.assertEqual(self.received, [b"abc", b"defg"])
+
+	def test_large_frame(self):
+		payload = bytes(range(256)) * 1000
+		self.feed(frame(payload) + frame(b"end"), 5000)
+		self.assertEqual(self.received, [payload, b"end"])
+
+	def test_buffer_grows_while_reads_fill_it(self):
+		self.assertEqual(len(self.conn._buffer), 0)
+		self.feed(frame(b"x" * 1000) * 200, 10**6)
+		self.assertEqual(len(self.conn._buffer), RECEIVE_BUFFER_SIZE)
+		self.assertEqual(len(self.received), 200)
+
+	def test_retained_view(self):
+		views = []
+		self.dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: views.append(data))
+		self.feed(frame(b"abc"), 1000)
+		self.feed(frame(b"xyz"), 1000)
+		self.assertEqual([bytes(view) for view in views], [b"abc", b"xyz"])
+
+	def test_send_batched(self):
+		self.conn._tcp = Mock()
+		self.conn._tcp.is_closing.return_value = False
+		self.conn.send(b"ab", Reliability.ReliableOrdered)
+		self.conn.send(b"c", Reliability.Reliable)
+		self.conn._tcp.writelines.assert_not_called()
+		asyncio.get_event_loop().run_until_complete(asyncio.sleep(0))
+		self.conn._tcp.writelines.assert_called_once_with([b"\x02\x00\x00\x00", b"ab", b"\x01\x00\x00\x00", b"c"])
+
+	def test_pause_receiving(self):
+		self.conn._tcp = Mock()
+		self.dispatcher.add_listener(ConnectionEvent.Receive, lambda data, conn: self.conn.pause_receiving() if bytes(data) == b"abc" else None)
+		self.feed(frame(b"abc") + frame(b"defg"), 1000)
+		self.assertEqual(self.received, [b"abc"])
+		self.conn._tcp.pause_reading.assert_called_once_with()
+		self.conn.datagram_received(b"\0unreliable")
+		self.assertEqual(self.received, [b"abc"])
+		self.conn.resume_receiving()
+		self.conn._tcp.resume_reading.assert_called_once_with()
+		self.assertEqual(self.received, [b"abc", b"defg"])
+
+	def test_pause_resume_in_listener(self):
+		self.conn._tcp = Mock()
+		def pause_resume(data, conn):
+			if bytes(data) == b"a":
+				self.conn.pause_receiving()
+				self.conn.resume_receiving()
+		self.dispatcher.add_listener(ConnectionEvent.Receive, pause_resume)
+		self.feed(frame(b"a") + frame(b"b") + frame(b"c"), 1000)
+		self.assertEqual(self.received, [b"a", b"b", b"c"])
+
+	def test_receive_queue(self):
+		self.conn._tcp = Mock()
+		self.conn.start_receive_queue(max_size=2)
+		self.feed(frame(b"abc") + frame(b"defg") + frame(b"hi"), 1000)
+		self.conn._tcp.pause_reading.assert_called_once_with()
+		loop = asyncio.get_event_loop()
+		self.assertEqual(loop.run_until_complete(self.conn.recv()), b"abc")
+		self.conn._tcp.resume_reading.assert_called_once_with()
+		self.conn.connection_lost(None)
+
+		async def consume():
+			return [packet async for packet in self.conn]
+		self.assertEqual(loop.run_until_complete(consume()), [b"defg", b"hi"])
+
+	def test_drain(self):
+		self.conn._tcp = Mock()
+		self.conn._tcp.is_closing.return_value = False
+		self.conn.send(b"ab", Reliability.ReliableOrdered)
+		self.conn.pause_writing()
+		loop = asyncio.get_event_loop()
+		drain = loop.create_task(self.conn.drain())
+		loop.run_until_complete(asyncio.sleep(0))
+		self.conn._tcp.writelines.assert_called_once_with([b"\x02\x00\x00\x00", b"ab"])
+		self.assertFalse(drain.done())
+		self.conn.resume_writing()
+		loop.run_until_complete(drain)
+
+	def test_connection_lost_while_draining(self):
+		self.conn._tcp = Mock()
+		loop = asyncio.get_event_loop()
+		self.conn.pause_writing()
+		drain = loop.create_task(self.conn.drain())
+		cancelled = loop.create_task(self.conn.drain())
+		loop.run_until_complete(asyncio.sleep(0))
+		cancelled.cancel()
+		loop.run_until_complete(asyncio.sleep(0))
+		self.conn.connection_lost(None)
+		with self.assertRaises(ConnectionError):
+			loop.run_until_complete(drain)
+
+	def test_connection_lost_after_cancelled_drain(self):
+		self.conn._tcp = Mock()
+		loop = asyncio.get_event_loop()
+		errors = []
+		loop.set_exception_handler(lambda loop, context: errors.append(context))
+		self.addCleanup(loop.set_exception_handler, None)
+		self.conn.pause_writing()
+		drain = loop.create_task(self.conn.drain())
+		loop.run_until_complete(asyncio.sleep(0))
+		drain.cancel()
+		loop.run_until_complete(asyncio.sleep(0))
+		self.conn.connection_lost(None)
+		del drain
+		gc.collect()
+		self.assertEqual(errors, [])  # no "Future exception was never retrieved"
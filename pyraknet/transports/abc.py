@@ -1,5 +1,7 @@
+import asyncio
+from collections import deque
 from enum import auto, Enum
-from typing import Container, SupportsBytes
+from typing import Container, Deque, Iterable, List, Optional, SupportsBytes
 
 from event_dispatcher import EventDispatcher
 
@@ -25,10 +27,39 @@ class ConnectionType(Enum):
 	RakNet = auto()
 	TcpUdp = auto()
 
+RECEIVE_QUEUE_SIZE = 256  # default number of packets a connection's receive queue holds before receiving is paused
+
+class _ReceiveQueue:
+	__slots__ = "packets", "max_size", "waiter", "paused", "closed"
+
+	def __init__(self, max_size: int):
+		self.packets: Deque[bytes] = deque()
+		self.max_size = max_size
+		self.waiter: Optional[asyncio.Future] = None
+		self.paused = False
+		self.closed = False
+
+	def wake(self) -> None:
+		if self.waiter is not None and not self.waiter.done():
+			self.waiter.set_result(None)
+
 class Connection:
+	"""
+	Received packets are dispatched as ConnectionEvent.Receive. Alternatively, they can be consumed as a stream with recv or async for:
+
+		async for packet in conn:
+			...
+
+	Packets are only queued for the stream once it's been started, either explicitly with start_receive_queue or by the first call of recv.
+	To not miss any packets, call start_receive_queue right when the connection is established.
+	If the queue is full, the connection stops receiving (see pause_receiving) until the application has caught up, so the remote slows down instead of packets piling up. Other pauses of the connection stay in effect when the queue resumes it.
+	"""
+	__slots__ = "_dispatcher", "_receive_queue"
+
 	def __init__(self, dispatcher):
 		self._dispatcher = dispatcher
 		self._dispatcher.add_listener(ConnectionEvent.Broadcast, self._on_broadcast)
+		self._receive_queue: Optional[_ReceiveQueue] = None
 
 	def get_type(self) -> ConnectionType:
 		raise NotImplementedError
@@ -39,6 +70,72 @@ class Connection:
 	def close(self) -> None:
 		raise NotImplementedError
 
+	def start_receive_queue(self, max_size: int=RECEIVE_QUEUE_SIZE) -> None:
+		"""Start queueing received packets for recv. Does nothing if the queue has already been started."""
+		if self._receive_queue is None:
+			self._receive_queue = _ReceiveQueue(max_size)
+
+	async def recv(self) -> bytes:
+		"""Return the next received packet. Raise ConnectionError if the connection has been closed and all packets have been received."""
+		self.start_receive_queue()
+		queue = self._receive_queue
+		while not queue.packets:
+			if queue.closed:
+				raise ConnectionError("connection closed")
+			queue.waiter = asyncio.get_event_loop().create_future()
+			try:
+				await queue.waiter
+			finally:
+				queue.waiter = None
+		data = queue.packets.popleft()
+		if queue.paused and len(queue.packets) <= queue.max_size // 2:
+			queue.paused = False
+			self.resume_receiving()
+		return data
+
+	def __aiter__(self) -> "Connection":
+		return self
+
+	async def __anext__(self) -> bytes:
+		try:
+			return await self.recv()
+		except ConnectionError:
+			raise StopAsyncIteration
+
+	async def drain(self) -> None:
+		"""Wait until the connection has caught up with sending, so that the application doesn't queue data faster than the network can take it."""
+		raise NotImplementedError
+
+	def _receive(self, data: bytes) -> None:
+		"""Hand a received packet to the listeners and the receive queue. To be called by subclasses."""
+		self._dispatcher.dispatch(ConnectionEvent.Receive, data, self)
+		queue = self._receive_queue
+		if queue is not None and not queue.closed:
+			# data may be a view into a receive buffer
+			queue.packets.append(bytes(data))
+			queue.wake()
+			if len(queue.packets) >= queue.max_size and not queue.paused:
+				queue.paused = True
+				self.pause_receiving()
+
+	def _close_receive_queue(self) -> None:
+		"""Let recv know that no more packets will arrive. To be called by subclasses when the connection is closed."""
+		queue = self._receive_queue
+		if queue is not None:
+			queue.closed = True
+			queue.wake()
+
+	def pause_receiving(self) -> None:
+		"""
+		Stop dispatching received packets until resume_receiving is called, so that a consumer that can't keep up pushes back on the remote.
+		Pauses are counted, since several consumers (e.g. the receive queue and an Offloader) may pause the same connection: receiving only resumes once every pause_receiving has been matched by a resume_receiving.
+		"""
+		raise NotImplementedError
+
+	def resume_receiving(self) -> None:
+		"""Undo one pause_receiving. Does nothing if the connection isn't paused."""
+		raise NotImplementedError
+
 	def send(self, data: SupportsBytes, reliability: Reliability=Reliability.ReliableOrdered) -> None:
 		data = bytes(data)
 		self._dispatcher.dispatch(ConnectionEvent.Send, data, self)
@@ -47,6 +144,17 @@ class Connection:
 	def _send(self, data: bytes, reliability: Reliability) -> None:
 		raise NotImplementedError
 
+	def send_many(self, packets: Iterable[SupportsBytes], reliability: Reliability=Reliability.ReliableOrdered) -> None:
+		"""Send several packets at once, which lets the transport pack them into as few datagrams or writes as possible. The packets are received separately and in order, like with send."""
+		packets = [bytes(data) for data in packets]
+		for data in packets:
+			self._dispatcher.dispatch(ConnectionEvent.Send, data, self)
+		self._send_many(packets, reliability)
+
+	def _send_many(self, packets: List[bytes], reliability: Reliability) -> None:
+		for data in packets:
+			self._send(data, reliability)
+
 	def broadcast(self, data: SupportsBytes, reliability: Reliability=Reliability.ReliableOrdered, exclude: Container["Connection"]=()) -> None:
 		data = bytes(data)
 		self._dispatcher.dispatch(ConnectionEvent.Broadcast, data, reliability, exclude)
@@ -19,6 +19,7 @@ class RangeList(Collection[int], Serializable):
 		The internal list of ranges is auto-sorted.
 		Ranges in the internal representation are inclusive from both ends (that is, (20, 25) contains both 20 and 25 and everything in between)
 	"""
+	__slots__ = "_ranges",
 
 	def __init__(self) -> None:
 		self._ranges: List[_Range] = []
@@ -67,6 +68,25 @@ class RangeList(Collection[int], Serializable):
 			last_max = range.max
 		return num_holes
 
+	def is_valid(self, end: int) -> bool:
+		"""Return whether the ranges are sorted, don't overlap and only contain items lower than end, like those of a deserialized list from a well-behaved remote."""
+		last_max = -1
+		for range in self._ranges:
+			if range.min <= last_max or range.max < range.min:
+				return False
+			last_max = range.max
+		return last_max < end
+
+	def discard_below(self, minimum: int) -> None:
+		"""Remove the items lower than minimum."""
+		ranges = self._ranges
+		index = 0
+		while index < len(ranges) and ranges[index].max < minimum:
+			index += 1
+		del ranges[:index]
+		if ranges and ranges[0].min < minimum:
+			ranges[0].min = minimum
+
 	def insert(self, item: int) -> None:
 		iter_ = iter(self._ranges)
 		for range in iter_:
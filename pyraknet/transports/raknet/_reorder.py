@@ -0,0 +1,89 @@
+from typing import List, Optional
+
+class ReorderBuffer:
+	"""
+	Fixed-capacity buffer for ReliableOrdered packets that arrived before the packet we're waiting for (the head).
+	To check whether a packet can be buffered, use fits. To buffer it, use insert.
+	Bytes of packets that will be buffered once they're complete (split packets) can be reserved, they count towards the byte cap until they're unreserved.
+	When the head packet arrives, call advance and then pop until it returns None to release the buffered packets that are now in order.
+
+	Also keeps track of the maximum depth and of how long the head of line was blocked (the time from the first early arrival until the missing packet arrived).
+
+	Internal:
+		The buffer is a ring indexed by ordering index modulo capacity. Since only packets with head < index < head + capacity are accepted, slots can't collide.
+		The ring is only allocated when the first packet is buffered, since most connections never see reordering.
+	"""
+	__slots__ = "_capacity", "_max_bytes", "_slots", "head", "depth", "bytes", "reserved", "max_depth", "overflows", "blocked_time", "max_blocked_time", "_blocked_since"
+
+	def __init__(self, capacity: int, max_bytes: int):
+		if capacity < 1:
+			raise ValueError("capacity must be positive")
+		self._capacity = capacity
+		self._max_bytes = max_bytes
+		self._slots: Optional[List[Optional[bytes]]] = None
+		self.head = 0  # ordering index of the next packet to be released
+		self.depth = 0
+		self.bytes = 0
+		self.reserved = 0
+		self.max_depth = 0
+		self.overflows = 0
+		self.blocked_time = 0.0
+		self.max_blocked_time = 0.0
+		self._blocked_since: Optional[float] = None
+
+	def fits(self, index: int, length: int) -> bool:
+		"""Return whether a packet with this ordering index and length can be accepted without exceeding the caps."""
+		offset = index - self.head
+		if offset <= 0:
+			return True  # the head or a duplicate, never buffered
+		return offset < self._capacity and self.bytes + self.reserved + length <= self._max_bytes
+
+	def reserve(self, length: int) -> None:
+		self.reserved += length
+
+	def unreserve(self, length: int) -> None:
+		self.reserved -= length
+
+	def insert(self, index: int, data: bytes, now: float) -> bool:
+		"""Buffer an early packet. Return False if a packet with this index is already buffered."""
+		assert 0 < index - self.head < self._capacity
+		if self._slots is None:
+			self._slots = [None] * self._capacity
+		slot = index % self._capacity
+		if self._slots[slot] is not None:
+			return False
+		self._slots[slot] = data
+		self.depth += 1
+		self.bytes += len(data)
+		if self.depth > self.max_depth:
+			self.max_depth = self.depth
+		if self._blocked_since is None:
+			self._blocked_since = now
+		return True
+
+	def advance(self, now: float) -> None:
+		"""Move the head past the packet that just arrived in order."""
+		self.head += 1
+		if self._blocked_since is not None:
+			blocked = now - self._blocked_since
+			self._blocked_since = None
+			self.blocked_time += blocked
+			if blocked > self.max_blocked_time:
+				self.max_blocked_time = blocked
+
+	def pop(self, now: float) -> Optional[bytes]:
+		"""Release the buffered packet at the head if there is one, otherwise return None."""
+		if self.depth == 0:
+			return None
+		slot = self.head % self._capacity
+		data = self._slots[slot]
+		if data is None:
+			# waiting for another missing packet
+			if self._blocked_since is None:
+				self._blocked_since = now
+			return None
+		self._slots[slot] = None
+		self.depth -= 1
+		self.bytes -= len(data)
+		self.head += 1
+		return data
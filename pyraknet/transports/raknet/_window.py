@@ -0,0 +1,72 @@
+class ReceivedWindow:
+	"""
+	Sliding window of received message numbers, used for exact duplicate detection.
+	To mark a number as received and check whether it's a duplicate, use insert.
+
+	Internal:
+		The window is a bitmap anchored at the lowest message number that hasn't been received yet (the base).
+		Bit i of the bitmap is set if base + i has been received. Bit 0 is therefore always clear, and everything below the base counts as received.
+		Lookups and inserts are O(1) (relative to the window size), and the bitmap never grows beyond the window size.
+		If a number arrives that doesn't fit into the window, the window is slid forward and the oldest holes are forgotten (counted in forgotten).
+		This happens when holes never get filled, e.g. lost unreliable packets, which also get a message number.
+		Below the highest forgotten hole, a number may be a duplicate or a hole that arrives late, so is_too_old tells these apart from numbers known to be duplicates.
+	"""
+	__slots__ = "_size", "_base", "_bits", "_forgotten_below", "duplicates", "forgotten", "too_old"
+
+	def __init__(self, size: int):
+		if size < 1:
+			raise ValueError("window size must be positive")
+		self._size = size
+		self._base = 0
+		self._bits = 0
+		self._forgotten_below = 0  # one past the highest forgotten hole
+		self.duplicates = 0
+		self.forgotten = 0
+		self.too_old = 0  # not counted here, for the owner to count numbers it rejects because of is_too_old
+
+	def __contains__(self, item: object) -> bool:
+		if not isinstance(item, int):
+			return False
+		offset = item - self._base
+		if offset < 0:
+			return True
+		return offset < self._size and bool(self._bits >> offset & 1)
+
+	@property
+	def base(self) -> int:
+		"""The lowest message number that hasn't been received yet."""
+		return self._base
+
+	def is_too_old(self, item: int) -> bool:
+		"""Return whether the number is below the window and might be a forgotten hole, so it can't be told whether it has been received."""
+		return item < self._forgotten_below
+
+	def insert(self, item: int) -> bool:
+		"""Mark the number as received. Return False if it has been received before (or is too old to tell)."""
+		offset = item - self._base
+		if offset < 0:
+			self.duplicates += 1
+			return False
+		if offset >= self._size:
+			shift = offset - self._size + 1
+			if shift > self._size:
+				dropped = self._bits
+				self._forgotten_below = self._base + shift  # the numbers beyond the bitmap are holes
+			else:
+				dropped = self._bits & ((1 << shift) - 1)
+				self._forgotten_below = self._base + (~self._bits & ((1 << shift) - 1)).bit_length()  # bit 0 is clear, so there's a hole
+			self.forgotten += shift - bin(dropped).count("1")
+			self._bits >>= shift
+			self._base += shift
+			offset -= shift
+		bit = 1 << offset
+		if self._bits & bit:
+			self.duplicates += 1
+			return False
+		self._bits |= bit
+		if self._bits & 1:
+			# move the base past the run of received numbers at the start of the window
+			run = (self._bits ^ (self._bits + 1)).bit_length() - 1
+			self._bits >>= run
+			self._base += run
+		return True
@@ -1,8 +1,12 @@
 import logging
 
+from .clock import Clock
+
 log = logging.getLogger(__file__)
 
 class RTOCalc:
+	__slots__ = "_srtt", "_rtt_var", "_rto"
+
 	def __init__(self):
 		self._srtt: float = -1 # smoothed round trip time
 		self._rtt_var: float = -1 # round trip time variation
@@ -23,6 +27,8 @@ class RTOCalc:
 		self._rto = max(1, self._srtt + 4*self._rtt_var)  # originally specified be at least clock resolution but since the client loop is set at 10 milliseconds there's no way it can be smaller anyways
 
 class CWNDCalc:
+	__slots__ = "_cwnd", "_ssthresh"
+
 	def __init__(self):
 		self._cwnd: float = 1  # congestion window, limits how many packets we can send at once
 		self._ssthresh = float("inf")  # slow start threshold, the level at which we switch from slow start to congestion control
@@ -41,3 +47,136 @@ class CWNDCalc:
 					self._cwnd += num_acks/self._cwnd
 				else:
 					self._cwnd += num_acks
+
+class CongestionControl:
+	"""
+	Interface for the congestion controllers used by RaknetConnection.
+	The connection reports round trip time samples and acks, and asks the controller how long to wait before resending a packet (rto), how many packets it may send between acks (cwnd), and how long to wait between two sends (send_interval).
+	Controllers are created with the connection's clock, which they should use if they need the time.
+	"""
+	__slots__ = "_clock",
+
+	def __init__(self, clock: Clock):
+		self._clock = clock
+
+	def rto(self) -> float:
+		raise NotImplementedError
+
+	def cwnd(self) -> float:
+		raise NotImplementedError
+
+	def send_interval(self) -> float:
+		"""Minimum time between two sends in seconds. 0 means no pacing."""
+		return 0
+
+	def on_rtt(self, rtt: float) -> None:
+		raise NotImplementedError
+
+	def on_ack(self, packets_sent: int, num_acks: int, num_holes: int) -> None:
+		raise NotImplementedError
+
+class RenoCongestionControl(CongestionControl):
+	"""Loss-based congestion control, using RTOCalc and CWNDCalc. This is the default."""
+	__slots__ = "_rto_calc", "_cwnd_calc"
+
+	def __init__(self, clock: Clock):
+		super().__init__(clock)
+		self._rto_calc = RTOCalc()
+		self._cwnd_calc = CWNDCalc()
+
+	def rto(self) -> float:
+		return self._rto_calc.rto()
+
+	def cwnd(self) -> float:
+		return self._cwnd_calc.cwnd()
+
+	def on_rtt(self, rtt: float) -> None:
+		self._rto_calc.update(rtt)
+
+	def on_ack(self, packets_sent: int, num_acks: int, num_holes: int) -> None:
+		self._cwnd_calc.update(packets_sent, num_acks, num_holes)
+
+class DelayCongestionControl(CongestionControl):
+	"""
+	Delay-based congestion control, similar to LEDBAT (RFC 6817).
+	The queueing delay is estimated as the current round trip time minus the lowest one seen recently, and the window grows while it's below the target delay and shrinks while it's above.
+	Until the queueing delay first reaches half the target, the window grows exponentially like in slow start.
+	Holes only count as congestion if the delay is above the target as well, so random losses on lossy links (e.g. Wi-Fi) don't shrink the window.
+	Since the window is the number of packets that may be sent between two acks, sends are paced evenly over the measured interval between acks instead of being sent in bursts.
+	"""
+	__slots__ = "_rto_calc", "_target_delay", "_gain", "_min_cwnd", "_max_cwnd", "_cwnd", "_slow_start", "_rtt", "_ack_interval", "_last_ack_time", "_base_rtts", "_bucket_samples"
+	_BASE_HISTORY = 10  # number of buckets the base delay is the minimum of
+	_BASE_BUCKET_SIZE = 64  # number of samples per bucket
+
+	def __init__(self, clock: Clock, target_delay: float=0.05, gain: float=1, min_cwnd: float=2, max_cwnd: float=1024):
+		super().__init__(clock)
+		self._rto_calc = RTOCalc()
+		self._target_delay = target_delay
+		self._gain = gain
+		self._min_cwnd = min_cwnd
+		self._max_cwnd = max_cwnd
+		self._cwnd = min_cwnd
+		self._slow_start = True
+		self._rtt = -1.0  # smoothed round trip time, reacting faster than the one used for the rto
+		self._ack_interval = -1.0  # smoothed time between acks
+		self._last_ack_time = -1.0
+		self._base_rtts = [float("inf")]  # minimums of the last buckets, the newest last
+		self._bucket_samples = 0
+
+	def rto(self) -> float:
+		return self._rto_calc.rto()
+
+	def cwnd(self) -> float:
+		return self._cwnd
+
+	def send_interval(self) -> float:
+		if self._ack_interval == -1:
+			return 0
+		return self._ack_interval / self._cwnd
+
+	def queueing_delay(self) -> float:
+		if self._rtt == -1:
+			return 0
+		return self._rtt - min(self._base_rtts)
+
+	def on_rtt(self, rtt: float) -> None:
+		self._rto_calc.update(rtt)
+		if self._rtt == -1:
+			self._rtt = rtt
+		else:
+			self._rtt = 0.75 * self._rtt + 0.25 * rtt
+		# the base delay is the minimum over a limited history so that it can adapt to route changes
+		if rtt < self._base_rtts[-1]:
+			self._base_rtts[-1] = rtt
+		self._bucket_samples += 1
+		if self._bucket_samples == self._BASE_BUCKET_SIZE:
+			self._bucket_samples = 0
+			self._base_rtts.append(float("inf"))
+			if len(self._base_rtts) > self._BASE_HISTORY:
+				del self._base_rtts[0]
+
+	def on_ack(self, packets_sent: int, num_acks: int, num_holes: int) -> None:
+		now = self._clock.time()
+		if self._last_ack_time != -1:
+			# after idling, acks can be far apart, but pacing shouldn't take longer than a round trip
+			interval = min(now - self._last_ack_time, self._rtt)
+			if self._ack_interval == -1:
+				self._ack_interval = interval
+			else:
+				self._ack_interval = 0.75 * self._ack_interval + 0.25 * interval
+		self._last_ack_time = now
+		if self._rtt == -1:
+			return
+		off_target = (self._target_delay - self.queueing_delay()) / self._target_delay
+		if self._slow_start:
+			if off_target > 0.5:
+				if packets_sent >= self._cwnd:
+					self._cwnd = min(self._cwnd + num_acks, self._max_cwnd)
+				return
+			self._slow_start = False
+		if num_holes > 0 and off_target < 0:
+			log.info("Missing Acks/Holes with queueing delay: %i", num_holes)
+			self._cwnd /= 2
+		elif off_target < 0 or packets_sent >= self._cwnd:  # only grow if we're actually hitting the limit and not idling
+			self._cwnd += self._gain * off_target * num_acks / self._cwnd
+		self._cwnd = min(max(self._cwnd, self._min_cwnd), self._max_cwnd)
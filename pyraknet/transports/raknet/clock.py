@@ -0,0 +1,91 @@
+"""
+Time sources for the reliability layer.
+RaknetConnection and the congestion controllers never look at the time or schedule timers directly, they go through a Clock.
+The default LoopClock uses real time and the asyncio event loop, VirtualClock only moves when told to, which makes tests and benchmarks deterministic and lets them simulate minutes in a fraction of a second.
+"""
+import asyncio
+import heapq
+import time
+from typing import Any, Callable, List, Tuple
+
+class Clock:
+	def time(self) -> float:
+		"""Return the current time in seconds. Only differences between times are meaningful."""
+		raise NotImplementedError
+
+	def call_later(self, delay: float, callback: Callable[..., None], *args: Any) -> asyncio.Handle:
+		"""Schedule callback(*args) to be called after delay seconds. The returned handle can be cancelled."""
+		raise NotImplementedError
+
+class LoopClock(Clock):
+	"""Real time with timers on the current asyncio event loop. This is the default."""
+
+	def time(self) -> float:
+		return time.perf_counter()
+
+	def call_later(self, delay: float, callback: Callable[..., None], *args: Any) -> asyncio.Handle:
+		return asyncio.get_event_loop().call_later(delay, callback, *args)
+
+class _VirtualHandle:
+	__slots__ = "_callback", "_args", "_cancelled"
+
+	def __init__(self, callback: Callable[..., None], args: Tuple[Any, ...]):
+		self._callback = callback
+		self._args = args
+		self._cancelled = False
+
+	def cancel(self) -> None:
+		self._cancelled = True
+		self._callback = None
+		self._args = None
+
+	def cancelled(self) -> bool:
+		return self._cancelled
+
+class VirtualClock(Clock):
+	"""
+	Clock that only moves when advanced.
+	Timers are run synchronously by advance, in order of their deadlines (and in order of scheduling for equal deadlines), with the time set to their deadline.
+	"""
+
+	def __init__(self, start: float=0):
+		self._now = start
+		self._timers: List[Tuple[float, int, _VirtualHandle]] = []
+		self._timer_count = 0
+
+	def time(self) -> float:
+		return self._now
+
+	def call_later(self, delay: float, callback: Callable[..., None], *args: Any) -> _VirtualHandle:
+		handle = _VirtualHandle(callback, args)
+		self._timer_count += 1
+		heapq.heappush(self._timers, (self._now + max(delay, 0), self._timer_count, handle))
+		return handle
+
+	def next_deadline(self) -> float:
+		"""Return the deadline of the next pending timer, or infinity if there is none."""
+		while self._timers and self._timers[0][2].cancelled():
+			heapq.heappop(self._timers)
+		if not self._timers:
+			return float("inf")
+		return self._timers[0][0]
+
+	def advance(self, seconds: float) -> None:
+		"""Move the time forward, running all timers that become due on the way."""
+		target = self._now + seconds
+		while self.next_deadline() <= target:
+			deadline, _, handle = heapq.heappop(self._timers)
+			self._now = deadline
+			handle._callback(*handle._args)
+		self._now = target
+
+	def run_until(self, condition: Callable[[], bool], timeout: float) -> bool:
+		"""Advance from timer to timer until condition() is true or timeout seconds have passed. Return the last result of condition()."""
+		end = self._now + timeout
+		while not condition():
+			deadline = self.next_deadline()
+			if deadline > end:
+				self._now = end
+				return condition()
+			self.advance(deadline - self._now)
+		return True
@@ -1,60 +1,267 @@
 """
 Reliability layer. UDP doesn't guarantee delivery or ordering, so this is where RakNet provides optional support for these features.
 For retransmission algorithm see http://www.saminiir.com/lets-code-tcp-ip-stack-5-tcp-retransmission
-Congestion control is based on TCP Reno, see http://ee.lbl.gov/papers/congavoid.pdf
+Congestion control is pluggable, see calcs.CongestionControl. The default is based on TCP Reno, see http://ee.lbl.gov/papers/congavoid.pdf
 """
 # Todo: Congestion avoidance instead of congestion control (prevent congestion control beforehand instead of coping with it afterwards)
 import asyncio
+import bisect
+import io
 import logging
 import math
-import time
-from collections import OrderedDict
-from typing import Container, Dict, Iterator, MutableSequence, Optional, SupportsBytes, Tuple
+from collections import deque
+from typing import Callable, Container, Deque, Dict, Iterable, Iterator, List, Optional, Sequence, SupportsBytes, Tuple, Union
 
 from event_dispatcher import EventDispatcher
 
-from bitstream import c_bit, c_uint, c_ushort, ReadStream, WriteStream
+from bitstream import c_bit, c_ubyte, c_uint, c_ushort, ReadStream, WriteStream
 
 from . import _rangelist
+from ._reorder import ReorderBuffer
+from ._window import ReceivedWindow
 from ...messages import Address, Message
 from ..abc import Connection, ConnectionEvent, ConnectionType, Reliability
-from .calcs import CWNDCalc, RTOCalc
+from .calcs import CongestionControl, RenoCongestionControl
+from .clock import Clock, LoopClock
+from .limits import InboundLimiter, InboundLimits, OverflowPolicy
+from .resends import ResendStore
+from .scheduler import InboundScheduler
+from .tracing import MessageTrace, Tracer
 
 log = logging.getLogger(__name__)
 
 #MTU_SIZE = 1492  # Default used by RakNet, Ethernet
-MTU_SIZE = 1228  # Hardcoded by LU for some reason
+MTU_SIZE = 1228  # Hardcoded by LU for some reason, the default of RaknetConnection's mtu
 UDP_HEADER_SIZE = 28
+DATAGRAM_HEADER_LENGTH = 5  # has acks bit, has remote system time bit and the remote system time, rounded up (piggybacked acks aren't accounted for)
+MTU_PROBE_TIMEOUT = 1.0  # seconds to wait for the ack of an mtu probe before trying the next smaller mtu
+DUPLICATE_WINDOW_SIZE = 8192  # number of message numbers duplicate detection can look back
+REORDER_BUFFER_SIZE = 1024  # number of ReliableOrdered packets that can be held back while waiting for a missing one
+REORDER_BUFFER_MAX_BYTES = 4 * 1024 * 1024
+DRAIN_WINDOWS = 2  # drain waits until at most this many congestion windows of reliable packets are unacked
+FAST_RETRANSMIT_THRESHOLD = 3  # number of acks for later packets after which a missing packet is resent without waiting for its rto
+STREAM_MAX_IN_FLIGHT = 256 * 1024  # default number of bytes of a stream that can be unacked at a time
+MAX_SPLIT_PACKET_BYTES = 16 * 1024 * 1024  # memory incomplete split packets may take up, parts that would need more are stalled. Also the largest split packet that's accepted, about 15 MB of data at the default mtu
+MAX_SPLIT_PACKET_COUNT = 16384  # parts of a split packet that are accepted, checked before the length. At mtus above about 1030 MAX_SPLIT_PACKET_BYTES is reached first
+MAX_SPLIT_PACKETS = 32  # split packets that can be incomplete at the same time, further ones are stalled
+SPLIT_PACKET_TIMEOUT = 10.0  # seconds after its last part that an incomplete unreliable split packet is dropped, since its lost parts are never resent
+_SPLIT_PART_OVERHEAD = 48  # memory of a split packet part besides its data (list slot and bytes object), accounted for every part up front
 
-_Packet = Tuple[bytes, Reliability, Optional[int], Optional[Tuple[int, int, int]]]
+_Packet = Tuple[Union[bytes, memoryview], int, Reliability, Optional[int], Optional[Tuple[int, int, int]]]  # stream chunks can be memoryviews into the source
+
+class _PendingResend:
+	"""A reliable packet that hasn't been acked yet."""
+	__slots__ = "packet", "handle", "transmission", "misses", "stream"
+
+	def __init__(self, packet: _Packet):
+		self.packet = packet
+		self.handle: Optional[asyncio.Handle] = None  # rto timer
+		self.transmission: Optional[int] = None  # sequence number of the last (re)transmission, None if it's still waiting for the congestion window
+		self.misses = 0  # number of acks for packets transmitted after this one
+		self.stream: Optional[OutgoingStream] = None  # if the packet is a chunk of a stream
+
+class _MtuProbe:
+	"""State of the mtu discovery of a connection."""
+	__slots__ = "candidates", "mtu", "message_number", "ordering_index", "handle"
+
+	def __init__(self, candidates: List[int]):
+		self.candidates = candidates  # mtus still to be tried, largest first
+		self.mtu = 0  # mtu of the probe in flight
+		self.message_number = -1
+		self.ordering_index = 0  # of a ReliableOrdered packet the remote has delivered
+		self.handle: Optional[asyncio.Handle] = None  # None until probing starts
+
+StreamSource = Union[bytes, bytearray, memoryview, io.RawIOBase, io.BufferedIOBase, Iterable[bytes]]
+
+def _read_chunks(source: StreamSource, length: int, chunk_length: int) -> Iterator[Union[bytes, memoryview]]:
+	"""
+	Yield the first length bytes of the source in chunks of chunk_length bytes (the last one may be shorter). Bytes-like sources aren't copied, the chunks are views into them.
+	Raise ValueError if the source has less than length bytes.
+	"""
+	if isinstance(source, (bytes, bytearray, memoryview)):
+		view = memoryview(source).cast("B")
+		if len(view) < length:
+			raise ValueError("source is shorter than the stream length")
+		for offset in range(0, length, chunk_length):
+			yield view[offset:min(offset+chunk_length, length)]
+		return
+	remaining = length
+	if hasattr(source, "read"):
+		while remaining:
+			wanted = min(chunk_length, remaining)
+			chunk = source.read(wanted)
+			while len(chunk) < wanted:
+				# unbuffered files may return less than requested
+				more = source.read(wanted - len(chunk))
+				if not more:
+					raise ValueError("file ended before the stream length")
+				chunk += more
+			yield chunk
+			remaining -= wanted
+	else:
+		pieces = iter(source)
+		buffer = bytearray()
+		while remaining:
+			wanted = min(chunk_length, remaining)
+			while len(buffer) < wanted:
+				piece = next(pieces, None)
+				if piece is None:
+					raise ValueError("iterable ended before the stream length")
+				buffer += piece
+			yield bytes(buffer[:wanted])
+			del buffer[:wanted]
+			remaining -= wanted
+
+class OutgoingStream:
+	"""
+	A large message being sent with RaknetConnection.send_stream.
+	acked is the number of bytes the remote has acknowledged so far, out of length. Await wait() to wait until the whole message has been acked.
+	"""
+	__slots__ = "length", "sent", "acked", "_chunks", "_chunk_count", "_chunk_index", "_reliability", "_ordering_index", "_split_packet_id", "_max_in_flight", "_progress", "_waiter", "_error"
+
+	def __init__(self, chunks: Iterator[Union[bytes, memoryview]], length: int, chunk_count: int, reliability: Reliability, ordering_index: Optional[int], split_packet_id: int, max_in_flight: int, progress: Optional[Callable[["OutgoingStream"], None]]):
+		self.length = length
+		self.sent = 0  # bytes transmitted at least once
+		self.acked = 0
+		self._chunks = chunks
+		self._chunk_count = chunk_count
+		self._chunk_index = 0
+		self._reliability = reliability
+		self._ordering_index = ordering_index
+		self._split_packet_id = split_packet_id
+		self._max_in_flight = max_in_flight
+		self._progress = progress
+		self._waiter: Optional[asyncio.Future] = None
+		self._error: Optional[Exception] = None
+
+	def done(self) -> bool:
+		return self.acked == self.length or self._error is not None
+
+	async def wait(self) -> None:
+		"""Wait until the remote has acked the whole message. Raise ConnectionError if the connection is closed before that."""
+		while not self.done():
+			if self._waiter is None or self._waiter.done():
+				self._waiter = asyncio.get_event_loop().create_future()
+			await asyncio.shield(self._waiter)
+		if self._error is not None:
+			raise self._error
+
+	def _chunk_acked(self, length: int) -> None:
+		self.acked += length
+		if self._progress is not None:
+			self._progress(self)
+		if self.acked == self.length:
+			self._wake()
+
+	def _fail(self, error: Exception) -> None:
+		if not self.done():
+			self._error = error
+			self._wake()
+
+	def _wake(self) -> None:
+		if self._waiter is not None and not self._waiter.done():
+			self._waiter.set_result(None)
+
+class _SplitPacket:
+	"""
+	The parts of a split packet received so far.
+	Reliable split packets are kept until they're complete, since their parts have been acked and won't be resent. Unreliable ones may never complete, so they're dropped after SPLIT_PACKET_TIMEOUT, or earlier when the space is needed.
+	"""
+	__slots__ = "parts", "missing", "reliable", "progress_time", "part_time", "length", "reserved"
+
+	def __init__(self, count: int, reliable: bool, now: float):
+		self.parts: List[Optional[bytes]] = [None] * count
+		self.missing = count
+		self.reliable = reliable
+		self.progress_time = now  # when DownloadProgress was last dispatched
+		self.part_time = now  # when the last part arrived
+		self.length = 0  # upper bound of the reassembled length, the count times the longest part so far (only the last part may be shorter)
+		self.reserved = 0  # bytes reserved in the reorder buffer for a ReliableOrdered packet that will have to wait there
 
 class RaknetConnection(Connection):
-	def __init__(self, transport: asyncio.DatagramTransport, dispatcher: EventDispatcher, address: Address):
+	"""
+	A connection using RakNet's reliability layer over UDP.
+	Servers can have many mostly idle connections, so the per-connection state is kept small: there's no instance dict, and buffers that are only needed for split packets, pacing and reordering are created when they're first used.
+	"""
+	__slots__ = "_transport", "_address", "_clock", "_last_ack_time", "_start_time", "_split_packet_id", "_remote_system_time", "_acks", "_send_acks_handle", "_congestion", "_packets_sent", "_next_send_time", "_send_paced_handle", "_send_message_number_index", "_sequenced_write_index", "_sequenced_read_index", "_ordered_write_index", "_received", "_out_of_order_packets", "_reorder_overflow_policy", "_split_packet_queue", "_split_packet_bytes", "_split_packets_dropped", "_download_progress_interval", "_sends", "_streams", "_resends", "_resend_store", "_resend_bytes", "_max_resend_bytes", "_backlog", "_backlog_bytes", "_max_queued_bytes", "_fast_retransmit_threshold", "_transmissions", "_fast_retransmits", "_timeout_retransmits", "_receiving_paused", "_datagrams_stalled", "_drain_waiters", "_batch", "_batch_length", "_batching", "_mtu", "_mtu_probe", "_limiter", "_invalid_datagrams", "_scheduler", "_tracing", "_check_close_handle"
+
+	def __init__(self, transport: asyncio.DatagramTransport, dispatcher: EventDispatcher, address: Address, duplicate_window: int=DUPLICATE_WINDOW_SIZE, reorder_buffer_size: int=REORDER_BUFFER_SIZE, reorder_buffer_max_bytes: int=REORDER_BUFFER_MAX_BYTES, reorder_overflow_policy: OverflowPolicy=OverflowPolicy.Stall, congestion_control: Callable[[Clock], CongestionControl]=RenoCongestionControl, fast_retransmit_threshold: Optional[int]=FAST_RETRANSMIT_THRESHOLD, mtu: int=MTU_SIZE, probe_mtus: Sequence[int]=(), max_resend_bytes: Optional[int]=None, max_queued_bytes: Optional[int]=None, resend_store: Optional[ResendStore]=None, download_progress_interval: Optional[float]=None, inbound_limits: Optional[InboundLimits]=None, inbound_scheduler: Optional[InboundScheduler]=None, tracer: Optional[Tracer]=None, clock: Optional[Clock]=None):
+		"""
+		reorder_overflow_policy: whether to stall (not ack, so that the remote resends them) or to close the connection for ReliableOrdered packets that don't fit into the reorder buffer.
+		fast_retransmit_threshold: resend a packet after this many acks for packets sent after it, or None to only resend when the rto expires.
+		mtu: the largest datagram size (including the IP and UDP headers) used until probing finds a larger one. Packets that don't fit are split.
+		probe_mtus: larger mtus to try once the connection is established, see _probe_mtu.
+		max_resend_bytes: when this many bytes of reliable packets are unacked, further reliable packets are queued until acks come in. None for no limit.
+		max_queued_bytes: close the connection when more than this many bytes are queued, since the remote is probably stalled. None for no limit.
+		resend_store: accounts for unacked packets across connections and may limit them globally, see resends.ResendStore. If None, the connection gets a store of its own.
+		download_progress_interval: while a split packet is being received, dispatch a DownloadProgress packet at most this often (in seconds). None to not report progress.
+		inbound_limits: rate limits for the traffic from the remote, see limits.InboundLimits. Malformed datagrams are dropped either way, with these limits their policy also applies to them.
+		inbound_scheduler: queue received messages and dispatch them fairly across the connections sharing the scheduler, see scheduler.InboundScheduler. None to dispatch them right away.
+		tracer: sample messages of this connection for latency tracing, see tracing.Tracer.
+		"""
 		super().__init__(dispatcher)
 		self._transport = transport
 		self._address = address
-		self._check_close_handle = None
+		if clock is None:
+			clock = LoopClock()
+		self._clock = clock
 		self._last_ack_time: float = 0
-		self._start_time = int(time.perf_counter() * 1000)
+		self._start_time = int(self._clock.time() * 1000)
 		self._split_packet_id = 0
 		self._remote_system_time = 0
 		self._acks = _rangelist.RangeList()
 		self._send_acks_handle = None
-		self._rto_calc = RTOCalc()
-		self._cwnd_calc = CWNDCalc()
+		self._congestion = congestion_control(self._clock)
 		self._packets_sent = 0
+		self._next_send_time: float = 0
+		self._send_paced_handle = None
 		self._send_message_number_index = 0
 		self._sequenced_write_index = 0
 		self._sequenced_read_index = 0
 		self._ordered_write_index = 0
-		self._ordered_read_index = 0
-		self._last_rel_received = [-1] * 20
-		self._out_of_order_packets: Dict[int, bytes] = {}  # for ReliableOrdered
-		self._split_packet_queue: Dict[int, MutableSequence[bytes]] = {}
-		self._sends: MutableSequence[_Packet] = []
-		self._resends: Dict[int, asnycio.Handle] = OrderedDict()
+		self._received = ReceivedWindow(duplicate_window)
+		self._out_of_order_packets = ReorderBuffer(reorder_buffer_size, reorder_buffer_max_bytes)  # for ReliableOrdered
+		self._reorder_overflow_policy = reorder_overflow_policy
+		self._split_packet_queue: Optional[Dict[int, _SplitPacket]] = None
+		self._split_packet_bytes = 0  # accounted memory of the incomplete split packets, their lengths (see _SplitPacket.length) and the overhead of their parts
+		self._split_packets_dropped = 0  # incomplete unreliable split packets
+		self._download_progress_interval = download_progress_interval
+		self._sends: Optional[Deque[_Packet]] = None  # waiting for pacing
+		self._streams: Optional[Deque[OutgoingStream]] = None  # with chunks that haven't been sent yet
+		self._resends: Dict[int, _PendingResend] = {}  # ordered by message number (dicts keep insertion order, and resends keep their position)
+		if resend_store is None:
+			resend_store = ResendStore()
+		self._resend_store = resend_store
+		self._resend_bytes = 0  # of the packets in _resends
+		self._max_resend_bytes = max_resend_bytes
+		self._backlog: Optional[Deque[Tuple[bytes, Reliability, Optional[MessageTrace]]]] = None  # reliable packets waiting for unacked bytes to go below the limits
+		self._backlog_bytes = 0
+		self._max_queued_bytes = max_queued_bytes
+		self._fast_retransmit_threshold = fast_retransmit_threshold
+		self._transmissions = 0  # counts datagrams with reliable packets, to tell which packet was (re)sent after which
+		self._fast_retransmits = 0
+		self._timeout_retransmits = 0
+		self._receiving_paused = 0  # number of pause_receiving calls that haven't been matched by resume_receiving yet
+		self._datagrams_stalled = 0
+		self._drain_waiters: Optional[List[asyncio.Future]] = None  # one per waiting drain call
+		self._batch: Optional[WriteStream] = None  # datagram being filled by send_many
+		self._batch_length = 0  # upper bound of the length of _batch in bytes
+		self._batching = False
+		self._mtu = mtu
+		self._mtu_probe: Optional[_MtuProbe] = None
+		candidates = sorted((candidate for candidate in probe_mtus if candidate > mtu), reverse=True)
+		if candidates:
+			self._mtu_probe = _MtuProbe(candidates)
+		self._limiter: Optional[InboundLimiter] = None
+		if inbound_limits is not None:
+			self._limiter = inbound_limits.limiter(self._clock.time())
+		self._invalid_datagrams = 0
+		self._scheduler = inbound_scheduler
+		self._tracing = None
+		if tracer is not None:
+			self._tracing = tracer.connection(address, self._clock)
 
-		asyncio.get_event_loop().call_later(10, self._check_close)
+		self._check_close_handle = self._clock.call_later(10, self._check_close)
 
 	def get_address(self) -> Address:
 		return self._address
@@ -62,7 +269,68 @@ class RaknetConnection(Connection):
 	def get_type(self) -> ConnectionType:
 		return ConnectionType.RakNet
 
+	def get_stats(self) -> Dict[str, float]:
+		"""Return counters describing the state of the reliability layer for this connection."""
+		return {
+			"duplicates_dropped": self._received.duplicates,
+			"holes_forgotten": self._received.forgotten,
+			"too_old_messages": self._received.too_old,
+			"reorder_depth": self._out_of_order_packets.depth,
+			"reorder_bytes": self._out_of_order_packets.bytes,
+			"reorder_reserved_bytes": self._out_of_order_packets.reserved,
+			"split_packet_bytes": self._split_packet_bytes,
+			"split_packets_dropped": self._split_packets_dropped,
+			"reorder_max_depth": self._out_of_order_packets.max_depth,
+			"reorder_overflows": self._out_of_order_packets.overflows,
+			"hol_blocked_time": self._out_of_order_packets.blocked_time,
+			"hol_max_blocked_time": self._out_of_order_packets.max_blocked_time,
+			"cwnd": self._congestion.cwnd(),
+			"rto": self._congestion.rto(),
+			"fast_retransmits": self._fast_retransmits,
+			"timeout_retransmits": self._timeout_retransmits,
+			"datagrams_stalled": self._datagrams_stalled,
+			"mtu": self._mtu,
+			"resend_bytes": self._resend_bytes,
+			"queued_bytes": self._backlog_bytes,
+			"invalid_datagrams": self._invalid_datagrams,
+			"datagrams_limited": self._limiter.datagrams_limited if self._limiter is not None else 0,
+			"messages_limited": self._limiter.messages_limited if self._limiter is not None else 0,
+			"inbound_queued": self._scheduler.depth(self) if self._scheduler is not None else 0,
+		}
+
 	def _send(self, data: bytes, reliability: Reliability) -> None:
+		trace = None
+		if self._tracing is not None:
+			trace = self._tracing.sent(len(data), reliability)
+		if (reliability == Reliability.Reliable or reliability == Reliability.ReliableOrdered) and (self._backlog is not None or self._resends_full()):
+			self._queue(data, reliability, trace)
+		else:
+			self._send_now(data, reliability, trace)
+
+	def _resends_full(self) -> bool:
+		if not self._resends:
+			return False  # always let a packet through, otherwise there would be no acks to release the queue
+		return (self._max_resend_bytes is not None and self._resend_bytes >= self._max_resend_bytes) or self._resend_store.full()
+
+	def _queue(self, data: bytes, reliability: Reliability, trace: Optional[MessageTrace]) -> None:
+		if self._backlog is None:
+			self._backlog = deque()
+		self._backlog.append((data, reliability, trace))
+		self._backlog_bytes += len(data)
+		if self._max_queued_bytes is not None and self._backlog_bytes > self._max_queued_bytes:
+			log.warning("Send queue of %s exceeded %i bytes - closing connection", self._address, self._max_queued_bytes)
+			self.close()
+
+	def _send_backlog(self) -> None:
+		backlog = self._backlog
+		while backlog and not self._resends_full():
+			data, reliability, trace = backlog.popleft()
+			self._backlog_bytes -= len(data)
+			self._send_now(data, reliability, trace)
+		if not backlog:
+			self._backlog = None
+
+	def _send_now(self, data: bytes, reliability: Reliability, trace: Optional[MessageTrace]) -> None:
 		ordering_index: Optional[int]
 		if reliability == Reliability.UnreliableSequenced:
 			ordering_index = self._sequenced_write_index
@@ -73,16 +341,20 @@ class RaknetConnection(Connection):
 		else:
 			ordering_index = None
 
-		if RaknetConnection._packet_header_length(reliability, False) + len(data) >= MTU_SIZE - UDP_HEADER_SIZE:
-			data_offset = 0
-			chunks = []
-			while data_offset < len(data):
-				data_length = MTU_SIZE - UDP_HEADER_SIZE - RaknetConnection._packet_header_length(reliability, True)
-				chunks.append(data[data_offset:data_offset+data_length])
-				data_offset += data_length
+		# the split packet header length is estimated with the maximum sizes of the compressed fields, which leaves enough room for the datagram header
+		if DATAGRAM_HEADER_LENGTH + RaknetConnection._packet_header_length(reliability, False) + len(data) > self._mtu - UDP_HEADER_SIZE:
+			# the chunks are views, so that the resends of all connections a payload was broadcast to share it
+			data_length = self._mtu - UDP_HEADER_SIZE - RaknetConnection._packet_header_length(reliability, True)
+			if reliability == Reliability.Reliable or reliability == Reliability.ReliableOrdered:
+				chunks = self._resend_store.split(data, data_length)
+			else:
+				view = memoryview(data)
+				chunks = [view[data_offset:data_offset+data_length] for data_offset in range(0, len(data), data_length)]
 
 			split_packet_id = self._split_packet_id
 			self._split_packet_id += 1
+			if trace is not None:
+				self._tracing.numbered(trace, self._send_message_number_index, self._send_message_number_index + len(chunks))
 			for split_packet_index, chunk in enumerate(chunks):
 				message_number = self._send_message_number_index
 				self._send_message_number_index += 1
@@ -90,45 +362,278 @@ class RaknetConnection(Connection):
 		else:
 			message_number = self._send_message_number_index
 			self._send_message_number_index += 1
+			if trace is not None:
+				self._tracing.numbered(trace, message_number, message_number + 1)
 			self._schedule_send(data, message_number, reliability, ordering_index, None)
 
+	def _send_many(self, packets: List[bytes], reliability: Reliability) -> None:
+		# packets that are sent right away are written into shared datagrams, paced and resent packets still get datagrams of their own
+		self._batching = True
+		try:
+			for data in packets:
+				self._send(data, reliability)
+		finally:
+			self._batching = False
+			self._flush_batch()
+
+	def _flush_batch(self) -> None:
+		if self._batch is not None:
+			self._transport.sendto(bytes(self._batch), self._address)
+			self._batch = None
+
+	def send_stream(self, source: StreamSource, length: Optional[int]=None, reliability: Reliability=Reliability.ReliableOrdered, max_in_flight: int=STREAM_MAX_IN_FLIGHT, progress: Optional[Callable[[OutgoingStream], None]]=None) -> OutgoingStream:
+		"""
+		Send a large message without splitting all of it up front. The remote receives it like any split packet sent with send.
+		source can be bytes-like (the chunks are sent as views into it, so don't modify it until the stream is done), a binary file (read from its current position) or an iterable of bytes.
+		length is the number of bytes to send, which is required for iterables. It defaults to the length of a bytes-like source, and the rest of the file for files.
+		Chunks are only sent when the congestion window has room and at most max_in_flight bytes of the stream are unacked, so the stream doesn't hold back other packets for long.
+		progress is called with the stream whenever a chunk has been acked.
+		Since a ReliableOrdered stream is one message, ReliableOrdered packets sent after it are only delivered after it.
+		pyraknet receivers accept messages of up to MAX_SPLIT_PACKET_BYTES including the overhead of the parts, about 15 MB at the default mtu.
+		"""
+		if reliability not in (Reliability.Reliable, Reliability.ReliableOrdered):
+			raise ValueError("streams have to be sent reliably")
+		if length is None:
+			if isinstance(source, (bytes, bytearray, memoryview)):
+				length = memoryview(source).nbytes
+			elif hasattr(source, "seek"):
+				position = source.tell()
+				length = source.seek(0, io.SEEK_END) - position
+				source.seek(position)
+			else:
+				raise ValueError("the length of an iterable has to be given")
+		if length == 0:
+			raise ValueError("can't send an empty message")
+		if reliability == Reliability.ReliableOrdered:
+			ordering_index = self._ordered_write_index
+			self._ordered_write_index += 1
+		else:
+			ordering_index = None
+		chunk_length = self._mtu - UDP_HEADER_SIZE - RaknetConnection._packet_header_length(reliability, True)
+		split_packet_id = self._split_packet_id
+		self._split_packet_id += 1
+		stream = OutgoingStream(_read_chunks(source, length, chunk_length), length, math.ceil(length / chunk_length), reliability, ordering_index, split_packet_id, max_in_flight, progress)
+		if self._streams is None:
+			self._streams = deque()
+		self._streams.append(stream)
+		self._send_streams()
+		return stream
+
+	def _send_streams(self) -> None:
+		"""Send chunks of the queued streams, oldest first, as far as the congestion window and the streams' in-flight limits allow."""
+		streams = self._streams
+		while streams and self._packets_sent < self._congestion.cwnd() and not self._resends_full():
+			stream = streams[0]
+			if stream.sent - stream.acked >= stream._max_in_flight:
+				return
+			try:
+				chunk = next(stream._chunks)
+			except ValueError:
+				# the remote can't ever complete the message, and ordered packets after it would never be delivered
+				log.exception("Stream to %s ended early - closing connection", self._address)
+				self.close()
+				return
+			message_number = self._send_message_number_index
+			self._send_message_number_index += 1
+			self._schedule_send(chunk, message_number, stream._reliability, stream._ordering_index, (stream._split_packet_id, stream._chunk_index, stream._chunk_count))
+			self._resends[message_number].stream = stream
+			stream.sent += len(chunk)
+			stream._chunk_index += 1
+			if stream._chunk_index == stream._chunk_count:
+				streams.popleft()
+		if not streams:
+			self._streams = None
+
 	def _schedule_send(self, data: bytes, message_number: int, reliability: Reliability, ordering_index: Optional[int], split_packet_info: Optional[Tuple[int, int, int]]) -> None:
 		if reliability == Reliability.Reliable or reliability == Reliability.ReliableOrdered:
-			self._resends[message_number] = asyncio.get_event_loop().call_later(self._rto_calc.rto(), self._schedule_send, data, message_number, reliability, ordering_index, split_packet_info)
-		if self._packets_sent >= self._cwnd_calc.cwnd():
+			resend = self._resends.get(message_number)
+			if resend is None:
+				resend = self._resends[message_number] = _PendingResend((data, message_number, reliability, ordering_index, split_packet_info))
+				self._resend_bytes += len(data)
+				self._resend_store.add(data)
+			resend.handle = self._clock.call_later(self._congestion.rto(), self._resend, message_number)
+		if self._packets_sent >= self._congestion.cwnd():
+			if self._tracing is not None and message_number not in self._resends:
+				self._tracing.dropped(message_number)
 			return
 		self._packets_sent += 1
+		interval = self._congestion.send_interval()
+		if interval > 0:
+			now = self._clock.time()
+			if self._sends or self._next_send_time > now:
+				if self._sends is None:
+					self._sends = deque()
+				self._sends.append((data, message_number, reliability, ordering_index, split_packet_info))
+				if self._send_paced_handle is None:
+					self._send_paced_handle = self._clock.call_later(self._next_send_time - now, self._send_paced)
+				return
+			self._next_send_time = now + interval
 		self._send_packet(data, message_number, reliability, ordering_index, split_packet_info)
 
+	def _resend(self, message_number: int) -> None:
+		resend = self._resends[message_number]
+		if resend.transmission is not None:
+			self._timeout_retransmits += 1
+		if self._last_ack_time < self._clock.time() - self._congestion.rto():
+			# Nothing has been acked for a whole rto, so whatever was sent is lost and shouldn't count towards the window anymore
+			# Otherwise losing everything in flight would block sending until the connection times out
+			self._packets_sent = 0
+		self._schedule_send(*resend.packet)
+
+	def _send_paced(self) -> None:
+		self._send_paced_handle = None
+		now = self._clock.time()
+		interval = self._congestion.send_interval()
+		# the loop may have woken up late, send everything that's due
+		while self._sends and self._next_send_time <= now:
+			self._send_packet(*self._sends.popleft())
+			self._next_send_time += interval
+		if self._sends:
+			self._send_paced_handle = self._clock.call_later(self._next_send_time - now, self._send_paced)
+
 	def close(self) -> None:
 		log.info("Closing connection %s", self._address)
 		self._dispatcher.dispatch(ConnectionEvent.Close, self)
 		if self._check_close_handle is not None:
 			self._check_close_handle.cancel()
+		# nothing is sent after closing, neither paced packets nor pending acks
+		if self._send_paced_handle is not None:
+			self._send_paced_handle.cancel()
+			self._send_paced_handle = None
+		self._sends = None
+		if self._send_acks_handle is not None:
+			self._send_acks_handle.cancel()
+			self._send_acks_handle = None
+		if self._mtu_probe is not None:
+			if self._mtu_probe.handle is not None:
+				self._mtu_probe.handle.cancel()
+			self._mtu_probe = None
+		self._close_receive_queue()
+		if self._scheduler is not None:
+			self._scheduler.discard(self)
+		if self._drain_waiters:
+			for waiter in self._drain_waiters:
+				if not waiter.done():
+					waiter.set_exception(ConnectionError("connection closed"))
+		if self._tracing is not None:
+			if self._backlog is not None:
+				for _, _, trace in self._backlog:
+					if trace is not None:
+						self._tracing.discarded(trace)
+			self._tracing.close()
+		for resend in self._resends.values():
+			resend.handle.cancel()
+			self._resend_store.remove(resend.packet[0])
+			if resend.stream is not None:
+				resend.stream._fail(ConnectionError("connection closed"))
+		self._resends.clear()
+		self._resend_bytes = 0
+		self._backlog = None
+		self._backlog_bytes = 0
+		if self._streams is not None:
+			for stream in self._streams:
+				stream._fail(ConnectionError("connection closed"))
+			self._streams = None
+
+	async def drain(self) -> None:
+		"""Wait until at most DRAIN_WINDOWS congestion windows of reliable packets are waiting to be acked."""
+		while not self._drained():
+			# one waiter per call, so a cancelled drain doesn't cancel the others and every failed waiter is awaited
+			waiter = asyncio.get_event_loop().create_future()
+			if self._drain_waiters is None:
+				self._drain_waiters = []
+			self._drain_waiters.append(waiter)
+			try:
+				await waiter
+			finally:
+				self._drain_waiters.remove(waiter)
+
+	def _drained(self) -> bool:
+		return len(self._resends) <= DRAIN_WINDOWS * self._congestion.cwnd()
+
+	def pause_receiving(self) -> None:
+		"""While paused, packets are dropped without acking them, so the remote will resend them later. Acks are still processed."""
+		self._receiving_paused += 1
+
+	def resume_receiving(self) -> None:
+		if self._receiving_paused:
+			self._receiving_paused -= 1
 
 	def handle_datagram(self, datagram: bytes) -> None:
+		if self._limiter is not None and not self._limiter.datagram(len(datagram), self._clock.time()):
+			self._over_limit("datagram")
+			return
 		stream = ReadStream(datagram)
 		if self._handle_datagram_header(stream):
 			return  # Acks only packet
+		if self._receiving_paused or (self._scheduler is not None and self._scheduler.full(self)):
+			self._datagrams_stalled += 1
+			return
 		# There can be multiple packets in one datagram
 		for packet in self._parse_packets(stream):
-			if packet[0] in (Message.DisconnectionNotification.value, Message.ConnectionLost.value):
-				self.close()
+			if self._scheduler is not None:
+				trace = None
+				if self._tracing is not None:
+					trace = self._tracing.current
+					self._tracing.current = None
+				self._scheduler.push(self, packet, trace)
 			else:
-				self._dispatcher.dispatch(ConnectionEvent.Receive, packet, self)
+				self._deliver(packet, None)
+
+	def _deliver(self, packet: bytes, trace: Optional[MessageTrace]) -> None:
+		"""Hand a received packet to the listeners. trace is the packet's trace if it was queued by the scheduler, otherwise it's still the current one."""
+		if trace is not None:
+			self._tracing.current = trace
+		if packet[0] in (Message.DisconnectionNotification.value, Message.ConnectionLost.value):
+			self.close()
+		else:
+			self._receive(packet)
+		if self._tracing is not None and self._tracing.current is not None:
+			self._tracing.dispatched()
 
 	def _handle_datagram_header(self, data: ReadStream) -> bool:
-		has_acks = data.read(c_bit)
+		try:
+			has_acks = data.read(c_bit)
+			if has_acks:
+				old_time = data.read(c_uint)
+				acks = data.read(_rangelist.RangeList)
+		except EOFError:
+			self._invalid_datagram("truncated header")
+			return True
 		if has_acks:
-			old_time = data.read(c_uint)
-			rtt = time.perf_counter() - self._start_time/1000 - old_time/1000
-			self._rto_calc.update(rtt)
+			# acks for message numbers that were never sent would be ignored anyway, but iterating over bogus ranges (up to 2^32 numbers each) would take forever
+			if not acks.is_valid(self._send_message_number_index):
+				self._invalid_datagram("invalid acks")
+				return True
+			rtt = self._clock.time() - self._start_time/1000 - old_time/1000
+			self._congestion.on_rtt(rtt)
+			if self._mtu_probe is not None and self._mtu_probe.message_number in acks:
+				self._mtu_probe_acked()
+			# only the unacked packets need to be looked at, so repeated acks for old packets don't cost anything either
+			acks.discard_below(next(iter(self._resends), self._send_message_number_index))
 
-			acks = data.read(_rangelist.RangeList)
+			highest_acked = -1
+			acked_transmissions = []
 			for message_number in acks:
-				if message_number in self._resends:
-					self._resends[message_number].cancel()
-					del self._resends[message_number]
+				highest_acked = message_number
+				resend = self._resends.pop(message_number, None)
+				if resend is not None:
+					resend.handle.cancel()
+					self._resend_bytes -= len(resend.packet[0])
+					self._resend_store.remove(resend.packet[0])
+					if resend.transmission is not None:
+						acked_transmissions.append(resend.transmission)
+					if resend.stream is not None:
+						resend.stream._chunk_acked(len(resend.packet[0]))
+				if self._tracing is not None:
+					self._tracing.acked(message_number)
+			if self._fast_retransmit_threshold is not None and acked_transmissions:
+				acked_transmissions.sort()
+				self._fast_retransmit(highest_acked, acked_transmissions)
+			# once every ReliableOrdered packet sent so far has been acked, the remote has delivered them, which also means the connection is established
+			if self._mtu_probe is not None and self._mtu_probe.handle is None and self._ordered_write_index > 0 and not self._resends and self._streams is None:
+				self._mtu_probe.ordering_index = self._ordered_write_index - 1
+				self._mtu_probe.handle = self._clock.call_later(0, self._probe_mtu)
 
 			num_acks = len(acks)
 			act_num_holes = 0 # number of holes that actually correspond to resends
@@ -136,79 +641,205 @@ class RaknetConnection(Connection):
 				if hole in self._resends:
 					act_num_holes += 1
 
-			self._cwnd_calc.update(self._packets_sent, num_acks, act_num_holes)
+			self._congestion.on_ack(self._packets_sent, num_acks, act_num_holes)
 			self._packets_sent = 0
-			self._last_ack_time = time.perf_counter()
+			self._last_ack_time = self._clock.time()
+			if self._backlog is not None:
+				self._send_backlog()
+			if self._streams is not None:
+				self._send_streams()
+			if self._drain_waiters and self._drained():
+				for waiter in self._drain_waiters:
+					if not waiter.done():
+						waiter.set_result(None)
 		if data.all_read():
 			return True
-		has_remote_system_time = data.read(c_bit)
-		if has_remote_system_time:
-			self._remote_system_time = data.read(c_uint)
+		try:
+			has_remote_system_time = data.read(c_bit)
+			if has_remote_system_time:
+				self._remote_system_time = data.read(c_uint)
+		except EOFError:
+			self._invalid_datagram("truncated header")
+			return True
+		return False
+
+	def _over_limit(self, what: str) -> bool:
+		"""Apply the policy of the inbound limits to traffic over them. Return whether the connection was closed."""
+		if self._limiter.limits.policy == OverflowPolicy.Close:
+			log.warning("%s from %s over the inbound limits - closing connection", what.capitalize(), self._address)
+			self.close()
+			return True
 		return False
 
+	def _invalid_datagram(self, reason: str) -> None:
+		"""Drop the rest of a malformed datagram, and close the connection if the inbound limits say so."""
+		self._invalid_datagrams += 1
+		if self._limiter is not None:
+			self._limiter.limits.invalid_datagrams += 1
+			if self._limiter.limits.policy == OverflowPolicy.Close:
+				log.warning("Invalid datagram from %s (%s) - closing connection", self._address, reason)
+				self.close()
+				return
+		log.debug("Dropping invalid datagram from %s: %s", self._address, reason)
+
+	def _fast_retransmit(self, highest_acked: int, acked_transmissions: List[int]) -> None:
+		"""
+		For each unacked packet with a lower message number than an acked one, count the just acked packets that were sent after it (like TCP's duplicate acks), and resend it once the count reaches the threshold.
+		Comparing transmissions instead of only message numbers means that acks for packets sent before a resend don't count against the resend.
+		acked_transmissions must be sorted.
+		"""
+		for message_number, resend in self._resends.items():
+			if message_number >= highest_acked:
+				break
+			if resend.transmission is None:
+				continue
+			misses = len(acked_transmissions) - bisect.bisect_right(acked_transmissions, resend.transmission)
+			if misses == 0:
+				continue
+			resend.misses += misses
+			if resend.misses >= self._fast_retransmit_threshold:
+				log.debug("Fast retransmit of m# %i", message_number)
+				self._fast_retransmits += 1
+				resend.handle.cancel()
+				resend.handle = self._clock.call_later(self._congestion.rto(), self._resend, message_number)
+				self._send_packet(*resend.packet)
+
 	def _parse_packets(self, data: ReadStream) -> Iterator[bytes]:
 		while not data.all_read():
-			message_number = data.read(c_uint)
-			reliability = Reliability(data.read_bits(3))
-			assert reliability != Reliability.ReliableSequenced  # This is never used
+			# The header fields are checked as they're read, since a malformed packet means the rest of the datagram can't be trusted either
+			try:
+				message_number = data.read(c_uint)
+				reliability_value = data.read_bits(3)
+				if reliability_value > Reliability.ReliableOrdered.value:  # ReliableSequenced is never used
+					self._invalid_datagram("reliability %i" % reliability_value)
+					return
+				reliability = Reliability(reliability_value)
 
-			if reliability in (Reliability.UnreliableSequenced, Reliability.ReliableOrdered):
-				ordering_channel = data.read_bits(5)
-				assert ordering_channel == 0  # No one actually uses a custom ordering channel
-				ordering_index = data.read(c_uint)
+				if reliability in (Reliability.UnreliableSequenced, Reliability.ReliableOrdered):
+					ordering_channel = data.read_bits(5)
+					if ordering_channel != 0:  # No one actually uses a custom ordering channel
+						self._invalid_datagram("ordering channel %i" % ordering_channel)
+						return
+					ordering_index = data.read(c_uint)
 
-			is_split_packet = data.read(c_bit)
+				is_split_packet = data.read(c_bit)
+				if is_split_packet:
+					split_packet_id = data.read(c_ushort)
+					split_packet_index = data.read_compressed(c_uint)
+					split_packet_count = data.read_compressed(c_uint)
+					if not split_packet_index < split_packet_count <= MAX_SPLIT_PACKET_COUNT:
+						self._invalid_datagram("split packet part %i of %i" % (split_packet_index, split_packet_count))
+						return
+
+				length = data.read_compressed(c_ushort)
+				data.align_read()
+				packet_data = data.read(bytes, length=int(math.ceil(length / 8)))
+			except EOFError:
+				self._invalid_datagram("truncated packet")
+				return
+			if not packet_data:
+				self._invalid_datagram("empty packet")
+				return
+
+			# Duplicate packet checks
+			# Reliable.* packets are resent, therefore we need to check for duplicates (the resend may have crossed our ack). Duplicates still have to be acked so the remote stops resending.
+			# Reliable (no ordering or sequencing) packets don't have an easy way of detecting duplicates, since they may arrive out of order, so we keep a sliding window of received message numbers.
+			# Since raknet assigns message numbers to unreliable packets too, all message numbers are tracked, otherwise unreliable numbers would show up as holes.
+			# The lookup doesn't mark the number as received, so it comes before everything that may stall the packet, and duplicates don't count towards the inbound limits.
+			# Checking here (before reassembly) also keeps duplicate split packet parts from starting a new split packet that will never complete.
+			# Below a forgotten hole, a reliable number may be a lost packet that's being resent, so it's handled like a new one. Dropping it would lose it for good, and not acking it would make the remote resend it forever.
+			# ReliableOrdered duplicates are still dropped by their ordering index, Reliable ones are delivered again, like they were with the old fixed-size list of received numbers.
+			too_old = reliability in (Reliability.Reliable, Reliability.ReliableOrdered) and self._received.is_too_old(message_number)
+			if too_old:
+				self._received.too_old += 1
+			if message_number in self._received and not too_old or (too_old and reliability == Reliability.ReliableOrdered and ordering_index < self._out_of_order_packets.head):
+				if reliability in (Reliability.Reliable, Reliability.ReliableOrdered):
+					self._ack(message_number)
+				self._received.duplicates += 1
+				log.debug("detected duplicate m# %i", message_number)
+				continue
+
+			reorder_length = len(packet_data)
 			if is_split_packet:
-				split_packet_id = data.read(c_ushort)
-				split_packet_index = data.read_compressed(c_uint)
-				split_packet_count = data.read_compressed(c_uint)
+				split_packet = self._split_packet_queue.get(split_packet_id) if self._split_packet_queue is not None else None
+				if split_packet is None:
+					split_length = split_packet_count * len(packet_data)
+					reorder_length = split_length
+					split_bytes = split_length + split_packet_count * _SPLIT_PART_OVERHEAD
+					if split_bytes > MAX_SPLIT_PACKET_BYTES:
+						self._invalid_datagram("split packet of %i parts of %i bytes" % (split_packet_count, len(packet_data)))
+						return
+				elif len(split_packet.parts) != split_packet_count:
+					self._invalid_datagram("split packet count changed from %i to %i" % (len(split_packet.parts), split_packet_count))
+					return
+				else:
+					# The reorder buffer holds the reassembled packet, so its length is reserved while the parts arrive, before they're acked
+					split_length = max(split_packet.length, split_packet_count * len(packet_data))
+					reorder_length = split_length - split_packet.reserved
+					split_bytes = split_length - split_packet.length
+				if not self._make_split_packet_room(split_packet, split_bytes):
+					log.debug("Too many incomplete split packets, stalling m# %i", message_number)
+					continue
+
+			# Packets that would overflow the reorder buffer must be handled before acking, so that stalling works
+			if reliability == Reliability.ReliableOrdered and not self._out_of_order_packets.fits(ordering_index, reorder_length):
+				self._out_of_order_packets.overflows += 1
+				if self._reorder_overflow_policy == OverflowPolicy.Close:
+					log.warning("Reorder buffer of %s overflowed - closing connection", self._address)
+					self.close()
+					return
+				log.debug("Reorder buffer full, stalling m# %i ord-index %i", message_number, ordering_index)
+				continue
+
+			# Only the first part of a split packet starts with the message id
+			if self._limiter is not None and (not is_split_packet or split_packet_index == 0) and not self._limiter.message(packet_data[0], self._clock.time()):
+				if self._over_limit("message %i" % packet_data[0]):
+					return
+				continue
 
-			length = data.read_compressed(c_ushort)
-			data.align_read()
-			packet_data = data.read(bytes, length=int(math.ceil(length / 8)))
 			if reliability in (Reliability.Reliable, Reliability.ReliableOrdered):
-				self._acks.insert(message_number)
-				if self._send_acks_handle is None:
-					self._send_acks_handle = asyncio.get_event_loop().call_later(0.03, self._send_acks_only)
+				self._ack(message_number)
+			if not too_old:
+				self._received.insert(message_number)
 
 			if is_split_packet:
-				if split_packet_id not in self._split_packet_queue:
-					self._split_packet_queue[split_packet_id] = [None]*split_packet_count
-				self._split_packet_queue[split_packet_id][split_packet_index] = packet_data
-				# check if packet is ready yet
-				ready = True
-				for packet_part in self._split_packet_queue[split_packet_id]:
-					if packet_part is None:
-						ready = False
-						break
-				if ready:
-					packet_data = b"".join(self._split_packet_queue[split_packet_id])
-					del self._split_packet_queue[split_packet_id]
+				if self._split_packet_queue is None:
+					self._split_packet_queue = {}
+				if split_packet is None:
+					split_packet = self._split_packet_queue[split_packet_id] = _SplitPacket(split_packet_count, reliability in (Reliability.Reliable, Reliability.ReliableOrdered), self._clock.time())
+				split_packet.length = split_length
+				split_packet.part_time = self._clock.time()
+				self._split_packet_bytes += split_bytes
+				if reliability == Reliability.ReliableOrdered and ordering_index > self._out_of_order_packets.head:
+					self._out_of_order_packets.reserve(reorder_length)
+					split_packet.reserved += reorder_length
+				if split_packet.parts[split_packet_index] is None:
+					split_packet.missing -= 1
+				split_packet.parts[split_packet_index] = packet_data
+				if split_packet.missing == 0:
+					packet_data = b"".join(split_packet.parts)
+					self._remove_split_packet(split_packet_id)
 				else:
+					if self._download_progress_interval is not None and self._clock.time() - split_packet.progress_time >= self._download_progress_interval:
+						split_packet.progress_time = self._clock.time()
+						yield self._download_progress(split_packet, len(packet_data))
 					continue
 
-			# Duplicate packet checks and ordering
+			trace = None
+			if self._tracing is not None:
+				trace = self._tracing.arrived(reliability, len(packet_data))
+
+			# Ordering
 			# Depending on reliability type:
-			# Unreliable & Unreliable Sequenced:
-			# Since unreliable packets are not resent, there can't be any duplicates. No checks needed.
-			# Reliable:
-			# Reliable.* packets are resent, therefore we need to check for duplicates. Reliable (no ordering or sequencing) packets also don't have an easy way of detecting duplicates, since they may arrive out of order.
-			# Simplest solution is to just keep a list of the last received reliable message numbers, and check packets against the list. If they're included, they will be detected as duplicate.
-			# Note that the failure rate of this method depends on list size vs packet frequency.
-			# Keeping a list of "missing" message numbers doesn't work too well because raknet is stupid and assigns message numbers to unreliable packets which don't even need them.
+			# Unreliable & Reliable:
+			# No ordering, duplicates have already been dropped above.
+			# Unreliable Sequenced:
+			# Older packets are ignored.
 			# Reliable Ordered:
-			# Reliable Ordered packets need to be checked for order, which as a side effect can detect duplicates. No extra duplicate detection needed.
+			# Reliable Ordered packets need to be checked for order, which as a side effect also detects duplicates.
 			# Reliable Sequenced:
 			# Is not used, but if it were, it would be handled similarly to Reliable Ordered.
 
-			if reliability == Reliability.Reliable:
-				if message_number not in self._last_rel_received:
-					del self._last_rel_received[0]
-					self._last_rel_received.append(message_number)
-				else:
-					log.info("detected reliable duplicate")
-					continue
-
 			if reliability == Reliability.UnreliableSequenced:
 				if ordering_index >= self._sequenced_read_index:
 					self._sequenced_read_index = ordering_index + 1
@@ -216,24 +847,90 @@ class RaknetConnection(Connection):
 					# sequenced means ignore older packets
 					continue
 			elif reliability == Reliability.ReliableOrdered:
-				if ordering_index == self._ordered_read_index:
-					self._ordered_read_index += 1
-					ord = ordering_index+1
-					while ord in self._out_of_order_packets:
-						self._ordered_read_index += 1
-						log.info("Releasing ord-index %i", ord)
-						yield self._out_of_order_packets.pop(ord)
-						ord += 1
-				elif ordering_index < self._ordered_read_index:
-					log.info("detected reliable ordered duplicate")
+				if ordering_index == self._out_of_order_packets.head:
+					now = self._clock.time()
+					self._out_of_order_packets.advance(now)
+					if trace is not None:
+						self._tracing.release(trace)
+					yield packet_data
+					# release the packets that were waiting for this one
+					while True:
+						head = self._out_of_order_packets.head
+						packet = self._out_of_order_packets.pop(now)
+						if packet is None:
+							break
+						if self._tracing is not None:
+							self._tracing.release_held(head)
+						yield packet
+					continue
+				elif ordering_index < self._out_of_order_packets.head:
+					log.debug("detected reliable ordered duplicate")
 					continue
 				else:
 					# Packet arrived too early, we're still waiting for a previous packet
-					# Add this one to a queue so we can process it later
-					self._out_of_order_packets[ordering_index] = packet_data
-					log.info("Packet too early m# %i ord-index %i>%i", message_number, ordering_index, self._ordered_read_index)
+					# Add this one to the buffer so we can process it later
+					if not self._out_of_order_packets.insert(ordering_index, packet_data, self._clock.time()):
+						log.debug("detected reliable ordered duplicate")
+						continue
+					if trace is not None:
+						self._tracing.hold(ordering_index, trace)
+					log.debug("Packet too early m# %i ord-index %i>%i", message_number, ordering_index, self._out_of_order_packets.head)
+					continue
+			if trace is not None:
+				self._tracing.release(trace)
 			yield packet_data
 
+	def _make_split_packet_room(self, split_packet: Optional[_SplitPacket], split_bytes: int) -> bool:
+		"""
+		Check whether a new split packet (if split_packet is None) or split_bytes more bytes for split_packet fit into the limits for incomplete split packets.
+		If they don't, drop incomplete unreliable split packets, least recently received first, until they do. Return False if there isn't enough room even then.
+		"""
+		queue = self._split_packet_queue
+		if queue is None:
+			return True
+		def full() -> bool:
+			return (split_packet is None and len(queue) >= MAX_SPLIT_PACKETS) or (split_bytes > 0 and self._split_packet_bytes + split_bytes > MAX_SPLIT_PACKET_BYTES)
+		if not full():
+			return True
+		droppable = sorted((other.part_time, split_packet_id) for split_packet_id, other in queue.items() if not other.reliable and other is not split_packet)
+		for _, split_packet_id in droppable:
+			log.debug("Dropping incomplete unreliable split packet %i to make room", split_packet_id)
+			self._split_packets_dropped += 1
+			self._remove_split_packet(split_packet_id)
+			if not full():
+				return True
+		return False
+
+	def _remove_split_packet(self, split_packet_id: int) -> None:
+		split_packet = self._split_packet_queue.pop(split_packet_id)
+		self._out_of_order_packets.unreserve(split_packet.reserved)
+		self._split_packet_bytes -= split_packet.length + len(split_packet.parts) * _SPLIT_PART_OVERHEAD
+		if not self._split_packet_queue:
+			self._split_packet_queue = None
+
+	def _expire_split_packets(self) -> None:
+		expired = self._clock.time() - SPLIT_PACKET_TIMEOUT
+		for split_packet_id, split_packet in list(self._split_packet_queue.items()):
+			if not split_packet.reliable and split_packet.part_time <= expired:
+				log.debug("Incomplete unreliable split packet %i from %s timed out", split_packet_id, self._address)
+				self._split_packets_dropped += 1
+				self._remove_split_packet(split_packet_id)
+
+	@staticmethod
+	def _download_progress(split_packet: _SplitPacket, part_length: int) -> bytes:
+		"""Return a DownloadProgress packet like RakNet's: the number of parts received, the total number of parts and the length of a part, without RakNet's copy of the first part."""
+		out = WriteStream()
+		out.write(c_ubyte(Message.DownloadProgress.value))
+		out.write(c_uint(len(split_packet.parts) - split_packet.missing))
+		out.write(c_uint(len(split_packet.parts)))
+		out.write(c_uint(part_length))
+		return bytes(out)
+
+	def _ack(self, message_number: int) -> None:
+		self._acks.insert(message_number)
+		if self._send_acks_handle is None:
+			self._send_acks_handle = self._clock.call_later(0.03, self._send_acks_only)
+
 	def _send_acks_only(self) -> None:
 		self._send_acks_handle = None
 		if self._acks:
@@ -244,7 +941,7 @@ class RaknetConnection(Connection):
 			self._acks.clear()
 			self._transport.sendto(bytes(out), self._address)
 
-	def _send_packet(self, data: bytes, message_number: int, reliability: Reliability, ordering_index: Optional[int], split_packet_info: Optional[Tuple[int, int, int]]) -> None:
+	def _datagram_header(self) -> WriteStream:
 		out = WriteStream()
 		out.write(c_bit(bool(self._acks)))
 		if self._acks:
@@ -252,11 +949,25 @@ class RaknetConnection(Connection):
 			out.write(self._acks)
 			self._acks.clear()
 
-		assert RaknetConnection._packet_header_length(reliability, split_packet_info is not None) + len(data) <= MTU_SIZE - UDP_HEADER_SIZE
-
 		has_remote_system_time = True
 		out.write(c_bit(has_remote_system_time))
-		out.write(c_uint(int(time.perf_counter() * 1000) - self._start_time))
+		out.write(c_uint(int(self._clock.time() * 1000) - self._start_time))
+		return out
+
+	def _send_packet(self, data: bytes, message_number: int, reliability: Reliability, ordering_index: Optional[int], split_packet_info: Optional[Tuple[int, int, int]]) -> None:
+		packet_length = RaknetConnection._packet_header_length(reliability, split_packet_info is not None) + len(data)
+		assert packet_length <= self._mtu - UDP_HEADER_SIZE or (self._mtu_probe is not None and message_number == self._mtu_probe.message_number)
+
+		if self._batching:
+			if self._batch is not None and self._batch_length + packet_length > self._mtu - UDP_HEADER_SIZE:
+				self._flush_batch()
+			if self._batch is None:
+				self._batch = self._datagram_header()
+				self._batch_length = len(bytes(self._batch))
+			out = self._batch
+			self._batch_length += packet_length
+		else:
+			out = self._datagram_header()
 
 		out.write(c_uint(message_number))
 
@@ -274,9 +985,17 @@ class RaknetConnection(Connection):
 			out.write_compressed(c_uint(split_packet_count))
 		out.write_compressed(c_ushort(len(data) * 8))
 		out.align_write()
-		out.write(data)
+		out.write(bytes(data))  # no copy if data is already bytes
 
-		self._transport.sendto(bytes(out), self._address)
+		if not self._batching:
+			self._transport.sendto(bytes(out), self._address)
+		if self._tracing is not None:
+			self._tracing.transmitted(message_number)
+		resend = self._resends.get(message_number)
+		if resend is not None:
+			resend.transmission = self._transmissions
+			self._transmissions += 1
+			resend.misses = 0
 
 	@staticmethod
 	def _packet_header_length(reliability: Reliability, is_split_packet: bool) -> int:
@@ -293,10 +1012,43 @@ class RaknetConnection(Connection):
 		length += 16  # data length (actually a compressed write so assume the maximum)
 		return int(math.ceil(length / 8))
 
+	def _probe_mtu(self) -> None:
+		"""
+		Find out whether datagrams of the next candidate mtu reach the remote by sending a padded packet of that size that's never resent.
+		If it's acked, that mtu is used from then on. Otherwise the next smaller candidate is tried after MTU_PROBE_TIMEOUT, until none are left and the mtu stays as it was.
+		Since the candidates are tried largest first, the first acked probe ends the discovery.
+		The probe is a ReliableOrdered packet with a new message number but the ordering index of a packet the remote has already delivered. RakNet (like _parse_packets) acks it and then drops it as an ordered duplicate, so the game never sees it.
+		That's why probing only starts once the remote has acked every packet sent so far, including at least one ReliableOrdered packet.
+		"""
+		probe = self._mtu_probe
+		if not probe.candidates:
+			log.info("MTU probing of %s found no larger mtu, staying at %i", self._address, self._mtu)
+			self._mtu_probe = None
+			return
+		probe.mtu = probe.candidates.pop(0)
+		probe.message_number = self._send_message_number_index
+		self._send_message_number_index += 1
+		# the probe has to be exactly as large as the largest datagram sent at that mtu, so pending acks mustn't be added to it
+		if self._send_acks_handle is not None:
+			self._send_acks_handle.cancel()
+			self._send_acks_only()
+		data_length = probe.mtu - UDP_HEADER_SIZE - DATAGRAM_HEADER_LENGTH - RaknetConnection._packet_header_length(Reliability.ReliableOrdered, False)
+		self._send_packet(bytes((Message.InternalPing.value,)) + bytes(data_length - 1), probe.message_number, Reliability.ReliableOrdered, probe.ordering_index, None)
+		probe.handle = self._clock.call_later(MTU_PROBE_TIMEOUT, self._probe_mtu)
+
+	def _mtu_probe_acked(self) -> None:
+		probe = self._mtu_probe
+		log.info("MTU probe of %s succeeded, using mtu %i", self._address, probe.mtu)
+		self._mtu = probe.mtu
+		probe.handle.cancel()
+		self._mtu_probe = None
+
 	def _check_close(self) -> None:
+		if self._split_packet_queue is not None:
+			self._expire_split_packets()
 		# close connection if we haven't received acks in the last 10 seconds
-		if self._resends and self._last_ack_time < time.perf_counter() - 10:
+		if self._resends and self._last_ack_time < self._clock.time() - 10:
 			log.info("Connection to %s probably dead - closing connection" % str(self._address))
 			self.close()
 		else:
-			self._check_close_handle = asyncio.get_event_loop().call_later(10, self._check_close)
+			self._check_close_handle = self._clock.call_later(10, self._check_close)
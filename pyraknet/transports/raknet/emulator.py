@@ -0,0 +1,107 @@
+"""
+Local network emulation for testing and benchmarking the reliability layer without sockets.
+An EmulatedLink stands in for the datagram transport of a RaknetConnection and delivers datagrams with configurable latency, jitter, loss, reordering, duplication and bandwidth, timed by a clock (usually a VirtualClock, but a LoopClock works too).
+Use connection_pair to get two RaknetConnections talking to each other over a pair of links.
+"""
+import random
+from typing import Any, Callable, Optional, Tuple
+
+from event_dispatcher import EventDispatcher
+
+from ...messages import Address
+from .clock import Clock
+from .connection import RaknetConnection, UDP_HEADER_SIZE
+
+class EmulatedLink:
+	"""
+	One direction of an emulated network link.
+	Datagrams passed to sendto are delivered to the receiver after they've been serialized onto the link (if bandwidth is limited) and the latency plus a random jitter has passed.
+	Without reordering, datagrams are delivered in the order they were sent, even with jitter. With probability reorder, a datagram is held back for an extra latency and will arrive after later ones.
+	If the queue of datagrams waiting for the link exceeds queue_limit bytes, datagrams are dropped (like a router's tail drop).
+	Datagrams that don't fit into mtu (including the IP and UDP headers) are dropped too, like on a path that doesn't allow fragmentation.
+	All randomness comes from a generator seeded with seed, so runs are reproducible.
+	"""
+
+	def __init__(self, clock: Clock, receiver: Optional[Callable[[bytes], None]]=None, latency: float=0, jitter: float=0, loss: float=0, duplicate: float=0, reorder: float=0, bandwidth: Optional[float]=None, queue_limit: Optional[int]=None, mtu: Optional[int]=None, seed: int=0):
+		"""bandwidth is in bytes per second, None means unlimited."""
+		self.receiver = receiver
+		self._clock = clock
+		self._latency = latency
+		self._jitter = jitter
+		self._loss = loss
+		self._duplicate = duplicate
+		self._reorder = reorder
+		self._bandwidth = bandwidth
+		self._queue_limit = queue_limit
+		self._mtu = mtu
+		self._random = random.Random(seed)
+		self._link_free_time = 0.0  # when the link will have finished serializing the queued datagrams
+		self._last_delivery_time = 0.0
+		self.sent = 0
+		self.sent_bytes = 0
+		self.delivered = 0
+		self.lost = 0
+		self.dropped = 0  # because the queue was full
+		self.too_large = 0  # because they didn't fit into the mtu
+		self.duplicated = 0
+		self.reordered = 0
+
+	def sendto(self, data: bytes, address: Optional[Address]=None) -> None:
+		now = self._clock.time()
+		self.sent += 1
+		self.sent_bytes += len(data)
+		if self._mtu is not None and len(data) + UDP_HEADER_SIZE > self._mtu:
+			self.too_large += 1
+			return
+		departure = now
+		if self._bandwidth is not None:
+			start = max(now, self._link_free_time)
+			if self._queue_limit is not None and (start - now) * self._bandwidth + len(data) > self._queue_limit:
+				self.dropped += 1
+				return
+			departure = start + len(data) / self._bandwidth
+			self._link_free_time = departure
+		if self._random.random() < self._loss:
+			self.lost += 1
+			return
+		copies = 1
+		if self._random.random() < self._duplicate:
+			self.duplicated += 1
+			copies = 2
+		for _ in range(copies):
+			arrival = departure + self._latency + self._random.uniform(0, self._jitter)
+			if self._random.random() < self._reorder:
+				self.reordered += 1
+				arrival += self._latency + self._jitter
+			else:
+				arrival = max(arrival, self._last_delivery_time)
+				self._last_delivery_time = arrival
+			self._clock.call_later(arrival - now, self._deliver, bytes(data))
+
+	def _deliver(self, data: bytes) -> None:
+		self.delivered += 1
+		if self.receiver is not None:
+			self.receiver(data)
+
+	def get_extra_info(self, name: str, default: Any=None) -> Any:
+		return default
+
+def connection_pair(clock: Clock, link_options: Optional[dict]=None, connection_options: Optional[dict]=None, dispatchers: Optional[Tuple[EventDispatcher, EventDispatcher]]=None) -> Tuple[RaknetConnection, RaknetConnection]:
+	"""
+	Create two connected RaknetConnections, a and b, using the clock.
+	link_options are passed to both EmulatedLinks (a to b is seeded with the given seed, b to a with seed + 1), connection_options to both connections.
+	The links are available as the connections' _transport.
+	"""
+	link_options = dict(link_options or {})
+	if connection_options is None:
+		connection_options = {}
+	if dispatchers is None:
+		dispatchers = EventDispatcher(), EventDispatcher()
+	seed = link_options.pop("seed", 0)
+	a_to_b = EmulatedLink(clock, seed=seed, **link_options)
+	b_to_a = EmulatedLink(clock, seed=seed + 1, **link_options)
+	a = RaknetConnection(a_to_b, dispatchers[0], ("10.0.0.2", 1001), clock=clock, **connection_options)
+	b = RaknetConnection(b_to_a, dispatchers[1], ("10.0.0.1", 1001), clock=clock, **connection_options)
+	a_to_b.receiver = b.handle_datagram
+	b_to_a.receiver = a.handle_datagram
+	return a, b
@@ -0,0 +1,100 @@
+"""
+Per-connection limits on inbound traffic, so that one misbehaving or malicious client can't use up the server's CPU time.
+Pass InboundLimits as RaknetConnection's inbound_limits argument (or in Server's raknet_options). The limits are shared configuration, every connection keeps its own token buckets.
+Datagrams are checked before they're parsed, messages before they're acked, so that reliable messages that are dropped are resent by a well-behaved remote later.
+"""
+from enum import auto, Enum
+from typing import Dict, Optional
+
+from ...messages import Message
+
+class OverflowPolicy(Enum):
+	"""What to do when a connection exceeds a buffer cap or an inbound limit."""
+	Close = auto()  # close the connection
+	Stall = auto()  # drop the packet without acking it, the remote will resend it later
+
+class _TokenBucket:
+	"""Allows rate units per second on average, and bursts of up to capacity units."""
+	__slots__ = "rate", "capacity", "tokens", "time"
+
+	def __init__(self, rate: float, capacity: float, now: float):
+		self.rate = rate
+		self.capacity = capacity
+		self.tokens = capacity
+		self.time = now
+
+	def can_take(self, amount: float, now: float) -> bool:
+		"""Return whether amount units are available, without taking them."""
+		self.tokens = min(self.capacity, self.tokens + (now - self.time) * self.rate)
+		self.time = now
+		return self.tokens >= amount
+
+	def take(self, amount: float, now: float) -> bool:
+		if not self.can_take(amount, now):
+			return False
+		self.tokens -= amount
+		return True
+
+class InboundLimits:
+	"""
+	Rates are per second and None for no limit. messages_per_second maps message ids to the rate of messages of that type, ids that aren't in it aren't limited.
+	burst is the number of seconds worth of traffic that may arrive at once, e.g. after a lag spike. burst * bytes_per_second should be larger than the mtu, otherwise full datagrams are always dropped.
+	policy decides what happens to traffic over the limits: Stall drops it (reliable messages aren't acked, so they're resent later), Close also closes the connection.
+	The counters are totals of all connections using these limits, RaknetConnection.get_stats has them per connection.
+	"""
+
+	def __init__(self, datagrams_per_second: Optional[float]=None, bytes_per_second: Optional[float]=None, messages_per_second: Optional[Dict[Message, float]]=None, burst: float=1.0, policy: OverflowPolicy=OverflowPolicy.Stall):
+		self.datagrams_per_second = datagrams_per_second
+		self.bytes_per_second = bytes_per_second
+		self.messages_per_second = {message.value: rate for message, rate in (messages_per_second or {}).items()}
+		self.burst = burst
+		self.policy = policy
+		self.datagrams_limited = 0
+		self.messages_limited = 0
+		self.invalid_datagrams = 0
+
+	def limiter(self, now: float) -> "InboundLimiter":
+		return InboundLimiter(self, now)
+
+class InboundLimiter:
+	"""The token buckets of one connection. The message buckets are created when the first message of their type arrives."""
+	__slots__ = "limits", "_datagrams", "_bytes", "_messages", "datagrams_limited", "messages_limited"
+
+	def __init__(self, limits: InboundLimits, now: float):
+		self.limits = limits
+		self._datagrams: Optional[_TokenBucket] = None
+		if limits.datagrams_per_second is not None:
+			self._datagrams = _TokenBucket(limits.datagrams_per_second, max(limits.datagrams_per_second * limits.burst, 1), now)
+		self._bytes: Optional[_TokenBucket] = None
+		if limits.bytes_per_second is not None:
+			self._bytes = _TokenBucket(limits.bytes_per_second, limits.bytes_per_second * limits.burst, now)
+		self._messages: Dict[int, _TokenBucket] = {}
+		self.datagrams_limited = 0
+		self.messages_limited = 0
+
+	def datagram(self, length: int, now: float) -> bool:
+		"""Return whether a datagram of this length is within the limits, and account for it if it is."""
+		# both buckets are checked before taking from either, so that a datagram over one limit doesn't use up the other
+		if (self._datagrams is None or self._datagrams.can_take(1, now)) and (self._bytes is None or self._bytes.can_take(length, now)):
+			if self._datagrams is not None:
+				self._datagrams.take(1, now)
+			if self._bytes is not None:
+				self._bytes.take(length, now)
+			return True
+		self.datagrams_limited += 1
+		self.limits.datagrams_limited += 1
+		return False
+
+	def message(self, message_id: int, now: float) -> bool:
+		"""Return whether a message with this id is within the limits, and account for it if it is."""
+		bucket = self._messages.get(message_id)
+		if bucket is None:
+			rate = self.limits.messages_per_second.get(message_id)
+			if rate is None:
+				return True
+			bucket = self._messages[message_id] = _TokenBucket(rate, max(rate * self.limits.burst, 1), now)
+		if bucket.take(1, now):
+			return True
+		self.messages_limited += 1
+		self.limits.messages_limited += 1
+		return False
@@ -0,0 +1,75 @@
+"""
+Accounting of the memory pinned by reliable packets that haven't been acked yet.
+Every RaknetTransport shares one ResendStore between its connections (pass resend_store in the connection options, e.g. Server's raknet_options, to use your own, for example to read its totals).
+Packets are kept as references to the buffer they were sent from, so a payload that's broadcast to many connections is only held once, and split packets are views into the original payload instead of copies.
+"""
+from typing import Dict, List, Optional, Union
+
+class ResendStore:
+	"""
+	Tracks the buffers referenced by the unacked reliable packets of the connections it's shared by.
+	bytes counts every buffer once, no matter how many packets refer to it, packet_bytes counts the packets as if nothing were shared.
+	If max_bytes is given and bytes reaches it, the connections queue new reliable packets until acks free memory again (see RaknetConnection's max_resend_bytes and max_queued_bytes).
+	"""
+
+	def __init__(self, max_bytes: Optional[int]=None):
+		self.max_bytes = max_bytes
+		self._buffers: Dict[int, List] = {}  # id of the buffer -> [buffer, number of packets referring to it, chunk length, chunks], see split
+		self.bytes = 0
+		self.packet_bytes = 0
+
+	@staticmethod
+	def _buffer(data: Union[bytes, memoryview]) -> object:
+		if isinstance(data, memoryview):
+			return data.obj
+		return data
+
+	def split(self, data: Union[bytes, memoryview], chunk_length: int) -> List[memoryview]:
+		"""
+		Return views of data in chunks of chunk_length bytes. All chunks have to be added right away.
+		data may be a view into a larger buffer, the whole buffer is accounted like in add.
+		The chunks are shared by all connections that split the same payload while it's stored, e.g. when it's broadcast.
+		"""
+		buffer = ResendStore._buffer(data)  # the chunks' buffer, which add and remove look them up by
+		entry = self._buffers.get(id(buffer))
+		if entry is not None and entry[2] == chunk_length:
+			return entry[3]
+		view = memoryview(data)
+		chunks = [view[offset:offset+chunk_length] for offset in range(0, len(data), chunk_length)]
+		if entry is None:
+			self._buffers[id(buffer)] = [buffer, 0, chunk_length, chunks]
+			self.bytes += memoryview(buffer).nbytes
+		else:
+			entry[2] = chunk_length
+			entry[3] = chunks
+		return chunks
+
+	def add(self, data: Union[bytes, memoryview]) -> None:
+		"""Register a packet. data is kept alive until the packet is removed."""
+		buffer = ResendStore._buffer(data)
+		entry = self._buffers.get(id(buffer))
+		if entry is None:
+			self._buffers[id(buffer)] = [buffer, 1, 0, None]
+			self.bytes += memoryview(buffer).nbytes
+		else:
+			entry[1] += 1
+		self.packet_bytes += len(data)
+
+	def remove(self, data: Union[bytes, memoryview]) -> None:
+		buffer = ResendStore._buffer(data)
+		entry = self._buffers[id(buffer)]
+		entry[1] -= 1
+		if entry[1] == 0:
+			del self._buffers[id(buffer)]
+			self.bytes -= memoryview(buffer).nbytes
+		self.packet_bytes -= len(data)
+
+	def full(self) -> bool:
+		return self.max_bytes is not None and self.bytes >= self.max_bytes
+
+	def get_stats(self) -> Dict[str, int]:
+		return {
+			"bytes": self.bytes,
+			"packet_bytes": self.packet_bytes,
+			"buffers": len(self._buffers),
+		}
@@ -0,0 +1,104 @@
+"""
+Fair scheduling of inbound messages across connections.
+Without a scheduler, every datagram is handled to completion when it arrives, including running the listeners of all messages in it, so a connection that sends a burst of datagrams keeps the event loop busy and delays everyone else's messages and acks.
+With one (pass it as inbound_scheduler in the connection options, e.g. Server's raknet_options), datagrams are still parsed and acks processed right away, but the parsed messages are queued per connection and dispatched round-robin, a bounded amount per event loop iteration.
+"""
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple, TYPE_CHECKING
+
+from .clock import Clock, LoopClock
+from .tracing import MessageTrace
+
+if TYPE_CHECKING:
+	from .connection import RaknetConnection
+
+log = logging.getLogger(__name__)
+
+class InboundScheduler:
+	"""
+	Dispatches at most max_messages messages, and stops after max_time seconds, per event loop iteration (None for no limit), then lets the loop handle other events before continuing.
+	Connections take turns one message at a time, in the order they had messages queued, so a busy connection only delays a quiet one by one message per turn.
+	asyncio reads one datagram per iteration, so a budget that's smaller than the number of messages in a busy connection's datagrams also lets the loop get to the datagrams of other connections sooner, and it keeps timers like the ones sending acks punctual.
+	When a connection has max_depth messages queued, its further datagrams are dropped without acking them until the queue gets shorter, like with RaknetConnection.pause_receiving.
+	"""
+
+	def __init__(self, max_messages: Optional[int]=16, max_time: Optional[float]=0.002, max_depth: int=1024, clock: Optional[Clock]=None):
+		self.max_messages = max_messages
+		self.max_time = max_time
+		self.max_depth = max_depth
+		if clock is None:
+			clock = LoopClock()
+		self._clock = clock
+		self._queues: Dict["RaknetConnection", Deque[Tuple[bytes, Optional[MessageTrace]]]] = {}
+		self._ready: Deque["RaknetConnection"] = deque()  # connections with queued messages, in turn order
+		self._drain_handle = None
+		self.queued = 0
+		self.max_queued = 0
+		self.delivered = 0
+		self.budget_exhausted = 0  # times dispatching was continued in a later iteration
+
+	def push(self, conn: "RaknetConnection", packet: bytes, trace: Optional[MessageTrace]) -> None:
+		queue = self._queues.get(conn)
+		if queue is None:
+			queue = self._queues[conn] = deque()
+			self._ready.append(conn)
+		queue.append((packet, trace))
+		self.queued += 1
+		if self.queued > self.max_queued:
+			self.max_queued = self.queued
+		if self._drain_handle is None:
+			self._drain_handle = self._clock.call_later(0, self._drain)
+
+	def full(self, conn: "RaknetConnection") -> bool:
+		return self.depth(conn) >= self.max_depth
+
+	def depth(self, conn: "RaknetConnection") -> int:
+		queue = self._queues.get(conn)
+		if queue is None:
+			return 0
+		return len(queue)
+
+	def discard(self, conn: "RaknetConnection") -> None:
+		"""Drop the queued messages of a closed connection."""
+		queue = self._queues.pop(conn, None)
+		if queue is not None:
+			self.queued -= len(queue)
+			self._ready.remove(conn)
+
+	def _drain(self) -> None:
+		self._drain_handle = None
+		ready = self._ready
+		start = time.perf_counter()
+		delivered = 0
+		while ready:
+			if (self.max_messages is not None and delivered >= self.max_messages) or (self.max_time is not None and time.perf_counter() - start >= self.max_time):
+				self.budget_exhausted += 1
+				self._drain_handle = self._clock.call_later(0, self._drain)
+				return
+			conn = ready.popleft()
+			queue = self._queues[conn]
+			packet, trace = queue.popleft()
+			if queue:
+				ready.append(conn)
+			else:
+				del self._queues[conn]
+			self.queued -= 1
+			self.delivered += 1
+			delivered += 1
+			try:
+				# may close the connection, which discards the rest of its queue
+				conn._deliver(packet, trace)
+			except Exception:
+				# a failing listener mustn't hold up the other connections' messages
+				log.exception("Error while handling a packet from %s", conn.get_address())
+
+	def get_stats(self) -> Dict[str, int]:
+		return {
+			"queued": self.queued,
+			"max_queued": self.max_queued,
+			"connections": len(self._queues),
+			"delivered": self.delivered,
+			"budget_exhausted": self.budget_exhausted,
+		}
@@ -0,0 +1,244 @@
+"""
+Opt-in sampled tracing of messages through the reliability layer, to find out where latency comes from.
+Pass a Tracer as RaknetConnection's tracer argument (or in Server's raknet_options). Without one, the connections only check for it at a few places.
+
+Outbound messages are timestamped when they're sent by the application, when they're first transmitted (after waiting in the send queue, for the congestion window or pacing), at every retransmission and when they're acked.
+Inbound messages are timestamped when they arrive (for split packets, when the last part arrives), when they're released by the reorder buffer and when the listeners are done with them.
+The resulting latencies are aggregated in histograms per connection, and the sampled traces can be written to a file as JSON lines for closer inspection.
+"""
+import json
+import random
+from typing import Dict, IO, List, Optional, Tuple
+
+from ...instrumentation import Histogram
+from ...messages import Address
+from ..abc import Reliability
+from .clock import Clock
+
+class MessageTrace:
+	"""The timestamped events of one sampled message."""
+	__slots__ = "direction", "reliability", "size", "parts", "events", "_pending"
+
+	def __init__(self, direction: str, reliability: Reliability, size: int, parts: int):
+		self.direction = direction
+		self.reliability = reliability
+		self.size = size
+		self.parts = parts  # number of split packet parts, 1 if the message isn't split (0 for outbound messages that haven't been assigned message numbers yet)
+		self.events: List[Tuple[str, float, int]] = []  # (event, time, message number or -1)
+		self._pending = parts  # parts that haven't been acked (or transmitted, if unreliable) yet
+
+	def time(self, event: str) -> Optional[float]:
+		"""Return the time of the first event with this name."""
+		for name, time, _ in self.events:
+			if name == event:
+				return time
+		return None
+
+	def last_time(self, event: str) -> Optional[float]:
+		for name, time, _ in reversed(self.events):
+			if name == event:
+				return time
+		return None
+
+	def to_json(self, address: Address) -> str:
+		start = self.events[0][1]
+		return json.dumps({
+			"address": "%s:%i" % address,
+			"direction": self.direction,
+			"reliability": self.reliability.name,
+			"size": self.size,
+			"parts": self.parts,
+			"start": start,
+			"events": [[name, round(time - start, 6), message_number] for name, time, message_number in self.events],
+		})
+
+class TraceStats:
+	"""Latency histograms of the sampled messages of a connection, in microseconds."""
+	__slots__ = "queueing", "retransmit", "ack", "total", "reorder", "dispatch", "retransmits", "dropped", "unfinished"
+
+	def __init__(self) -> None:
+		self.queueing = Histogram()  # send until first transmission, waiting in the send queue, for the congestion window or pacing
+		self.retransmit = Histogram()  # first until last transmission, only for messages that were retransmitted
+		self.ack = Histogram()  # last transmission until the ack of the last part
+		self.total = Histogram()  # send until acked
+		self.reorder = Histogram()  # arrival until release, waiting for earlier ReliableOrdered messages
+		self.dispatch = Histogram()  # release until the listeners are done
+		self.retransmits = 0
+		self.dropped = 0  # never transmitted: unreliable messages dropped because the congestion window was full, and queued messages discarded when the connection was closed
+		self.unfinished = 0  # still unacked when the connection was closed
+
+	def record_outbound(self, trace: MessageTrace) -> None:
+		send = trace.time("send")
+		first = trace.time("transmit")
+		last = max(trace.last_time("transmit"), trace.last_time("retransmit") or 0)
+		self.queueing.record(int((first - send) * 1000000))
+		retransmits = sum(1 for name, _, _ in trace.events if name == "retransmit")
+		if retransmits:
+			self.retransmits += retransmits
+			self.retransmit.record(int((last - first) * 1000000))
+		acked = trace.last_time("ack")
+		if acked is not None:
+			self.ack.record(int((acked - last) * 1000000))
+			self.total.record(int((acked - send) * 1000000))
+
+	def record_inbound(self, trace: MessageTrace) -> None:
+		arrival = trace.time("arrive")
+		release = trace.time("release")
+		self.reorder.record(int((release - arrival) * 1000000))
+		self.dispatch.record(int((trace.time("dispatched") - release) * 1000000))
+
+class Tracer:
+	"""
+	Samples messages of the connections it's passed to with probability sample_rate, and aggregates their latencies per connection (stats, total).
+	If path is given, the finished traces are appended to that file as JSON lines, see MessageTrace.to_json.
+	"""
+
+	def __init__(self, sample_rate: float=0.01, path: Optional[str]=None, seed: Optional[int]=None):
+		self.sample_rate = sample_rate
+		self._random = random.Random(seed)
+		self._file: Optional[IO[str]] = None
+		if path is not None:
+			self._file = open(path, "a")
+		self.stats: Dict[Address, TraceStats] = {}  # of the open connections
+		self.total = TraceStats()  # of all connections, including closed ones
+
+	def sample(self) -> bool:
+		return self._random.random() < self.sample_rate
+
+	def connection(self, address: Address, clock: Clock) -> "ConnectionTracing":
+		stats = self.stats[address] = TraceStats()
+		return ConnectionTracing(self, address, clock, stats)
+
+	def finish(self, address: Address, stats: TraceStats, trace: MessageTrace) -> None:
+		if trace.direction == "out":
+			if trace.time("transmit") is None:
+				stats.dropped += 1
+				self.total.dropped += 1
+			elif trace._pending and trace.reliability in (Reliability.Reliable, Reliability.ReliableOrdered):
+				stats.unfinished += 1
+				self.total.unfinished += 1
+			else:
+				stats.record_outbound(trace)
+				self.total.record_outbound(trace)
+		else:
+			stats.record_inbound(trace)
+			self.total.record_inbound(trace)
+		if self._file is not None:
+			self._file.write(trace.to_json(address))
+			self._file.write("\n")
+
+	def close(self) -> None:
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+
+	def report(self) -> str:
+		"""Return a table of the latency percentiles per connection and in total, in milliseconds."""
+		columns = "queueing", "retransmit", "ack", "total", "reorder", "dispatch"
+		lines = ["%-22s %6s %7s " % ("connection", "count", "resends") + " ".join("%17s" % (column + " p50/p99") for column in columns)]
+		rows = [("%s:%i" % address, stats) for address, stats in self.stats.items()]
+		rows.append(("total", self.total))
+		for name, stats in rows:
+			cells = []
+			for column in columns:
+				hist = getattr(stats, column)
+				cells.append("%8.2f/%8.2f" % (hist.percentile(50) / 1000, hist.percentile(99) / 1000))
+			lines.append("%-22s %6i %7i " % (name, stats.queueing.count + stats.reorder.count, stats.retransmits) + " ".join(cells))
+		return "\n".join(lines)
+
+class ConnectionTracing:
+	"""The tracing state of one connection. RaknetConnection calls these methods at the points where messages change state."""
+	__slots__ = "_tracer", "_address", "_clock", "_stats", "_outbound", "_held", "current"
+
+	def __init__(self, tracer: Tracer, address: Address, clock: Clock, stats: TraceStats):
+		self._tracer = tracer
+		self._address = address
+		self._clock = clock
+		self._stats = stats
+		self._outbound: Dict[int, MessageTrace] = {}  # message number of every part -> trace
+		self._held: Dict[int, MessageTrace] = {}  # ordering index -> trace of inbound messages in the reorder buffer
+		self.current: Optional[MessageTrace] = None  # trace of the inbound message that's being dispatched
+
+	def sent(self, size: int, reliability: Reliability) -> Optional[MessageTrace]:
+		"""Called when the application sends a message, before it's queued. Return a trace if the message is sampled, for numbered (or discarded if it never leaves the queue)."""
+		if not self._tracer.sample():
+			return None
+		trace = MessageTrace("out", reliability, size, 0)
+		trace.events.append(("send", self._clock.time(), -1))
+		return trace
+
+	def numbered(self, trace: MessageTrace, first_message_number: int, end_message_number: int) -> None:
+		"""Called when the message was assigned the message numbers from first_message_number up to end_message_number (exclusive)."""
+		trace.parts = trace._pending = end_message_number - first_message_number
+		for message_number in range(first_message_number, end_message_number):
+			self._outbound[message_number] = trace
+
+	def discarded(self, trace: MessageTrace) -> None:
+		"""Called when a queued message is dropped because the connection is closed."""
+		trace.events.append(("discard", self._clock.time(), -1))
+		self._tracer.finish(self._address, self._stats, trace)
+
+	def transmitted(self, message_number: int) -> None:
+		trace = self._outbound.get(message_number)
+		if trace is None:
+			return
+		transmitted_before = any(event_message_number == message_number for name, _, event_message_number in trace.events if name != "send")
+		trace.events.append(("retransmit" if transmitted_before else "transmit", self._clock.time(), message_number))
+		if trace.reliability not in (Reliability.Reliable, Reliability.ReliableOrdered):
+			self._part_done(message_number, trace)
+
+	def dropped(self, message_number: int) -> None:
+		"""Called when an unreliable packet isn't sent because the congestion window is full."""
+		trace = self._outbound.get(message_number)
+		if trace is not None:
+			trace.events.append(("drop", self._clock.time(), message_number))
+			self._part_done(message_number, trace)
+
+	def acked(self, message_number: int) -> None:
+		trace = self._outbound.get(message_number)
+		if trace is not None:
+			trace.events.append(("ack", self._clock.time(), message_number))
+			self._part_done(message_number, trace)
+
+	def _part_done(self, message_number: int, trace: MessageTrace) -> None:
+		del self._outbound[message_number]
+		trace._pending -= 1
+		if trace._pending == 0:
+			self._tracer.finish(self._address, self._stats, trace)
+
+	def arrived(self, reliability: Reliability, size: int) -> Optional[MessageTrace]:
+		"""Called when a complete inbound message has arrived. Return a trace if the message is sampled."""
+		if not self._tracer.sample():
+			return None
+		trace = MessageTrace("in", reliability, size, 1)
+		trace.events.append(("arrive", self._clock.time(), -1))
+		return trace
+
+	def release(self, trace: MessageTrace) -> None:
+		"""Called right before the message is handed to the listeners."""
+		trace.events.append(("release", self._clock.time(), -1))
+		self.current = trace
+
+	def hold(self, ordering_index: int, trace: MessageTrace) -> None:
+		"""Called when the message is put into the reorder buffer."""
+		self._held[ordering_index] = trace
+
+	def release_held(self, ordering_index: int) -> None:
+		trace = self._held.pop(ordering_index, None)
+		if trace is not None:
+			self.release(trace)
+
+	def dispatched(self) -> None:
+		"""Called when the listeners are done with the current message."""
+		trace = self.current
+		self.current = None
+		trace.events.append(("dispatched", self._clock.time(), -1))
+		self._tracer.finish(self._address, self._stats, trace)
+
+	def close(self) -> None:
+		"""Write the traces of messages that are still in flight, and stop tracking the connection."""
+		for trace in {id(trace): trace for trace in self._outbound.values()}.values():
+			self._tracer.finish(self._address, self._stats, trace)
+		self._outbound.clear()
+		self._held.clear()
+		self._tracer.stats.pop(self._address, None)
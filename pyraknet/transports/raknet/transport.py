@@ -1,20 +1,27 @@
 import asyncio
 import logging
-from typing import cast
+from typing import Any, cast, Dict
 
 from event_dispatcher import EventDispatcher
 
 from ...messages import Address, Message
 from ..abc import ConnectionEvent, ConnectionType, TransportEvent
 from .connection import RaknetConnection
+from .resends import ResendStore
 
 log = logging.getLogger(__name__)
 
 class RaknetTransport(asyncio.DatagramProtocol):
-	def __init__(self, listen_addr: Address, max_connections: int, dispatcher: EventDispatcher):
+	def __init__(self, listen_addr: Address, max_connections: int, dispatcher: EventDispatcher, **connection_options: Any):
+		"""
+		Any additional keyword arguments are passed on to every RaknetConnection, e.g. congestion_control. Unless resend_store is given, the connections share a new ResendStore.
+		To dispatch received messages fairly across connections instead of in arrival order, pass an InboundScheduler as inbound_scheduler, see scheduler.InboundScheduler.
+		"""
+		connection_options.setdefault("resend_store", ResendStore())
 		self._dispatcher = dispatcher
 		self._connections: Dict[Address, RaknetConnection] = {}
 		self._max_connections = max_connections
+		self._connection_options = connection_options
 		self._dispatcher.add_listener(ConnectionEvent.Close, self._on_close_conn)
 		asyncio.ensure_future(self._init_network(listen_addr))
 
@@ -50,7 +57,7 @@ class RaknetTransport(asyncio.DatagramProtocol):
 	def _on_open_connection_request(self, address: Address) -> None:
 		if len(self._connections) < self._max_connections:
 			if address not in self._connections:
-				self._connections[address] = RaknetConnection(self._transport, self._dispatcher, address)
+				self._connections[address] = RaknetConnection(self._transport, self._dispatcher, address, **self._connection_options)
 			self._transport.sendto(bytes((Message.OpenConnectionReply.value, 0)), address)
 		else:
 			self._transport.sendto(bytes((Message.NoFreeIncomingConnections.value, 0)), address)
@@ -0,0 +1,98 @@
+"""
+Optional compression of the reliable frames sent over TCP, see Compression.
+Large reliable packets (world loads, inventories, chat history) compress well, and since every direction of a connection uses one compression stream for all its frames, later frames can refer back to earlier ones, so repeated structures get cheap.
+
+The protocol, for client implementations:
+	When compression is enabled on the receiving side, the top two bits of a frame's length prefix are flags: 0x80000000 for a compressed frame, 0x40000000 for a control frame. The length is in the remaining 30 bits.
+	Control frames are a ubyte type (0 offer, 1 accept) and the uint CRC32 of the dictionary (0 without one), little endian like the rest.
+	The client sends an offer. The server answers with an accept if compression is enabled and the dictionaries match, and doesn't answer otherwise. Both sides may send compressed frames after the accept.
+	Without compression enabled, a server takes the offer for the start of a huge frame, so clients should only offer compression to servers known to support it.
+	A compressed frame is the output of a raw deflate stream (window bits -15, zdict set to the dictionary) for the packet, followed by a sync flush without its trailing 00 00 ff ff, like WebSocket's permessage-deflate.
+	Each direction is one stream, so compressed frames have to be decompressed in order. Frames below the sender's threshold are sent uncompressed and aren't part of the stream.
+"""
+import struct
+import zlib
+from typing import Tuple
+
+COMPRESSED = 0x80000000
+CONTROL = 0x40000000
+LENGTH_MASK = 0x3fffffff
+
+OFFER = 0
+ACCEPT = 1
+_CONTROL = struct.Struct("<BI")
+_SYNC_TAIL = b"\x00\x00\xff\xff"
+
+class Compression:
+	"""
+	Compression settings, pass them as compression to TCPUDPTransport (e.g. with Server's tcpudp_options).
+	Reliable packets of at least threshold bytes are compressed with the given zlib level, smaller ones aren't worth it.
+	A dictionary (up to 32 KiB of data typical for the packets, most common parts last) helps the first frames of a connection, before the stream has history of its own. Clients have to use the same one.
+	Compressed frames that decompress to more than max_frame_size bytes close the connection.
+	"""
+
+	def __init__(self, threshold: int=256, level: int=6, dictionary: bytes=b"", max_frame_size: int=16 * 1024 * 1024):
+		if max_frame_size <= 0:
+			raise ValueError("max_frame_size must be positive")
+		self.threshold = threshold
+		self.level = level
+		self.dictionary = dictionary
+		self.dictionary_id = zlib.crc32(dictionary)
+		self.max_frame_size = max_frame_size
+
+	def control(self, kind: int) -> bytes:
+		return _CONTROL.pack(kind, self.dictionary_id)
+
+	def parse_control(self, packet: bytes) -> Tuple[int, int]:
+		"""Return the type and dictionary id of a control frame. Raise ValueError if it's malformed."""
+		if len(packet) != _CONTROL.size:
+			raise ValueError("invalid control frame")
+		kind, dictionary_id = _CONTROL.unpack(packet)
+		if kind not in (OFFER, ACCEPT):
+			raise ValueError("unknown control frame type %i" % kind)
+		return kind, dictionary_id
+
+	def compressor(self) -> "FrameCompressor":
+		return FrameCompressor(self)
+
+	def decompressor(self) -> "FrameDecompressor":
+		return FrameDecompressor(self)
+
+class FrameCompressor:
+	"""The compression stream of one direction of a connection."""
+	__slots__ = "_compressobj", "bytes_in", "bytes_out"
+
+	def __init__(self, compression: Compression):
+		if compression.dictionary:
+			self._compressobj = zlib.compressobj(compression.level, zlib.DEFLATED, -15, zdict=compression.dictionary)
+		else:
+			self._compressobj = zlib.compressobj(compression.level, zlib.DEFLATED, -15)
+		self.bytes_in = 0
+		self.bytes_out = 0
+
+	def compress(self, data: bytes) -> bytes:
+		out = self._compressobj.compress(data) + self._compressobj.flush(zlib.Z_SYNC_FLUSH)
+		out = out[:-len(_SYNC_TAIL)]
+		self.bytes_in += len(data)
+		self.bytes_out += len(out)
+		return out
+
+class FrameDecompressor:
+	__slots__ = "_decompressobj", "_max_frame_size"
+
+	def __init__(self, compression: Compression):
+		if compression.dictionary:
+			self._decompressobj = zlib.decompressobj(-15, zdict=compression.dictionary)
+		else:
+			self._decompressobj = zlib.decompressobj(-15)
+		self._max_frame_size = compression.max_frame_size
+
+	def decompress(self, data: bytes) -> bytes:
+		"""Raise ValueError if the data is corrupt or decompresses to more than max_frame_size bytes. The stream can't be used afterwards."""
+		try:
+			out = self._decompressobj.decompress(b"".join((data, _SYNC_TAIL)), self._max_frame_size)
+		except zlib.error as e:
+			raise ValueError("corrupt compressed frame: %s" % e)
+		if self._decompressobj.unconsumed_tail:
+			raise ValueError("compressed frame larger than %i bytes" % self._max_frame_size)
+		return out
@@ -1,23 +1,52 @@
 import asyncio
+import logging
 from ssl import SSLContext
-from typing import cast, Optional, SupportsBytes
+from typing import cast, List, Optional, SupportsBytes
 
 from bitstream import c_uint, c_ushort
 from event_dispatcher import EventDispatcher
 
 from ...messages import Address
 from ..abc import Connection, ConnectionEvent, ConnectionType, Reliability, TransportEvent
+from .compression import ACCEPT, COMPRESSED, Compression, CONTROL, FrameCompressor, FrameDecompressor, LENGTH_MASK, OFFER
 
-class TCPUDPConnection(Connection, asyncio.Protocol):
-	def __init__(self, transport):
+log = logging.getLogger(__name__)
+
+RECEIVE_BUFFER_SIZE = 64 * 1024  # size the receive buffer grows to while data keeps arriving faster than it's read (larger frames grow it further)
+_MIN_READ_SIZE = 4096
+
+class TCPUDPConnection(Connection, asyncio.BufferedProtocol):
+	"""
+	Reliable packets are sent over TCP as length-prefixed frames, unreliable ones over UDP.
+
+	Received frames are parsed in place in a reusable receive buffer and dispatched as memoryviews into that buffer, which are only valid until the next read.
+	Should a listener keep a reference to one anyway, the buffer is left to it and a new one is used from then on.
+	The buffer starts out empty and only grows when reads fill it, so idle connections stay small.
+	Outgoing frames are collected and written at once at the end of the current loop iteration.
+	With compression settings, reliable frames can be compressed once the client has asked for it, see the compression module.
+	"""
+	__slots__ = "_transport", "_tcp", "_remote_addr", "_in_seq_num", "_out_seq_num", "_buffer", "_buffer_start", "_buffer_end", "_read_filled_buffer", "_out_frames", "_receiving_paused", "_parsing", "_writing_paused", "_drain_waiters", "_compression", "_compressor", "_decompressor", "_compression_offered"
+
+	def __init__(self, transport, compression: Optional[Compression]=None):
 		super().__init__(transport._dispatcher)
 		self._transport = transport
 		self._tcp = None
 		self._remote_addr = None
 		self._in_seq_num = 0
 		self._out_seq_num = 0
-		self._packet_len = 0
-		self._packet = bytearray()
+		self._buffer = bytearray()
+		self._buffer_start = 0  # start of the data that hasn't been parsed yet
+		self._buffer_end = 0  # end of the received data
+		self._read_filled_buffer = False
+		self._out_frames: List[bytes] = []
+		self._receiving_paused = 0  # number of pause_receiving calls that haven't been matched by resume_receiving yet
+		self._parsing = False  # set while _parse_frames dispatches, so a listener that pauses and resumes doesn't parse the same frames again
+		self._writing_paused = False  # set while the TCP transport's write buffer is full
+		self._drain_waiters: Optional[List[asyncio.Future]] = None  # one per waiting drain call
+		self._compression = compression
+		self._compressor: Optional[FrameCompressor] = None  # set once compression has been negotiated
+		self._decompressor: Optional[FrameDecompressor] = None
+		self._compression_offered = False
 
 	# TCP
 
@@ -31,34 +60,170 @@ class TCPUDPConnection(Connection, asyncio.Protocol):
 	def connection_lost(self, exc):
 		print("connection lost", exc)
 		self._dispatcher.dispatch(ConnectionEvent.Close, self)
+		self._close_receive_queue()
+		self._writing_paused = False
+		if self._drain_waiters:
+			for waiter in self._drain_waiters:
+				if not waiter.done():
+					waiter.set_exception(ConnectionError("connection closed"))
+
+	def pause_writing(self) -> None:
+		self._writing_paused = True
+
+	def resume_writing(self) -> None:
+		self._writing_paused = False
+		if self._drain_waiters:
+			for waiter in self._drain_waiters:
+				if not waiter.done():
+					waiter.set_result(None)
+
+	async def drain(self) -> None:
+		"""Write the queued frames and wait until the TCP transport's write buffer has room again."""
+		self._flush()
+		if self._writing_paused:
+			# one waiter per call, so a cancelled drain doesn't cancel the others and every failed waiter is awaited
+			waiter = asyncio.get_event_loop().create_future()
+			if self._drain_waiters is None:
+				self._drain_waiters = []
+			self._drain_waiters.append(waiter)
+			try:
+				await waiter
+			finally:
+				self._drain_waiters.remove(waiter)
+
+	def get_buffer(self, sizehint: int) -> memoryview:
+		pending = self._buffer_end - self._buffer_start
+		if self._buffer_retained():
+			new_buffer = bytearray(len(self._buffer))
+			new_buffer[:pending] = self._buffer[self._buffer_start:self._buffer_end]
+			self._buffer = new_buffer
+			self._buffer_start = 0
+			self._buffer_end = pending
+		elif pending == 0:
+			self._buffer_start = 0
+			self._buffer_end = 0
+		elif len(self._buffer) - self._buffer_end < _MIN_READ_SIZE or self._buffer_start > len(self._buffer) // 2:
+			# move the partial frame to the start of the buffer
+			self._buffer[:pending] = self._buffer[self._buffer_start:self._buffer_end]
+			self._buffer_start = 0
+			self._buffer_end = pending
+
+		if self._read_filled_buffer and len(self._buffer) < RECEIVE_BUFFER_SIZE:
+			# the last read took all the space it was given, so more data is probably waiting, read more at once
+			self._buffer.extend(bytes(len(self._buffer)))
+		if len(self._buffer) - self._buffer_end < _MIN_READ_SIZE:
+			# the partial frame fills the buffer, grow it (only as fast as data actually arrives, the length prefix can't be trusted)
+			self._buffer.extend(bytes(max(len(self._buffer), _MIN_READ_SIZE)))
+		return memoryview(self._buffer)[self._buffer_end:]
+
+	def buffer_updated(self, nbytes: int) -> None:
+		self._buffer_end += nbytes
+		self._read_filled_buffer = self._buffer_end == len(self._buffer)
+		self._parse_frames()
 
-	def data_received(self, data: bytes):
-		offset = 0
-		whole_len = len(data)
-		while offset < whole_len:
-			if self._packet_len == 0:
-				self._packet_len = c_uint._struct.unpack(data[offset:offset+4])[0]
-				offset += 4
+	def _parse_frames(self) -> None:
+		buffer = memoryview(self._buffer)
+		offset = self._buffer_start
+		self._parsing = True
+		try:
+			# There can be multiple frames in one read
+			while not self._receiving_paused and self._buffer_end - offset >= 4:
+				packet_len = c_uint._struct.unpack_from(self._buffer, offset)[0]
+				flags = 0
+				if self._compression is not None:
+					flags = packet_len & ~LENGTH_MASK
+					packet_len &= LENGTH_MASK
+				if self._buffer_end - offset - 4 < packet_len:
+					break  # incomplete frame, wait for more data
+				packet = buffer[offset+4:offset+4+packet_len]
+				offset += 4 + packet_len
+				self._buffer_start = offset
+				if not flags:
+					self._receive(packet)
+				elif not self._receive_special(flags, packet):
+					return
+		finally:
+			self._parsing = False
+
+	def _receive_special(self, flags: int, packet: memoryview) -> bool:
+		"""Handle a compressed or control frame. Return False if it was invalid, which closes the connection."""
+		try:
+			if flags == COMPRESSED:
+				if self._decompressor is None:
+					raise ValueError("compressed frame before compression was negotiated")
+				data = self._decompressor.decompress(packet)
+			elif flags == CONTROL:
+				self._on_control(bytes(packet))
+				return True
 			else:
-				packet = data[offset:offset+self._packet_len-len(self._packet)]
-				offset += len(packet)
-				self._packet.extend(packet)
-				if len(self._packet) == self._packet_len:
-					packet = self._packet
-					self._packet_len = 0
-					self._packet = bytearray()
-					self._dispatcher.dispatch(ConnectionEvent.Receive, packet, self)
+				raise ValueError("invalid frame flags %x" % flags)
+		except ValueError as e:
+			log.warning("Closing connection to %s: %s", self._remote_addr, e)
+			self.close()
+			return False
+		self._receive(data)
+		return True
+
+	def _on_control(self, packet: bytes) -> None:
+		kind, dictionary_id = self._compression.parse_control(packet)
+		if dictionary_id != self._compression.dictionary_id or self._compressor is not None:
+			return  # already negotiated, or different dictionaries: the offer stays unanswered and frames aren't compressed
+		if kind == OFFER:
+			self._write_frame(CONTROL, self._compression.control(ACCEPT))
+			self._start_compression()
+		elif self._compression_offered:
+			self._start_compression()
+		else:
+			raise ValueError("accept without an offer")
+
+	def offer_compression(self) -> None:
+		"""Ask the remote to compress frames in both directions, as a client would. Requires compression settings."""
+		if self._compression is None:
+			raise RuntimeError("no compression settings")
+		self._compression_offered = True
+		self._write_frame(CONTROL, self._compression.control(OFFER))
+
+	def _start_compression(self) -> None:
+		log.debug("Compressing frames of %s", self._remote_addr)
+		self._compressor = self._compression.compressor()
+		self._decompressor = self._compression.decompressor()
+
+	def _buffer_retained(self) -> bool:
+		"""Return whether someone still holds a memoryview of the receive buffer."""
+		try:
+			self._buffer.append(0)
+		except BufferError:
+			return True
+		self._buffer.pop()
+		return False
+
+	def pause_receiving(self) -> None:
+		"""Stop reading from the TCP stream (frames that have already been read stay buffered) and drop unreliable packets until resume_receiving is called."""
+		self._receiving_paused += 1
+		if self._receiving_paused == 1:
+			self._tcp.pause_reading()
+
+	def resume_receiving(self) -> None:
+		if not self._receiving_paused:
+			return
+		self._receiving_paused -= 1
+		if not self._receiving_paused:
+			self._tcp.resume_reading()
+			if not self._parsing:  # otherwise the loop in _parse_frames carries on by itself
+				self._parse_frames()
 
 	# UDP
 
 	def datagram_received(self, data: bytes):
+		if self._receiving_paused:
+			return
 		if data[0] == 0: # unreliable
-			self._dispatcher.dispatch(ConnectionEvent.Receive, data[1:], self)
+			self._receive(data[1:])
 		elif data[0] == 1: # unreliable sequenced
 			seq_num = c_uint._struct.unpack(data[1:5])[0]
 			if seq_num >= self._in_seq_num:
 				self._in_seq_num = seq_num
-				self._dispatcher.dispatch(ConnectionEvent.Receive, data[5:], self)
+				self._receive(data[5:])
 
 	def get_address(self) -> Address:
 		return self._remote_addr
@@ -70,7 +235,9 @@ class TCPUDPConnection(Connection, asyncio.Protocol):
 		self._dispatcher.dispatch(ConnectionEvent.Close, self)
 		if self._remote_addr in self._transport._conns:
 			del self._transport._conns[self._remote_addr]
+		self._flush()
 		self._tcp.close()
+		self._close_receive_queue()
 
 	def _send(self, data: bytes, reliability: Reliability) -> None:
 		if reliability == Reliability.Unreliable:
@@ -80,20 +247,37 @@ class TCPUDPConnection(Connection, asyncio.Protocol):
 			self._out_seq_num = (self._out_seq_num + 1) & 0xff_ff_ff_ff
 			seq_num = c_uint._struct.pack(seq_num)[0]
 			self._transport.udp.sendto(b"\1"+data, self._remote_addr)
+		elif self._compressor is not None and len(data) >= self._compression.threshold:
+			self._write_frame(COMPRESSED, self._compressor.compress(data))
 		else:
-			self._tcp.write(c_uint._struct.pack(len(data)))
-			self._tcp.write(data)
+			self._write_frame(0, data)
+
+	def _write_frame(self, flags: int, data: bytes) -> None:
+		if not self._out_frames:
+			asyncio.get_event_loop().call_soon(self._flush)
+		self._out_frames.append(c_uint._struct.pack(flags | len(data)))
+		self._out_frames.append(data)
+
+	def _flush(self) -> None:
+		if not self._out_frames:
+			return
+		frames = self._out_frames
+		self._out_frames = []
+		if not self._tcp.is_closing():
+			self._tcp.writelines(frames)
 
 class TCPUDPTransport(asyncio.DatagramProtocol):
-	def __init__(self, listen_addr: Address, max_connections: int, dispatcher: EventDispatcher, ssl: Optional[SSLContext]):
+	def __init__(self, listen_addr: Address, max_connections: int, dispatcher: EventDispatcher, ssl: Optional[SSLContext], compression: Optional[Compression]=None):
+		"""If compression settings are given, clients can ask for their reliable frames to be compressed, see the compression module."""
 		self._dispatcher = dispatcher
 		self._conns = {}
+		self._compression = compression
 		asyncio.ensure_future(self._init_network(listen_addr, ssl))
 
 	async def _init_network(self, listen_addr, ssl):
 		host, port = listen_addr
 		loop = asyncio.get_event_loop()
-		server = await loop.create_server(lambda: TCPUDPConnection(self), host, port, ssl=ssl)
+		server = await loop.create_server(lambda: TCPUDPConnection(self, self._compression), host, port, ssl=ssl)
 		listen_addr = server.sockets[0].getsockname()
 		await loop.create_datagram_endpoint(lambda: self, local_addr=listen_addr)
 		self._dispatcher.dispatch(TransportEvent.NetworkInit, ConnectionType.TcpUdp, listen_addr)